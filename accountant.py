@@ -1,59 +1,217 @@
+import copy
 import logging
-from functools import cmp_to_key
+from array import array
+from datetime import timedelta
 
 from constants import TRANSACTION_BUY, TRANSACTION_SELL
+from lot_book import make_lot_book
+from lot_store import LotStore
 
 logger = logging.getLogger()
 
+# a lot is long term on a date once it is at least this old, see is_long_term
+LONG_TERM_AGE = timedelta(days=366)
+# what is left of a sell or a lot below this is rounding, from quantities in
+# base shares after a split, see corporate_actions.SplitAdjustment
+QUANTITY_TOLERANCE = 1e-9
+
 
 class Accountant:
-    def __init__(self, tax_method_name, tax_method_comparator):
-        self.tax_method_name = tax_method_name
-        self.tax_method_comparator = tax_method_comparator
-        self.unsold_transactions = []
+    # a ledger.LedgerWriter that gets every lot sold, see sell
+    ledger = None
+    # a wash_sale.WashSales that defers the losses of wash sales, see sell and
+    # add_lot
+    wash_sales = None
+
+    def __init__(self, tax_method, lot_store=None):
+        self.tax_method = tax_method
+        self.tax_method_name = tax_method.name
+        self.lot_store = LotStore() if lot_store is None else lot_store
+        self.remaining_quantity = array("d")
+        self.unsold_transactions = make_lot_book(
+            tax_method, self.lot_store, self.remaining_quantity
+        )
         self.short_term_profit_accumulator = 0
         self.long_term_profit_accumulator = 0
+        # tax year -> [short term, long term] profit realized in it
+        self.profits_by_year = {}
 
     def account_for_transaction(self, transaction):
         if transaction.transaction_type == TRANSACTION_BUY:
-            self.unsold_transactions.append(transaction)
+            self.add_lot(self.lot_store.add(transaction))
         elif transaction.transaction_type == TRANSACTION_SELL:
-            tax_method_cmp = lambda x, y: self.tax_method_comparator(
-                x, y, transaction.cost_basis, transaction.datetime
-            )
-            self.unsold_transactions = sorted(
-                self.unsold_transactions, key=cmp_to_key(tax_method_cmp)
-            )
-            volume_left = transaction.transaction_size
-            while volume_left > 0:
-                transaction_to_sell = self.unsold_transactions.pop(0)
-                volume = min(transaction_to_sell.transaction_size, volume_left)
-                profit_accumulator = (
-                    transaction.cost_basis - transaction_to_sell.cost_basis
-                ) * volume
-                if self.is_long_term(transaction_to_sell.datetime, transaction.datetime):
-                    self.long_term_profit_accumulator += profit_accumulator
-                else:
-                    self.short_term_profit_accumulator += profit_accumulator
-                if volume < transaction_to_sell.transaction_size:
-                    transaction_to_sell.transaction_size -= volume
-                    self.unsold_transactions.append(transaction_to_sell)
-                volume_left -= volume
+            self.sell(transaction)
         else:
             logger.warning(
                 f"Unknown transaction type passed: {transaction.transaction_type}"
             )
 
-    def sell_all_transactions(self, current_price, current_datetime):
-        for transaction in self.unsold_transactions:
-            profit_accumulator = (
-                current_price - transaction.cost_basis
-            ) * transaction.transaction_size
-            if self.is_long_term(transaction.datetime, current_datetime):
+    # lot_id must already be in this accountant's lot store
+    def add_lot(self, lot_id):
+        if self.wash_sales is not None:
+            self.wash_sales.add_buy(self, lot_id)
+            return
+        self.insert_lot(lot_id, self.lot_store.quantity[lot_id])
+
+    # puts `quantity` shares of lot_id in the lot book
+    def insert_lot(self, lot_id, quantity):
+        remaining_quantity = self.remaining_quantity
+        missing_lots = lot_id + 1 - len(remaining_quantity)
+        if missing_lots > 0:
+            remaining_quantity.extend([0.0] * missing_lots)
+        remaining_quantity[lot_id] = quantity
+        self.unsold_transactions.add(lot_id)
+
+    def sell(self, transaction):
+        lot_book = self.unsold_transactions
+        remaining_quantity = self.remaining_quantity
+        cost_basis = self.lot_store.cost_basis
+        lot_datetime = self.lot_store.datetime
+
+        ledger = self.ledger
+        wash_sales = self.wash_sales
+
+        lot_book.start_sell(transaction.cost_basis, transaction.datetime)
+        volume_left = transaction.transaction_size
+        short_term_profit = long_term_profit = 0
+        while volume_left > QUANTITY_TOLERANCE:
+            lot_id = lot_book.pop()
+            lot_size = remaining_quantity[lot_id]
+            if not lot_size:
+                # every share of it went to replacement lots, see wash_sale.py
+                continue
+            volume = min(lot_size, volume_left)
+            profit_accumulator = (transaction.cost_basis - cost_basis[lot_id]) * volume
+            long_term = self.is_long_term(lot_datetime[lot_id], transaction.datetime)
+            if long_term:
                 self.long_term_profit_accumulator += profit_accumulator
+                long_term_profit += profit_accumulator
             else:
                 self.short_term_profit_accumulator += profit_accumulator
-        self.unsold_transactions = []
+                short_term_profit += profit_accumulator
+            ledger_row = None
+            if ledger is not None:
+                ledger_row = [
+                    self.tax_method_name,
+                    transaction.datetime,
+                    lot_datetime[lot_id],
+                    volume,
+                    transaction.cost_basis * volume,
+                    cost_basis[lot_id] * volume,
+                    long_term,
+                ]
+                if wash_sales is None:
+                    ledger.write(*ledger_row)
+            if wash_sales is not None:
+                # writes the ledger row once its disallowed loss is known
+                wash_sales.add_disposal(
+                    lot_id,
+                    volume,
+                    transaction.cost_basis - cost_basis[lot_id],
+                    lot_datetime[lot_id],
+                    long_term,
+                    ledger_row,
+                )
+            if lot_size - volume > QUANTITY_TOLERANCE:
+                remaining_quantity[lot_id] = lot_size - volume
+                lot_book.add(lot_id)
+            else:
+                remaining_quantity[lot_id] = 0
+            volume_left -= volume
+        self.add_year_profits(
+            transaction.datetime.year, short_term_profit, long_term_profit
+        )
+        if wash_sales is not None:
+            wash_sales.finish_sell(self, transaction.datetime)
+
+    # only the per year buckets, the lifetime accumulators are kept by the caller
+    def add_year_profits(self, year, short_term_profit, long_term_profit):
+        year_profits = self.profits_by_year.get(year)
+        if year_profits is None:
+            year_profits = self.profits_by_year[year] = [0, 0]
+        year_profits[0] += short_term_profit
+        year_profits[1] += long_term_profit
+
+    # A copy that can go on selling without changing this one. The lot store is
+    # shared unless wash sales add lots to it. The copy's sells are not written
+    # to the ledger.
+    def fork(self):
+        accountant = copy.copy(self)
+        accountant.ledger = None
+        if self.wash_sales is not None:
+            accountant.wash_sales = self.wash_sales.copy()
+            # the replacement lots of the fork's wash sales go in a store of its
+            # own, the shared one only grows with the accounted transactions
+            accountant.lot_store = self.lot_store.copy()
+        accountant.profits_by_year = {
+            year: list(year_profits)
+            for year, year_profits in self.profits_by_year.items()
+        }
+        accountant.remaining_quantity = array("d", self.remaining_quantity)
+        accountant.unsold_transactions = self.unsold_transactions.copy(
+            accountant.remaining_quantity, accountant.lot_store
+        )
+        return accountant
+
+    def sell_all_transactions(self, current_price, current_datetime):
+        short_term_profit, long_term_profit = self.get_liquidation_profits(
+            current_price, current_datetime
+        )
+        self.add_year_profits(
+            current_datetime.year,
+            short_term_profit - self.short_term_profit_accumulator,
+            long_term_profit - self.long_term_profit_accumulator,
+        )
+        self.short_term_profit_accumulator = short_term_profit
+        self.long_term_profit_accumulator = long_term_profit
+        for lot_id in self.unsold_transactions:
+            self.remaining_quantity[lot_id] = 0
+        self.unsold_transactions.clear()
+
+    # short / long term profits if every unsold lot was sold now, without
+    # changing any state
+    def get_liquidation_profits(self, current_price, current_datetime):
+        cost_basis = self.lot_store.cost_basis
+        lot_datetime = self.lot_store.datetime
+        short_term_profit = self.short_term_profit_accumulator
+        long_term_profit = self.long_term_profit_accumulator
+        for lot_id in self.unsold_transactions:
+            profit_accumulator = (
+                current_price - cost_basis[lot_id]
+            ) * self.remaining_quantity[lot_id]
+            if self.is_long_term(lot_datetime[lot_id], current_datetime):
+                long_term_profit += profit_accumulator
+            else:
+                short_term_profit += profit_accumulator
+        return short_term_profit, long_term_profit
+
+    # get_liquidation_profits and the profits by tax year they add up to, the
+    # unrealized ones in the year of current_datetime
+    def get_liquidation_profits_by_year(self, current_price, current_datetime):
+        short_term_profit, long_term_profit = self.get_liquidation_profits(
+            current_price, current_datetime
+        )
+        profits_by_year = {
+            year: tuple(year_profits)
+            for year, year_profits in self.profits_by_year.items()
+        }
+        if current_datetime is not None:
+            realized_short_term, realized_long_term = profits_by_year.get(
+                current_datetime.year, (0, 0)
+            )
+            profits_by_year[current_datetime.year] = (
+                realized_short_term
+                + short_term_profit
+                - self.short_term_profit_accumulator,
+                realized_long_term
+                + long_term_profit
+                - self.long_term_profit_accumulator,
+            )
+        return short_term_profit, long_term_profit, profits_by_year
+
+    def get_unsold_lots(self):
+        for lot_id in self.unsold_transactions:
+            yield self.lot_store.lot(lot_id, self.remaining_quantity[lot_id])
 
     def get_profit(self):
         return self.short_term_profit_accumulator + self.long_term_profit_accumulator
@@ -0,0 +1,305 @@
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from constants import (
+    CAPTIAL_GAINS_TAX_RATE_KEY,
+    INCOME_TAX_RATE_KEY,
+    LAST_DATE_KEY,
+    LAST_PRICE_KEY,
+    TAX_TABLE_KEY,
+    TICKER_TO_TRACK_KEY,
+    TICKERS_TO_TRACK_KEY,
+)
+from corporate_actions import apply_corporate_actions
+from engine import run_tax_methods
+from parse import parse_config, parse_transactions, parse_transactions_by_ticker
+from taxes import calculate_tax_burden
+
+logger = logging.getLogger()
+
+MANIFEST_TRANSACTIONS_COLUMN = "transactions"
+MANIFEST_CONFIG_COLUMN = "config"
+MANIFEST_NAME_COLUMN = "name"
+
+# parsed configs by the digest of their file, set once per worker process
+configs = {}
+
+
+# One portfolio of the manifest
+class BatchJob:
+    def __init__(self, index, name, transactions_filepath, config_filepath):
+        self.index = index
+        self.name = name
+        self.transactions_filepath = transactions_filepath
+        self.config_filepath = config_filepath
+        self.config_key = None
+
+    def get_record(self):
+        return {
+            "index": self.index,
+            "name": self.name,
+            "transactions": self.transactions_filepath,
+            "config": self.config_filepath,
+        }
+
+
+# A CSV with a `transactions` and a `config` column and an optional `name`.
+# Relative paths are relative to the manifest.
+def read_manifest(manifest_filepath):
+    directory = os.path.dirname(os.path.abspath(manifest_filepath))
+    jobs = []
+    with open(manifest_filepath, newline="") as f:
+        for index, row in enumerate(csv.DictReader(f)):
+            transactions_filepath = os.path.join(
+                directory, row[MANIFEST_TRANSACTIONS_COLUMN]
+            )
+            config_filepath = os.path.join(directory, row[MANIFEST_CONFIG_COLUMN])
+            name = row.get(MANIFEST_NAME_COLUMN) or row[MANIFEST_TRANSACTIONS_COLUMN]
+            jobs.append(BatchJob(index, name, transactions_filepath, config_filepath))
+    return jobs
+
+
+# Parses every distinct config file once. Returns the parsed configs by digest
+# and the error of every config that could not be parsed, by digest too. Jobs
+# get the digest of their config as config_key. Paths in a config (the corporate
+# actions file) are relative to it, so the digest covers its directory as well.
+def load_configs(jobs):
+    digests = {}
+    loaded_configs = {}
+    errors = {}
+    for job in jobs:
+        config_filepath = os.path.abspath(job.config_filepath)
+        digest = digests.get(config_filepath)
+        if digest is None:
+            try:
+                with open(config_filepath, "rb") as f:
+                    digest = hashlib.sha256(
+                        os.path.dirname(config_filepath).encode() + b"\0" + f.read()
+                    ).hexdigest()
+            except OSError as e:
+                digest = f"unreadable:{config_filepath}"
+                errors[digest] = f"{type(e).__name__}: {e}"
+            digests[config_filepath] = digest
+        job.config_key = digest
+        if digest in loaded_configs or digest in errors:
+            continue
+        try:
+            loaded_configs[digest] = parse_config(config_filepath)
+        except Exception as e:
+            errors[digest] = f"{type(e).__name__}: {e}"
+    return loaded_configs, errors
+
+
+def set_configs(loaded_configs, log_level):
+    configs.clear()
+    configs.update(loaded_configs)
+    logger.setLevel(log_level)
+
+
+# The results of one portfolio, as JSON ready dicts per ticker. Runs in a worker.
+def run_job(transactions_filepath, config_key):
+    config = configs[config_key]
+    capital_gains_tax_rate = config[CAPTIAL_GAINS_TAX_RATE_KEY]
+    income_tax_rate = config[INCOME_TAX_RATE_KEY]
+    tax_table = config.get(TAX_TABLE_KEY)
+    ticker_to_track = config.get(TICKER_TO_TRACK_KEY)
+    tickers = config.get(TICKERS_TO_TRACK_KEY)
+    if tickers:
+        transactions_by_ticker = parse_transactions_by_ticker(
+            transactions_filepath, config, tickers
+        )
+    else:
+        transactions_by_ticker = {
+            ticker_to_track: parse_transactions(transactions_filepath, config)
+        }
+
+    tickers_results = []
+    for ticker, transactions in transactions_by_ticker.items():
+        if ticker == ticker_to_track:
+            last_price = config.get(LAST_PRICE_KEY)
+            last_datetime = config.get(LAST_DATE_KEY)
+        else:
+            last_price = last_datetime = None
+        transactions, last_price = apply_corporate_actions(
+            config, ticker, transactions, last_price, last_datetime
+        )
+        results = run_tax_methods(transactions, last_price, last_datetime)
+        tickers_results.append(
+            {
+                "ticker": ticker,
+                "results": [
+                    {
+                        "tax_method": result.tax_method_name,
+                        "current_profit": result.current_profit,
+                        "short_term_profit": result.short_term_profit,
+                        "long_term_profit": result.long_term_profit,
+                        "tax_burden": (
+                            calculate_tax_burden(
+                                result.short_term_profit,
+                                result.long_term_profit,
+                                capital_gains_tax_rate,
+                                income_tax_rate,
+                            )
+                            if tax_table is None
+                            else tax_table.calculate_tax_burden(result.profits_by_year)
+                        ),
+                    }
+                    for result in results
+                ],
+            }
+        )
+    return tickers_results
+
+
+# Same as run_job, but a failure becomes the error of the job's record
+def run_job_isolated(transactions_filepath, config_key):
+    try:
+        return {"status": "ok", "tickers": run_job(transactions_filepath, config_key)}
+    except Exception as e:
+        logger.debug(traceback.format_exc())
+        return {"status": "error", "error": f"{type(e).__name__}: {e}"}
+
+
+# Runs every job of the manifest and writes a JSON line per job to
+# `output_file` as soon as it is done (so in completion order, see "index").
+# `jobs` worker processes each get the parsed configs once, at most
+# 2 * `jobs` portfolios are queued at a time. Returns the number of failed jobs.
+def run_batch(batch_jobs, output_file, jobs=1, log_level=logging.WARNING):
+    loaded_configs, config_errors = load_configs(batch_jobs)
+    failures = 0
+
+    def write_record(batch_job, record):
+        nonlocal failures
+        if record["status"] != "ok":
+            failures += 1
+            logger.error(f"{batch_job.name} failed: {record['error']}")
+        output_file.write(json.dumps({**batch_job.get_record(), **record}) + "\n")
+        output_file.flush()
+
+    runnable_jobs = []
+    for batch_job in batch_jobs:
+        error = config_errors.get(batch_job.config_key)
+        if error is None:
+            runnable_jobs.append(batch_job)
+        else:
+            write_record(
+                batch_job, {"status": "error", "error": f"Bad config: {error}"}
+            )
+
+    if jobs <= 1:
+        previous_level = logger.level
+        set_configs(loaded_configs, log_level)
+        try:
+            for batch_job in runnable_jobs:
+                write_record(
+                    batch_job,
+                    run_job_isolated(
+                        batch_job.transactions_filepath, batch_job.config_key
+                    ),
+                )
+        finally:
+            logger.setLevel(previous_level)
+        return failures
+
+    queued = deque(runnable_jobs)
+    while queued:
+        suspects = deque(
+            run_pool(queued, jobs, 2 * jobs, loaded_configs, log_level, write_record)
+        )
+        # a worker running one of them died: run them one at a time, so only the
+        # job that crashed its worker fails
+        while suspects:
+            for batch_job in run_pool(
+                suspects, 1, 1, loaded_configs, log_level, write_record
+            ):
+                write_record(
+                    batch_job,
+                    {"status": "error", "error": "Worker crashed running the job"},
+                )
+    return failures
+
+
+# Runs the jobs of `queued` on `workers` processes with at most `max_pending`
+# submitted at a time, and writes their records as they are done. If a worker
+# dies the pool is broken: the jobs that were submitted and not done are
+# returned and the rest are left in `queued`.
+def run_pool(queued, workers, max_pending, loaded_configs, log_level, write_record):
+    pending = {}
+    suspects = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=set_configs,
+        initargs=(loaded_configs, log_level),
+    ) as executor:
+        while True:
+            try:
+                while queued and len(pending) < max_pending:
+                    batch_job = queued[0]
+                    future = executor.submit(
+                        run_job_isolated,
+                        batch_job.transactions_filepath,
+                        batch_job.config_key,
+                    )
+                    pending[future] = queued.popleft()
+            except BrokenProcessPool:
+                # the futures already submitted fail below
+                pass
+            if not pending:
+                return suspects
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch_job = pending.pop(future)
+                try:
+                    write_record(batch_job, future.result())
+                except BrokenProcessPool:
+                    suspects.append(batch_job)
+            if suspects:
+                # every other pending future fails with the pool
+                for future, batch_job in pending.items():
+                    try:
+                        write_record(batch_job, future.result())
+                    except BrokenProcessPool:
+                        suspects.append(batch_job)
+                return suspects
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="run main.py's tax methods over many portfolios"
+    )
+    parser.add_argument(
+        "manifest_path",
+        help="CSV with a transactions and a config column (and an optional name)",
+    )
+    parser.add_argument(
+        "-o", "--output", help="JSON lines results file, stdout by default"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="number of worker processes"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.WARNING,
+    )
+    batch_jobs = read_manifest(args.manifest_path)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            failures = run_batch(batch_jobs, output_file, args.jobs)
+    else:
+        failures = run_batch(batch_jobs, sys.stdout, args.jobs)
+    print(
+        f"{len(batch_jobs) - failures} of {len(batch_jobs)} jobs succeeded",
+        file=sys.stderr,
+    )
+    sys.exit(1 if failures else 0)
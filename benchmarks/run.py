@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from accountant import Accountant
+from benchmarks.workload import (
+    CONFIG,
+    Workload,
+    write_schwab_csvs,
+    write_transactions_csv,
+)
+from parse import parse_transactions
+from schwab import merge_schwab
+from tax_methods import tax_methods
+
+RESULTS_VERSION = 1
+
+WORKLOADS = {
+    "small": Workload(lots=10000, sells=3000),
+    "partial": Workload(lots=10000, sells=3000, partial_fill_ratio=1.0),
+    "whole": Workload(lots=10000, sells=3000, partial_fill_ratio=0.0),
+    "many-sells": Workload(lots=10000, sells=10000),
+    "large": Workload(lots=100000, sells=30000),
+    "tickers": Workload(lots=5000, sells=1500, tickers=20, other_rows=50000),
+}
+QUICK_WORKLOADS = ["small", "partial"]
+# merge_schwab reads its own Schwab exports, so it gets its own sizes
+MERGE_WORKLOADS = {
+    "merge-small": Workload(lots=1000, sells=500),
+    "merge-large": Workload(lots=5000, sells=2500),
+}
+QUICK_MERGE_WORKLOADS = ["merge-small"]
+
+
+# Runs `function` `repeat` times, calling `setup` (untimed) before each run with
+# its result as the argument. Returns the seconds of every run.
+def time_function(function, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        if setup:
+            function(argument)
+        else:
+            function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def make_result(name, workload_name, workload, timings):
+    return {
+        "name": name,
+        "workload": workload_name,
+        "parameters": workload.to_dict(),
+        "rows": workload.get_row_count(),
+        "repeat": len(timings),
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+    }
+
+
+def run_accountant(tax_method, transactions):
+    accountant = Accountant(tax_method)
+    for transaction in transactions:
+        accountant.account_for_transaction(transaction)
+    return accountant
+
+
+def benchmark_transactions(workload_name, workload, directory, repeat):
+    transactions_filepath = os.path.join(directory, f"{workload_name}.csv")
+    write_transactions_csv(transactions_filepath, workload)
+    results = [
+        make_result(
+            "parse_transactions",
+            workload_name,
+            workload,
+            time_function(
+                lambda: list(parse_transactions(transactions_filepath, dict(CONFIG))),
+                repeat,
+            ),
+        )
+    ]
+    transactions = list(parse_transactions(transactions_filepath, dict(CONFIG)))
+    last_datetime = transactions[-1].datetime if transactions else None
+    for tax_method in tax_methods:
+        results.append(
+            make_result(
+                f"accountant[{tax_method.name}]",
+                workload_name,
+                workload,
+                time_function(lambda: run_accountant(tax_method, transactions), repeat),
+            )
+        )
+        results.append(
+            make_result(
+                f"sell_all_transactions[{tax_method.name}]",
+                workload_name,
+                workload,
+                time_function(
+                    lambda accountant: accountant.sell_all_transactions(
+                        15.0, last_datetime
+                    ),
+                    repeat,
+                    setup=lambda: run_accountant(tax_method, transactions),
+                ),
+            )
+        )
+    return results
+
+
+def benchmark_merge(workload_name, workload, directory, repeat):
+    transactions_filepath = os.path.join(directory, f"{workload_name}-schwab.csv")
+    equity_filepath = os.path.join(directory, f"{workload_name}-equity.csv")
+    output_filepath = os.path.join(directory, f"{workload_name}-merged.csv")
+    write_schwab_csvs(transactions_filepath, equity_filepath, workload)
+
+    def merge():
+        merge_schwab.main(transactions_filepath, equity_filepath, output_filepath)
+
+    return [
+        make_result(
+            "merge_schwab", workload_name, workload, time_function(merge, repeat)
+        )
+    ]
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(workload_names, merge_workload_names, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for workload_name in workload_names:
+            results += benchmark_transactions(
+                workload_name, WORKLOADS[workload_name], directory, repeat
+            )
+        for workload_name in merge_workload_names:
+            results += benchmark_merge(
+                workload_name, MERGE_WORKLOADS[workload_name], directory, repeat
+            )
+    return {
+        "version": RESULTS_VERSION,
+        "git_commit": get_git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+# Median time of every benchmark against a previous results file, slower than
+# `threshold` times the old median is flagged. Returns the number flagged.
+def compare_results(old_results, new_results, threshold=1.2):
+    old_medians = {
+        (result["name"], result["workload"]): result["median"]
+        for result in old_results["results"]
+    }
+    rows = []
+    regressions = 0
+    for result in new_results["results"]:
+        old_median = old_medians.get((result["name"], result["workload"]))
+        if old_median is None:
+            continue
+        ratio = result["median"] / old_median if old_median else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "slower"
+            regressions += 1
+        rows.append(
+            f"{result['name']:40} {result['workload']:12} {old_median:10.4f}s "
+            f"{result['median']:10.4f}s {ratio:6.2f}x {flag}"
+        )
+    # stdout may be taken by the results JSON
+    for row in rows:
+        print(row, file=sys.stderr)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="time parsing, accounting and the Schwab merge on synthetic data"
+    )
+    parser.add_argument("-o", "--output", help="write the results as JSON to this file")
+    parser.add_argument(
+        "--compare", help="results JSON of an earlier run to compare against"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--quick", action="store_true", help="only run the smaller workloads"
+    )
+    parser.add_argument(
+        "--workload",
+        action="append",
+        choices=list(WORKLOADS) + list(MERGE_WORKLOADS),
+        help="run only this workload, can be given more than once",
+    )
+    args = parser.parse_args()
+
+    if args.workload:
+        workload_names = [name for name in args.workload if name in WORKLOADS]
+        merge_workload_names = [
+            name for name in args.workload if name in MERGE_WORKLOADS
+        ]
+    elif args.quick:
+        workload_names = QUICK_WORKLOADS
+        merge_workload_names = QUICK_MERGE_WORKLOADS
+    else:
+        workload_names = list(WORKLOADS)
+        merge_workload_names = list(MERGE_WORKLOADS)
+
+    results = run_benchmarks(workload_names, merge_workload_names, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), results)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,234 @@
+import csv
+import random
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+
+TRACKED_TICKER = "TICK"
+LOT_SIZE = 10
+START_DATETIME = datetime(2016, 1, 4)
+START_PRICE = 20.0
+
+# same columns as a brokerage export, see config.example.yaml
+TRANSACTIONS_FIELDNAMES = [
+    "Date",
+    "Action",
+    "Symbol",
+    "Description",
+    "Quantity",
+    "Price",
+    "Fees & Comm",
+    "Amount",
+]
+BUY_ACTION = "Stock Plan Activity"
+SELL_ACTION = "Sell"
+OTHER_ACTIONS = ["Cash Dividend", "Journal", "Qualified Dividend"]
+
+# the columns of a Schwab equity awards export that schwab/merge_schwab.py reads
+EQUITY_FIELDNAMES = [
+    "Date",
+    "Action",
+    "Symbol",
+    "Quantity",
+    "AwardDate",
+    "FairMarketValuePrice",
+    "SharesSoldWithheldForTaxes",
+    "NetSharesDeposited",
+]
+
+CONFIG = {
+    "date_column": "Date",
+    "date_format": "%m/%d/%Y",
+    "ticker_column": "Symbol",
+    "ticker_to_track": TRACKED_TICKER,
+    "quanitity_column": "Quantity",
+    "security_price_column": "Price",
+    "transaction_type_column": "Action",
+    "transaction_buy_values": [BUY_ACTION],
+    "transaction_sell_values": [SELL_ACTION],
+    "capital_gains_tax_rate": 15,
+    "income_tax_rate": 22,
+}
+
+
+# Shape of a synthetic transactions file. Every ticker gets `lots` buys of
+# LOT_SIZE shares and `sells` sells, `other_rows` rows of actions that are
+# neither. A partial fill sells a quantity that is not a whole number of lots,
+# so it splits one whatever the tax method.
+@dataclass
+class Workload:
+    lots: int
+    sells: int
+    tickers: int = 1
+    other_rows: int = 0
+    partial_fill_ratio: float = 0.5
+    seed: int = 0
+
+    def get_row_count(self):
+        return self.tickers * (self.lots + self.sells) + self.other_rows
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def get_tickers(workload):
+    return [TRACKED_TICKER] + [f"OT{index:02d}" for index in range(1, workload.tickers)]
+
+
+# (datetime, action, quantity, price) of one ticker, in date order
+def generate_ticker_rows(workload, generator):
+    rows = []
+    current_datetime = START_DATETIME
+    price = START_PRICE
+    lots_left = workload.lots
+    sells_left = workload.sells
+    shares_held = 0
+    lots_per_sell = max(1, workload.lots // max(workload.sells, 1))
+    while lots_left or (sells_left and shares_held):
+        current_datetime += timedelta(days=generator.choice([0, 1, 1, 2, 7]))
+        price = round(max(0.5, price * (1 + generator.gauss(0.0005, 0.03))), 2)
+        sell = shares_held and (
+            not lots_left or generator.random() * (lots_left + sells_left) < sells_left
+        )
+        if not sell:
+            rows.append((current_datetime, BUY_ACTION, LOT_SIZE, price))
+            shares_held += LOT_SIZE
+            lots_left -= 1
+            continue
+        whole_lots = min(generator.randint(1, lots_per_sell), shares_held // LOT_SIZE)
+        quantity = whole_lots * LOT_SIZE
+        if quantity == 0:
+            quantity = shares_held
+        elif generator.random() < workload.partial_fill_ratio:
+            quantity -= generator.randint(1, LOT_SIZE - 1)
+        rows.append((current_datetime, SELL_ACTION, quantity, price))
+        shares_held -= quantity
+        sells_left -= 1
+    return rows
+
+
+def generate_rows(workload):
+    generator = random.Random(workload.seed)
+    rows = []
+    for ticker in get_tickers(workload):
+        rows.extend(
+            (row_datetime, action, ticker, quantity, price)
+            for row_datetime, action, quantity, price in generate_ticker_rows(
+                workload, generator
+            )
+        )
+    last_datetime = max((row[0] for row in rows), default=START_DATETIME)
+    days = (last_datetime - START_DATETIME).days
+    for _ in range(workload.other_rows):
+        rows.append(
+            (
+                START_DATETIME + timedelta(days=generator.randint(0, days)),
+                generator.choice(OTHER_ACTIONS),
+                generator.choice(get_tickers(workload)),
+                1,
+                round(generator.uniform(0.1, 2), 2),
+            )
+        )
+    # stable, so each ticker keeps its own order within a day
+    rows.sort(key=lambda row: row[0])
+    return rows
+
+
+# Writes the workload as a brokerage style CSV that CONFIG (and
+# config.example.yaml) parses, oldest row first
+def write_transactions_csv(filepath, workload):
+    with open(filepath, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(TRANSACTIONS_FIELDNAMES)
+        for row_datetime, action, ticker, quantity, price in generate_rows(workload):
+            writer.writerow(
+                [
+                    row_datetime.strftime("%m/%d/%Y"),
+                    action,
+                    ticker,
+                    "desc",
+                    quantity,
+                    f"${price}",
+                    "",
+                    f"${quantity * price:.2f}",
+                ]
+            )
+
+
+# Writes the two Schwab exports schwab/merge_schwab.py takes for the tracked
+# ticker: an equity awards file with a vest (and the shares withheld for taxes)
+# per lot, one a month, and a newest first transactions file with the deposits,
+# the tax sells, the sells and a Cancel Sell for some of them.
+def write_schwab_csvs(
+    transactions_filepath, equity_filepath, workload, cancel_ratio=0.05
+):
+    generator = random.Random(workload.seed)
+    rows = generate_ticker_rows(workload, generator)
+    equity_rows = []
+    transaction_rows = []
+    vest_datetime = START_DATETIME - timedelta(days=31)
+    row_datetime = vest_datetime
+    for _, action, quantity, price in rows:
+        if action == SELL_ACTION:
+            row_datetime += timedelta(days=1)
+            amount = f"${quantity * price:.2f}"
+            sell_row = [row_datetime, SELL_ACTION, quantity, f"${price}", amount]
+            transaction_rows.append(sell_row)
+            if generator.random() < cancel_ratio:
+                # sold again, the cancel sits between the two sells
+                transaction_rows.append(
+                    [row_datetime, "Cancel Sell", quantity, f"${price}", f"-{amount}"]
+                )
+                transaction_rows.append(sell_row)
+            continue
+        # vests are at least a month apart so the vesting price of a month is
+        # unique
+        vest_datetime = max(vest_datetime + timedelta(days=31), row_datetime)
+        row_datetime = vest_datetime
+        withheld = generator.randint(1, 4)
+        equity_rows.append(
+            [
+                vest_datetime.strftime("%m/%d/%Y"),
+                "Lapse",
+                TRACKED_TICKER,
+                quantity + withheld,
+                "",
+                "",
+                "",
+                "",
+            ]
+        )
+        equity_rows.append(
+            [
+                "",
+                "",
+                "",
+                "",
+                START_DATETIME.strftime("%m/%d/%Y"),
+                f"${price}",
+                withheld,
+                quantity,
+            ]
+        )
+        for deposit_action, deposit_quantity in [
+            (BUY_ACTION, quantity),
+            (BUY_ACTION, withheld),
+            (SELL_ACTION, withheld),
+        ]:
+            transaction_rows.append(
+                [vest_datetime, deposit_action, deposit_quantity, "", ""]
+            )
+
+    with open(equity_filepath, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(EQUITY_FIELDNAMES)
+        writer.writerows(equity_rows)
+    with open(transactions_filepath, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(TRANSACTIONS_FIELDNAMES)
+        for row_datetime, action, quantity, price, amount in reversed(transaction_rows):
+            date = row_datetime.strftime("%m/%d/%Y")
+            if action == SELL_ACTION and generator.random() < 0.1:
+                date = f"{date} as of {date}"
+            writer.writerow(
+                [date, action, TRACKED_TICKER, "desc", quantity, price, "", amount]
+            )
@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import os
+import pickle
+from dataclasses import dataclass, field
+
+from constants import TICKER_TO_TRACK_KEY
+from engine import AccountingEngine
+from parse import ParsePosition, get_parsing_config, parse_transactions
+from tax_methods import tax_methods as default_tax_methods
+
+logger = logging.getLogger()
+
+CHECKPOINT_VERSION = 2
+HASH_BLOCK_SIZE = 1 << 20
+
+
+# Everything needed to carry on accounting for an append-only transactions
+# file: the engine after the rows before `position`, and a fingerprint of the
+# file and config it was built from.
+@dataclass
+class Checkpoint:
+    fingerprint: dict
+    position: ParsePosition
+    engine: AccountingEngine
+    version: int = field(default=CHECKPOINT_VERSION)
+
+
+# Same engine as running parse_transactions through an AccountingEngine, but
+# only the rows appended since checkpoint_filepath was written are parsed. When
+# anything before them changed the whole file is replayed. The checkpoint is
+# then updated to the end of the file. `stats` times the parsing and is attached
+# to the engine while it runs, see AccountingEngine.attach_stats.
+def run_checkpointed(
+    transactions_filepath, config, checkpoint_filepath, tax_methods=None, stats=None
+):
+    if tax_methods is None:
+        tax_methods = default_tax_methods
+    checkpoint = read_checkpoint(checkpoint_filepath)
+    if checkpoint is not None and can_resume(
+        checkpoint, transactions_filepath, config, tax_methods
+    ):
+        logger.info(
+            f"Resuming from checkpoint {checkpoint_filepath} after line "
+            f"{checkpoint.position.line_number}"
+        )
+        engine = checkpoint.engine
+        position = checkpoint.position
+    else:
+        if checkpoint is not None:
+            logger.info(
+                f"Checkpoint {checkpoint_filepath} does not match the transactions, "
+                "replaying the whole file"
+            )
+        engine = AccountingEngine(tax_methods)
+        position = ParsePosition()
+
+    transactions = parse_transactions(transactions_filepath, config, position)
+    if stats is None:
+        engine.account_for_transactions(transactions)
+    else:
+        engine.attach_stats(stats)
+        engine.account_for_transactions(stats.timed_iter(transactions, "parsing"))
+        engine.detach_stats()
+
+    # a row on an unterminated last line was accounted for but is not behind the
+    # position, resuming would count it twice
+    if position.offset != os.path.getsize(transactions_filepath):
+        logger.warning(
+            f"Not saving checkpoint, the last line of {transactions_filepath} "
+            "does not end with a newline"
+        )
+        return engine
+    write_checkpoint(
+        checkpoint_filepath,
+        Checkpoint(
+            get_fingerprint(transactions_filepath, config, tax_methods, position),
+            position,
+            engine,
+        ),
+    )
+    return engine
+
+
+def can_resume(checkpoint, transactions_filepath, config, tax_methods):
+    if checkpoint.version != CHECKPOINT_VERSION:
+        return False
+    if os.path.getsize(transactions_filepath) < checkpoint.position.offset:
+        return False
+    fingerprint = get_fingerprint(
+        transactions_filepath, config, tax_methods, checkpoint.position
+    )
+    return fingerprint == checkpoint.fingerprint
+
+
+# The rows before position are unchanged as long as the bytes before it are
+def get_fingerprint(transactions_filepath, config, tax_methods, position):
+    return {
+        "path": os.path.abspath(transactions_filepath),
+        "config": get_parsing_config(config),
+        "ticker": config.get(TICKER_TO_TRACK_KEY),
+        "tax_methods": [tax_method.name for tax_method in tax_methods],
+        "sha256": hash_prefix(transactions_filepath, position.offset),
+    }
+
+
+def hash_prefix(filepath, length):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        while length > 0:
+            block = f.read(min(length, HASH_BLOCK_SIZE))
+            if not block:
+                break
+            digest.update(block)
+            length -= len(block)
+    return digest.hexdigest()
+
+
+def read_checkpoint(checkpoint_filepath):
+    try:
+        with open(checkpoint_filepath, "rb") as f:
+            checkpoint = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, AttributeError, pickle.UnpicklingError) as e:
+        logger.warning(f"Ignoring unreadable checkpoint {checkpoint_filepath}: {e}")
+        return None
+    if not isinstance(checkpoint, Checkpoint):
+        logger.warning(f"Ignoring unreadable checkpoint {checkpoint_filepath}")
+        return None
+    return checkpoint
+
+
+def write_checkpoint(checkpoint_filepath, checkpoint):
+    os.makedirs(os.path.dirname(checkpoint_filepath) or ".", exist_ok=True)
+    temporary_filepath = f"{checkpoint_filepath}.{os.getpid()}.tmp"
+    with open(temporary_filepath, "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_filepath, checkpoint_filepath)
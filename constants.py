@@ -1,17 +1,27 @@
 TRANSACTION_BUY = "BUY"
 TRANSACTION_SELL = "SELL"
+# a split row of the CSV, see corporate_actions.SplitAdjustment
+TRANSACTION_SPLIT = "SPLIT"
 
 # CONFIG
 DATE_COLUMN_KEY = "date_column"
 DATE_FORMAT_KEY = "date_format"
 TICKER_COLUMN_KEY = "ticker_column"
 TICKER_TO_TRACK_KEY = "ticker_to_track"
+TICKERS_TO_TRACK_KEY = "tickers_to_track"
+TRANSACTION_PARSER_KEY = "_transaction_parser"
 QUANTITY_COLUMN_KEY = "quanitity_column"
 SECURITY_PRICE_COLUMN_KEY = "security_price_column"
 TRANSACTION_TYPE_KEY = "transaction_type_column"
 TRANSACTION_BUY_VALUE = "transaction_buy_values"
 TRANSACTION_SELL_VALUE = "transaction_sell_values"
+TRANSACTION_SPLIT_VALUE = "transaction_split_values"
+CORPORATE_ACTIONS_FILE_KEY = "corporate_actions_file"
+CORPORATE_ACTIONS_KEY = "_corporate_actions"
 LAST_DATE_KEY = "last_date"
 LAST_PRICE_KEY = "last_price"
 CAPTIAL_GAINS_TAX_RATE_KEY = "capital_gains_tax_rate"
 INCOME_TAX_RATE_KEY = "income_tax_rate"
+TAX_YEARS_KEY = "tax_years"
+CAPITAL_LOSS_LIMIT_KEY = "capital_loss_limit"
+TAX_TABLE_KEY = "_tax_table"
@@ -0,0 +1,224 @@
+import csv
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from fractions import Fraction
+from operator import itemgetter
+
+from constants import (
+    CORPORATE_ACTIONS_KEY,
+    TRANSACTION_BUY,
+    TRANSACTION_SPLIT,
+    TRANSACTION_SPLIT_VALUE,
+)
+from transaction import Transaction
+
+logger = logging.getLogger()
+
+CORPORATE_ACTION_SPLIT = "split"
+CORPORATE_ACTION_TICKER_CHANGE = "ticker_change"
+# the ratio of a split row of the CSV is worked out from the shares it added,
+# rounded to a fraction with at most this denominator
+MAX_SPLIT_RATIO_DENOMINATOR = 1000
+
+
+@dataclass
+class Split:
+    datetime: datetime
+    ticker: str
+    # shares after the split per share before it, 1/10 for a 1:10 reverse split
+    ratio: Fraction
+
+
+@dataclass
+class TickerChange:
+    datetime: datetime
+    old_ticker: str
+    new_ticker: str
+
+
+@dataclass
+class CorporateActions:
+    splits: list
+    ticker_changes: list
+    # the file they were read from, see read_corporate_actions
+    filepath: str = None
+
+    # every old ticker -> the ticker it goes by in the end
+    def get_ticker_aliases(self):
+        renames = {}
+        for ticker_change in sorted(
+            self.ticker_changes, key=lambda ticker_change: ticker_change.datetime
+        ):
+            renames[ticker_change.old_ticker] = ticker_change.new_ticker
+        aliases = {}
+        for old_ticker in renames:
+            ticker = old_ticker
+            seen = {ticker}
+            while ticker in renames and renames[ticker] not in seen:
+                ticker = renames[ticker]
+                seen.add(ticker)
+            if ticker != old_ticker:
+                aliases[old_ticker] = ticker
+        return aliases
+
+    # (datetime, ratio) of the splits of `ticker`, under any of its names
+    def get_splits(self, ticker):
+        aliases = self.get_ticker_aliases()
+        return [
+            (split.datetime, split.ratio)
+            for split in self.splits
+            if aliases.get(split.ticker, split.ticker) == ticker
+        ]
+
+
+# "4:1" (new:old shares), "1:10" for a reverse split, or a plain number of new
+# shares per old one
+def parse_split_ratio(value):
+    new_shares, _, old_shares = value.partition(":")
+    ratio = Fraction(new_shares.strip()) / Fraction(old_shares.strip() or 1)
+    if ratio <= 0:
+        raise ValueError(f"Split ratio must be positive: {value}")
+    return ratio
+
+
+# A CSV with date (YYYY/MM/DD), ticker, action and value columns, a row per
+# corporate action. "split" rows have the ratio as value, see parse_split_ratio,
+# "ticker_change" rows the new ticker.
+def read_corporate_actions(filepath):
+    splits = []
+    ticker_changes = []
+    with open(filepath, newline="") as f:
+        for line_number, row in enumerate(csv.DictReader(f), 2):
+            try:
+                action_datetime = datetime.strptime(row["date"].strip(), "%Y/%m/%d")
+                action = row["action"].strip().lower()
+                ticker = row["ticker"].strip()
+                value = row["value"].strip()
+                if action == CORPORATE_ACTION_SPLIT:
+                    splits.append(
+                        Split(action_datetime, ticker, parse_split_ratio(value))
+                    )
+                elif action == CORPORATE_ACTION_TICKER_CHANGE:
+                    ticker_changes.append(TickerChange(action_datetime, ticker, value))
+                else:
+                    raise ValueError(f"Unknown corporate action: {action}")
+            except (KeyError, AttributeError, ValueError, ZeroDivisionError) as e:
+                raise ValueError(
+                    f"Bad corporate action on line {line_number} of {filepath}: {e}"
+                ) from e
+    return CorporateActions(splits, ticker_changes, filepath)
+
+
+# Keeps the lots of one ticker in base shares (shares from before its first
+# split) so that a split only multiplies a cumulative factor, the shares now per
+# base share, instead of rewriting the open lots of every accountant.
+#
+# adjust converts each transaction once as it goes by (quantity / factor, price
+# * factor), so the lot books, profits and liquidations work unchanged on base
+# shares and the factor only comes back where a price or a quantity crosses into
+# or out of the accounting: the last price, sweep prices, scheduled sells and
+# ledger quantities, see to_base_price, to_base_quantity and to_shares.
+class SplitAdjustment:
+    def __init__(self, splits=()):
+        # (datetime, ratio) of the splits still to come, oldest first
+        self.splits = deque(sorted(splits, key=itemgetter(0)))
+        self.factor = Fraction(1)
+        self.float_factor = 1.0
+        self.split_count = 0
+        # base shares held, to work out the ratio of a split row of the CSV
+        self.shares_held = 0
+
+    # Yields `transactions` in base shares. A split applies to the transactions
+    # on and after its date, split rows are applied in place and not yielded.
+    def adjust(self, transactions):
+        splits = self.splits
+        for transaction in transactions:
+            while splits and splits[0][0] <= transaction.datetime:
+                self.split(splits.popleft()[1])
+            if transaction.transaction_type == TRANSACTION_SPLIT:
+                self.split_shares(transaction)
+                continue
+            if self.split_count:
+                transaction = Transaction(
+                    transaction.transaction_size / self.float_factor,
+                    transaction.cost_basis * self.float_factor,
+                    transaction.datetime,
+                    transaction.transaction_type,
+                )
+            if transaction.transaction_type == TRANSACTION_BUY:
+                self.shares_held += transaction.transaction_size
+            else:
+                self.shares_held -= transaction.transaction_size
+            yield transaction
+
+    def split(self, ratio):
+        self.factor *= ratio
+        self.float_factor = float(self.factor)
+        self.split_count += 1
+
+    # a split row of the CSV has the shares the split added (or took away, for
+    # a reverse split) as its quantity
+    def split_shares(self, transaction):
+        shares_held = self.shares_held * self.float_factor
+        if shares_held <= 0:
+            logger.warning(
+                f"Ignoring the split on {transaction.datetime}, no shares are held"
+            )
+            return
+        ratio = Fraction(
+            (shares_held + transaction.transaction_size) / shares_held
+        ).limit_denominator(MAX_SPLIT_RATIO_DENOMINATOR)
+        if ratio <= 0:
+            logger.warning(
+                f"Ignoring the split on {transaction.datetime}, it takes away "
+                "more shares than are held"
+            )
+            return
+        self.split(ratio)
+
+    # the factor on `current_datetime`, with the splits up to then that came
+    # after the last transaction
+    def get_factor(self, current_datetime=None):
+        factor = self.factor
+        if current_datetime is not None:
+            for split_datetime, ratio in self.splits:
+                if split_datetime > current_datetime:
+                    break
+                factor *= ratio
+        return float(factor)
+
+    def to_base_price(self, price, current_datetime=None):
+        if price is None:
+            return None
+        return price * self.get_factor(current_datetime)
+
+    def to_base_quantity(self, quantity, current_datetime=None):
+        return quantity / self.get_factor(current_datetime)
+
+    # base shares in the shares of the transaction being accounted for
+    def to_shares(self, quantity):
+        return quantity * self.float_factor
+
+
+# The SplitAdjustment of `ticker`, None when the config has no corporate actions
+def get_split_adjustment(config, ticker):
+    corporate_actions = config.get(CORPORATE_ACTIONS_KEY)
+    if corporate_actions is None:
+        if not config.get(TRANSACTION_SPLIT_VALUE):
+            return None
+        return SplitAdjustment()
+    return SplitAdjustment(corporate_actions.get_splits(ticker))
+
+
+# `transactions` of `ticker` in base shares, as a list, and last_price to match,
+# for the callers that hold the whole history anyway
+def apply_corporate_actions(
+    config, ticker, transactions, last_price=None, last_datetime=None
+):
+    split_adjustment = get_split_adjustment(config, ticker)
+    if split_adjustment is None:
+        return transactions, last_price
+    transactions = list(split_adjustment.adjust(transactions))
+    return transactions, split_adjustment.to_base_price(last_price, last_datetime)
@@ -0,0 +1,330 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import socket
+import socketserver
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from constants import (
+    CAPTIAL_GAINS_TAX_RATE_KEY,
+    CAPITAL_LOSS_LIMIT_KEY,
+    INCOME_TAX_RATE_KEY,
+    TAX_TABLE_KEY,
+    TICKER_TO_TRACK_KEY,
+    TRANSACTION_SELL,
+)
+from checkpoint import hash_prefix
+from corporate_actions import get_split_adjustment
+from engine import AccountingEngine
+from parse import ParsePosition, parse_config, parse_transactions
+from tax_methods import tax_methods as default_tax_methods
+from taxes import TaxTable, get_flat_tax_year
+from transaction import Transaction
+
+logger = logging.getLogger()
+
+DEFAULT_PORT = 8765
+
+
+# Takes the place of the ledger of a forked accountant, keeps the lots its sell
+# would dispose of
+class SellPreview:
+    def __init__(self, share_factor=1):
+        # base shares to shares, see corporate_actions.SplitAdjustment
+        self.share_factor = share_factor
+        self.lots = []
+
+    def write(
+        self,
+        tax_method_name,
+        sell_datetime,
+        acquisition_datetime,
+        quantity,
+        proceeds,
+        cost_basis,
+        long_term,
+    ):
+        self.lots.append(
+            {
+                "acquisition_date": acquisition_datetime.strftime("%Y-%m-%d"),
+                "quantity": quantity * self.share_factor,
+                "proceeds": proceeds,
+                "cost_basis": cost_basis,
+                "gain": proceeds - cost_basis,
+                "term": "long" if long_term else "short",
+            }
+        )
+
+
+# The transaction history of ticker_to_track accounted for once by every tax
+# method and kept in memory. Sells are previewed on forks of the accountants,
+# so the state itself only moves forward with the file: refresh accounts for
+# the rows appended since the last call, anything else replays the file. The
+# rows read so far are unchanged as long as the bytes before the parse
+# position are, their sha256 is kept up to date as rows are read and only
+# checked against the file when its size or mtime changed.
+class LotSelectionState:
+    def __init__(self, transactions_filepath, config_filepath, tax_methods=None):
+        self.transactions_filepath = transactions_filepath
+        self.config_filepath = config_filepath
+        self.tax_methods = default_tax_methods if tax_methods is None else tax_methods
+        self.reload()
+
+    # Parses the config again and replays the whole file
+    def reload(self):
+        self.config = parse_config(self.config_filepath)
+        self.tax_table = self.config.get(TAX_TABLE_KEY)
+        if self.tax_table is None:
+            self.tax_table = TaxTable(
+                default_tax_year=get_flat_tax_year(
+                    self.config[CAPTIAL_GAINS_TAX_RATE_KEY],
+                    self.config[INCOME_TAX_RATE_KEY],
+                    self.config.get(CAPITAL_LOSS_LIMIT_KEY),
+                ),
+                capital_loss_limit=self.config.get(CAPITAL_LOSS_LIMIT_KEY),
+            )
+        self.split_adjustment = get_split_adjustment(
+            self.config, self.config.get(TICKER_TO_TRACK_KEY)
+        )
+        self.engine = AccountingEngine(self.tax_methods)
+        self.position = ParsePosition()
+        self.prefix_hash = hashlib.sha256()
+        self.partial_row = False
+        self.account_for_new_rows(os.stat(self.transactions_filepath))
+
+    # Accounts for the rows appended to the file since the last call. Returns
+    # whether anything was read. A last line without a newline may still be
+    # being written, it is left for later.
+    def refresh(self):
+        file_stat = os.stat(self.transactions_filepath)
+        if (file_stat.st_size, file_stat.st_mtime_ns) == (
+            self.file_stat.st_size,
+            self.file_stat.st_mtime_ns,
+        ):
+            return False
+        if (
+            # the unterminated last row was accounted for but is not behind
+            # the position, any change to the file replays it
+            self.partial_row
+            or file_stat.st_size < self.position.offset
+            or hash_prefix(self.transactions_filepath, self.position.offset)
+            != self.prefix_hash.hexdigest()
+        ):
+            logger.info(
+                f"{self.transactions_filepath} changed before the rows read so "
+                "far, replaying it"
+            )
+            self.reload()
+            return True
+        if file_stat.st_size == self.position.offset:
+            self.file_stat = file_stat
+            return False
+        with open(self.transactions_filepath, "rb") as f:
+            f.seek(file_stat.st_size - 1)
+            if f.read(1) != b"\n":
+                # the prefix was checked, not again until the file changes
+                self.file_stat = file_stat
+                return False
+        self.account_for_new_rows(file_stat)
+        return True
+
+    def account_for_new_rows(self, file_stat):
+        offset = self.position.offset
+        transactions = parse_transactions(
+            self.transactions_filepath, self.config, self.position
+        )
+        if self.split_adjustment is not None:
+            transactions = self.split_adjustment.adjust(transactions)
+        self.engine.account_for_transactions(transactions)
+        self.file_stat = file_stat
+        self.partial_row = self.position.offset < file_stat.st_size
+        with open(self.transactions_filepath, "rb") as f:
+            f.seek(offset)
+            self.prefix_hash.update(f.read(self.position.offset - offset))
+
+    def get_shares_held(self):
+        shares_held = sum(self.engine.accountants[0].remaining_quantity)
+        if self.split_adjustment is not None:
+            shares_held = self.split_adjustment.to_shares(shares_held)
+        return shares_held
+
+    def get_status(self):
+        last_datetime = self.engine.last_transaction_datetime
+        return {
+            "transactions": self.transactions_filepath,
+            "line_number": self.position.line_number,
+            "shares_held": self.get_shares_held(),
+            "lots": len(self.engine.lot_store.quantity),
+            "last_transaction_date": last_datetime
+            and last_datetime.strftime("%Y-%m-%d"),
+        }
+
+    # What selling `quantity` shares at `price` on sell_datetime would do under
+    # every tax method: the lots sold, the profits and the tax it adds (the
+    # tax of the realized profits by year with the sell, less without it).
+    # Nothing is changed.
+    def preview_sell(self, quantity, price, sell_datetime):
+        if quantity <= 0 or price < 0:
+            raise ValueError("quantity must be positive and price not negative")
+        share_factor = 1
+        if self.split_adjustment is not None:
+            share_factor = self.split_adjustment.get_factor(sell_datetime)
+        # in base shares, there may be splits between the last transaction and
+        # sell_datetime
+        base_shares_held = sum(self.engine.accountants[0].remaining_quantity)
+        if quantity / share_factor > base_shares_held + 1e-9:
+            raise ValueError(
+                f"Cannot sell {quantity} shares, "
+                f"{base_shares_held * share_factor} are held on that date"
+            )
+        sell = Transaction(
+            quantity / share_factor,
+            price * share_factor,
+            sell_datetime,
+            TRANSACTION_SELL,
+        )
+        methods = []
+        for accountant in self.engine.accountants:
+            fork = accountant.fork()
+            fork.ledger = sell_preview = SellPreview(share_factor)
+            fork.sell(sell)
+            tax_before = self.tax_table.calculate_tax_burden(accountant.profits_by_year)
+            tax_after = self.tax_table.calculate_tax_burden(fork.profits_by_year)
+            methods.append(
+                {
+                    "tax_method": accountant.get_tax_method_name(),
+                    "short_term_profit": fork.get_short_term_profit()
+                    - accountant.get_short_term_profit(),
+                    "long_term_profit": fork.get_long_term_profit()
+                    - accountant.get_long_term_profit(),
+                    "tax": (
+                        None
+                        if tax_before is None or tax_after is None
+                        else tax_after - tax_before
+                    ),
+                    "lots": sell_preview.lots,
+                }
+            )
+        return {
+            "quantity": quantity,
+            "price": price,
+            "date": sell_datetime.strftime("%Y-%m-%d"),
+            "methods": methods,
+        }
+
+
+# GET /sell?quantity=N&price=P[&date=YYYY/MM/DD] previews a sell (today by
+# default), GET /status describes the state, POST /reload replays the file.
+# Every request first picks up the rows appended to the file.
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/sell":
+            self.respond(self.handle_sell, parse_qs(url.query))
+        elif url.path == "/status":
+            self.respond(lambda _: self.server.state.get_status(), None)
+        else:
+            self.send_json(404, {"error": f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        if urlsplit(self.path).path == "/reload":
+            self.respond(self.handle_reload, None)
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def respond(self, handler, query):
+        try:
+            self.server.state.refresh()
+            body = handler(query)
+        except (KeyError, ValueError) as e:
+            self.send_json(400, {"error": f"{type(e).__name__}: {e}"})
+            return
+        except Exception as e:
+            logger.exception("Request failed")
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self.send_json(200, body)
+
+    def handle_sell(self, query):
+        sell_datetime = datetime.combine(datetime.now().date(), datetime.min.time())
+        if "date" in query:
+            sell_datetime = datetime.strptime(query["date"][0], "%Y/%m/%d")
+        return self.server.state.preview_sell(
+            float(query["quantity"][0]), float(query["price"][0]), sell_datetime
+        )
+
+    def handle_reload(self, _):
+        self.server.state.reload()
+        return self.server.state.get_status()
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # a Unix socket client has no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+# Requests are handled one at a time, a preview takes milliseconds and the
+# state never has to be locked
+class DaemonHTTPServer(HTTPServer):
+    def __init__(self, server_address, state):
+        self.state = state
+        super().__init__(server_address, DaemonRequestHandler)
+
+
+class UnixDaemonHTTPServer(DaemonHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="keep every tax method's lots in memory and preview sells "
+        "over HTTP"
+    )
+    parser.add_argument("transactions_path")
+    parser.add_argument("config_path")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT, help="port to listen on"
+    )
+    parser.add_argument(
+        "--socket", metavar="PATH", help="listen on this Unix socket instead"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.WARNING,
+    )
+    state = LotSelectionState(args.transactions_path, args.config_path)
+    if args.socket:
+        server = UnixDaemonHTTPServer(args.socket, state)
+    else:
+        server = DaemonHTTPServer((args.host, args.port), state)
+    print(f"Listening on {args.socket or f'{args.host}:{server.server_port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
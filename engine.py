@@ -0,0 +1,154 @@
+import time
+from dataclasses import dataclass
+
+from accountant import Accountant
+from constants import TRANSACTION_BUY
+from lot_store import LotStore
+from stats import count_accountant, uncount_accountant
+from tax_methods import tax_methods as default_tax_methods
+from wash_sale import WashSales
+
+
+@dataclass
+class AccountingResult:
+    tax_method_name: str
+    current_profit: float
+    short_term_profit: float
+    long_term_profit: float
+    # tax year -> (short term, long term) profit, see taxes.TaxTable
+    profits_by_year: dict = None
+
+
+# Runs every tax method over a single pass of the transaction stream. Buys are
+# stored once in a shared LotStore, each method only keeps its own lot book and
+# remaining quantities.
+class AccountingEngine:
+    # see attach_stats, a class attribute so that pickled engines without one
+    # still load
+    stats = None
+
+    def __init__(self, tax_methods=None):
+        if tax_methods is None:
+            tax_methods = default_tax_methods
+        self.lot_store = LotStore()
+        self.accountants = [
+            Accountant(tax_method, self.lot_store) for tax_method in tax_methods
+        ]
+        self.last_transaction_price = None
+        self.last_transaction_datetime = None
+
+    def account_for_transaction(self, transaction):
+        if transaction.transaction_type == TRANSACTION_BUY:
+            lot_id = self.lot_store.add(transaction)
+            for accountant in self.accountants:
+                accountant.add_lot(lot_id)
+        else:
+            for accountant in self.accountants:
+                accountant.account_for_transaction(transaction)
+        self.last_transaction_price = transaction.cost_basis
+        self.last_transaction_datetime = transaction.datetime
+
+    def account_for_transactions(self, transactions):
+        if self.stats is not None:
+            self.account_for_transactions_with_stats(transactions)
+            return
+        for transaction in transactions:
+            self.account_for_transaction(transaction)
+
+    # Counts what every accountant's sells do and times each of them from here
+    # on, until detach_stats
+    def attach_stats(self, stats):
+        self.stats = stats
+        for accountant in self.accountants:
+            count_accountant(accountant, stats)
+
+    def detach_stats(self):
+        for accountant in self.accountants:
+            uncount_accountant(accountant)
+        self.stats = None
+
+    # Writes every lot the accountants (or those of `tax_method_names`) sell to
+    # `ledger` from here on, until detach_ledger
+    def attach_ledger(self, ledger, tax_method_names=None):
+        for accountant in self.accountants:
+            if (
+                tax_method_names is None
+                or accountant.get_tax_method_name() in tax_method_names
+            ):
+                accountant.ledger = ledger
+
+    # also writes the rows the wash sales still held back
+    def detach_ledger(self):
+        for accountant in self.accountants:
+            if accountant.ledger is not None and accountant.wash_sales is not None:
+                accountant.wash_sales.write_ledger_rows(accountant.ledger, True)
+            accountant.ledger = None
+
+    # Applies the wash sale rule to the accountants' transactions from here on,
+    # see wash_sale.py
+    def attach_wash_sales(self):
+        for accountant in self.accountants:
+            accountant.wash_sales = WashSales()
+
+    def account_for_transactions_with_stats(self, transactions):
+        stats = self.stats
+        perf_counter = time.perf_counter
+        process_time = time.process_time
+        timers = [
+            (accountant, f"accounting[{accountant.get_tax_method_name()}]")
+            for accountant in self.accountants
+        ]
+        for transaction in transactions:
+            is_buy = transaction.transaction_type == TRANSACTION_BUY
+            if is_buy:
+                with stats.timer("accounting[lot_store]"):
+                    lot_id = self.lot_store.add(transaction)
+                stats.count("accounting", "buys")
+            else:
+                stats.count("accounting", "sells")
+            for accountant, timer_name in timers:
+                wall_start = perf_counter()
+                cpu_start = process_time()
+                if is_buy:
+                    accountant.add_lot(lot_id)
+                else:
+                    accountant.account_for_transaction(transaction)
+                stats.add_time(
+                    timer_name,
+                    perf_counter() - wall_start,
+                    process_time() - cpu_start,
+                )
+            self.last_transaction_price = transaction.cost_basis
+            self.last_transaction_datetime = transaction.datetime
+
+    # Profits as if every open lot was sold at last_price on last_datetime,
+    # without selling them. Defaults to the last transaction seen.
+    def get_results(self, last_price=None, last_datetime=None):
+        if last_price is None or last_datetime is None:
+            last_price = self.last_transaction_price
+            last_datetime = self.last_transaction_datetime
+        results = []
+        for accountant in self.accountants:
+            (
+                short_term_profit,
+                long_term_profit,
+                profits_by_year,
+            ) = accountant.get_liquidation_profits_by_year(last_price, last_datetime)
+            results.append(
+                AccountingResult(
+                    accountant.get_tax_method_name(),
+                    accountant.get_profit(),
+                    short_term_profit,
+                    long_term_profit,
+                    profits_by_year,
+                )
+            )
+        return results
+
+
+def run_tax_methods(
+    transactions, last_price=None, last_datetime=None, tax_methods=None
+):
+    engine = AccountingEngine(tax_methods)
+    engine.account_for_transactions(transactions)
+    return engine.get_results(last_price, last_datetime)
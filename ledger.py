@@ -0,0 +1,134 @@
+import csv
+import json
+import sys
+
+LEDGER_FIELDNAMES = [
+    "tax_method",
+    "sell_date",
+    "acquisition_date",
+    "quantity",
+    "proceeds",
+    "cost_basis",
+    "gain",
+    "term",
+    "wash_sale_disallowed",
+]
+LEDGER_BUFFER_SIZE = 1 << 20
+
+
+# Writes a row per lot (part) sold as the accountants sell it, see
+# Accountant.sell. Nothing is kept in memory beyond the file buffer, so a ledger
+# of a multi-million row history costs one formatted line per disposal. Wash
+# sales hold back the rows of their last 30 days, see wash_sale.py.
+class LedgerWriter:
+    def __init__(self, ledger_file):
+        self.ledger_file = ledger_file
+        # a corporate_actions.SplitAdjustment, quantities are in base shares
+        # with one
+        self.split_adjustment = None
+        # the same few hundred dates come up over and over
+        self.dates = {}
+
+    def format_date(self, value):
+        date = self.dates.get(value)
+        if date is None:
+            date = self.dates[value] = value.strftime("%Y-%m-%d")
+        return date
+
+    def close(self):
+        if self.ledger_file is sys.stdout:
+            self.ledger_file.flush()
+        else:
+            self.ledger_file.close()
+
+
+class CsvLedgerWriter(LedgerWriter):
+    def __init__(self, ledger_file):
+        super().__init__(ledger_file)
+        self.writer = csv.writer(ledger_file)
+        self.writer.writerow(LEDGER_FIELDNAMES)
+
+    def write(
+        self,
+        tax_method_name,
+        sell_datetime,
+        acquisition_datetime,
+        quantity,
+        proceeds,
+        cost_basis,
+        long_term,
+        wash_sale_disallowed=0,
+    ):
+        # min() of a lot and the sell keeps ints, write every number as a float
+        quantity = float(quantity)
+        proceeds = float(proceeds)
+        cost_basis = float(cost_basis)
+        if self.split_adjustment is not None:
+            quantity = self.split_adjustment.to_shares(quantity)
+        self.writer.writerow(
+            [
+                tax_method_name,
+                self.format_date(sell_datetime),
+                self.format_date(acquisition_datetime),
+                quantity,
+                proceeds,
+                cost_basis,
+                proceeds - cost_basis,
+                "long" if long_term else "short",
+                float(wash_sale_disallowed),
+            ]
+        )
+
+
+# One JSON object per line
+class JsonLinesLedgerWriter(LedgerWriter):
+    def __init__(self, ledger_file):
+        super().__init__(ledger_file)
+        self.method_names = {}
+
+    def write(
+        self,
+        tax_method_name,
+        sell_datetime,
+        acquisition_datetime,
+        quantity,
+        proceeds,
+        cost_basis,
+        long_term,
+        wash_sale_disallowed=0,
+    ):
+        quantity = float(quantity)
+        proceeds = float(proceeds)
+        cost_basis = float(cost_basis)
+        if self.split_adjustment is not None:
+            quantity = self.split_adjustment.to_shares(quantity)
+        method_name = self.method_names.get(tax_method_name)
+        if method_name is None:
+            method_name = self.method_names[tax_method_name] = json.dumps(
+                tax_method_name
+            )
+        # numbers and dates need no escaping, formatting them here is a lot
+        # cheaper than json.dumps of a dict per row
+        self.ledger_file.write(
+            f'{{"tax_method": {method_name}, '
+            f'"sell_date": "{self.format_date(sell_datetime)}", '
+            f'"acquisition_date": "{self.format_date(acquisition_datetime)}", '
+            f'"quantity": {quantity!r}, "proceeds": {proceeds!r}, '
+            f'"cost_basis": {cost_basis!r}, "gain": {proceeds - cost_basis!r}, '
+            f'"term": "{"long" if long_term else "short"}", '
+            f'"wash_sale_disallowed": {float(wash_sale_disallowed)!r}}}\n'
+        )
+
+
+# JSON lines for .jsonl / .json paths, CSV for anything else. "-" writes CSV to
+# stdout.
+def open_ledger(ledger_filepath):
+    if ledger_filepath == "-":
+        return CsvLedgerWriter(sys.stdout)
+    if ledger_filepath.endswith((".jsonl", ".json")):
+        return JsonLinesLedgerWriter(
+            open(ledger_filepath, "w", buffering=LEDGER_BUFFER_SIZE)
+        )
+    return CsvLedgerWriter(
+        open(ledger_filepath, "w", newline="", buffering=LEDGER_BUFFER_SIZE)
+    )
@@ -0,0 +1,259 @@
+import heapq
+from datetime import timedelta
+
+from tax_methods import tax_optimizer_key
+
+SHORT_TERM_PERIOD = timedelta(days=365)
+
+
+# Books hold lot ids into a shared `LotStore`. `remaining_quantity` is the
+# owning accountant's column of unsold shares per lot id.
+#
+# Every book hands out lots in the same order a stable sort of the old
+# `unsold_transactions` list would have. Ties are broken by the order in which
+# the lot was (re-)added, so a partially sold lot goes behind its equals.
+#
+# For price independent methods the key is computed once, when the lot is added.
+class HeapLotBook:
+    def __init__(self, sort_key, lot_store, remaining_quantity):
+        self.sort_key = sort_key
+        self.lot_store = lot_store
+        self.remaining_quantity = remaining_quantity
+        self.heap = []
+        self.sequence = 0
+
+    def add(self, lot_id):
+        lot = self.lot_store.lot(lot_id, self.remaining_quantity[lot_id])
+        sort_key = self.sort_key(lot, None, None)
+        heapq.heappush(self.heap, [sort_key, self.sequence, lot_id])
+        self.sequence += 1
+
+    def start_sell(self, current_price, current_datetime):
+        pass
+
+    def pop(self):
+        return heapq.heappop(self.heap)[2]
+
+    def clear(self):
+        self.heap = []
+
+    # An independent book over the same lots, with sell quantities tracked in
+    # `remaining_quantity`. `lot_store` replaces the store for one with the same
+    # lots, see Accountant.fork.
+    def copy(self, remaining_quantity, lot_store=None):
+        lot_book = HeapLotBook(
+            self.sort_key, lot_store or self.lot_store, remaining_quantity
+        )
+        # entries are never changed once pushed, they can be shared
+        lot_book.heap = list(self.heap)
+        lot_book.sequence = self.sequence
+        return lot_book
+
+    def __iter__(self):
+        return (entry[2] for entry in self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+
+# Fallback for price or date dependent methods: sorts once per sell, just like
+# the original implementation.
+class SortedLotBook:
+    def __init__(self, sort_key, lot_store, remaining_quantity):
+        self.sort_key = sort_key
+        self.lot_store = lot_store
+        self.remaining_quantity = remaining_quantity
+        self.lots = []
+        self.position = 0
+
+    def add(self, lot_id):
+        self.lots.append(lot_id)
+
+    def start_sell(self, current_price, current_datetime):
+        lot_store = self.lot_store
+        remaining_quantity = self.remaining_quantity
+        sort_key = lambda lot_id: self.sort_key(
+            lot_store.lot(lot_id, remaining_quantity[lot_id]),
+            current_price,
+            current_datetime,
+        )
+        self.lots = sorted(self.lots[self.position :], key=sort_key)
+        self.position = 0
+
+    def pop(self):
+        lot_id = self.lots[self.position]
+        self.position += 1
+        return lot_id
+
+    def clear(self):
+        self.lots = []
+        self.position = 0
+
+    def copy(self, remaining_quantity, lot_store=None):
+        lot_book = SortedLotBook(
+            self.sort_key, lot_store or self.lot_store, remaining_quantity
+        )
+        lot_book.lots = self.lots[self.position :]
+        return lot_book
+
+    def __iter__(self):
+        return iter(self.lots[self.position :])
+
+    def __len__(self):
+        return len(self.lots) - self.position
+
+
+# Dedicated book for `tax_optimizer_key`. Within a holding period the
+# comparator always prefers the lot with the highest cost basis, so lots are
+# kept in two max-heaps (short term / long term) and the sell price only decides
+# which heap top goes first:
+#   short-term loss > long-term loss > short-term even > long-term even
+#   > long-term gain > short-term gain
+# Lots move from the short-term to the long-term heap as sell dates pass their
+# 365 day boundary.
+#
+# Lots with an equal cost basis in the long-term heap are ranked the way the old
+# repeated stable sort left them: a lot that just went long term was placed in
+# front of (loss / even) or behind (gain) the long-term lots by the last sell it
+# was still short term for.
+class TaxOptimizerLotBook:
+    def __init__(self, lot_store):
+        self.lot_store = lot_store
+        # [-cost_basis, sequence, lot_id, is_short_term]
+        self.short_term = []
+        # [-cost_basis, rank, sequence, lot_id]
+        self.long_term = []
+        # (datetime, sequence, short_term entry)
+        self.acquisitions = []
+        self.sequence = 0
+        self.size = 0
+        self.current_price = None
+        self.current_datetime = None
+        self.sell_sequence = 0
+        self.front_rank = 0
+        # times the heaps were rebuilt or lots moved between them, for stats
+        self.heap_rebuilds = 0
+
+    def add(self, lot_id):
+        lot_store = self.lot_store
+        entry = [-lot_store.cost_basis[lot_id], self.sequence, lot_id, True]
+        heapq.heappush(self.short_term, entry)
+        heapq.heappush(
+            self.acquisitions, (lot_store.datetime[lot_id], self.sequence, entry)
+        )
+        self.sequence += 1
+        self.size += 1
+
+    def start_sell(self, current_price, current_datetime):
+        previous_datetime = self.current_datetime
+        if previous_datetime is not None and current_datetime < previous_datetime:
+            self.rebuild()
+        moved = False
+        while (
+            self.acquisitions
+            and current_datetime - self.acquisitions[0][0] > SHORT_TERM_PERIOD
+        ):
+            _, sequence, entry = heapq.heappop(self.acquisitions)
+            if not entry[3]:
+                continue
+            entry[3] = False
+            if sequence >= self.sell_sequence:
+                # never sorted while short term, so it keeps its place in line
+                rank = sequence
+            elif self.current_price > -entry[0]:
+                rank = self.sell_sequence - 0.5
+            else:
+                rank = self.front_rank
+            heapq.heappush(self.long_term, [entry[0], rank, sequence, entry[2]])
+            moved = True
+        if moved:
+            self.heap_rebuilds += 1
+        self.front_rank -= 1
+        self.current_price = current_price
+        self.current_datetime = current_datetime
+        self.sell_sequence = self.sequence
+
+    def pop(self):
+        short_term = self.short_term
+        while short_term and not short_term[0][3]:
+            heapq.heappop(short_term)
+        long_term = self.long_term
+        price = self.current_price
+        if short_term and -short_term[0][0] > price:
+            from_short_term = True
+        elif long_term and -long_term[0][0] > price:
+            from_short_term = False
+        elif short_term and -short_term[0][0] == price:
+            from_short_term = True
+        else:
+            from_short_term = not long_term
+
+        self.size -= 1
+        if from_short_term:
+            entry = heapq.heappop(short_term)
+            entry[3] = False
+            return entry[2]
+        return heapq.heappop(long_term)[3]
+
+    def rebuild(self):
+        lot_ids = list(self)
+        self.clear()
+        for lot_id in lot_ids:
+            self.add(lot_id)
+        self.heap_rebuilds += 1
+
+    def clear(self):
+        self.short_term = []
+        self.long_term = []
+        self.acquisitions = []
+        self.size = 0
+        self.current_price = None
+        self.current_datetime = None
+        self.sell_sequence = self.sequence
+
+    # lots are not split here, remaining_quantity is not needed
+    def copy(self, remaining_quantity, lot_store=None):
+        lot_book = TaxOptimizerLotBook(lot_store or self.lot_store)
+        # short-term entries are flagged in place once sold or long term and the
+        # acquisitions heap points at them, so both heaps get the same new
+        # entries. Acquisitions of entries gone from the short-term heap are
+        # dead and left out.
+        short_term_entries = {}
+        for entry in self.short_term:
+            short_term_entries[id(entry)] = list(entry)
+        lot_book.short_term = list(short_term_entries.values())
+        lot_book.acquisitions = [
+            (acquisition_datetime, sequence, short_term_entries[id(entry)])
+            for acquisition_datetime, sequence, entry in self.acquisitions
+            if id(entry) in short_term_entries
+        ]
+        heapq.heapify(lot_book.acquisitions)
+        lot_book.long_term = list(self.long_term)
+        for name in [
+            "sequence",
+            "size",
+            "current_price",
+            "current_datetime",
+            "sell_sequence",
+            "front_rank",
+        ]:
+            setattr(lot_book, name, getattr(self, name))
+        return lot_book
+
+    def __iter__(self):
+        for entry in self.short_term:
+            if entry[3]:
+                yield entry[2]
+        for entry in self.long_term:
+            yield entry[3]
+
+    def __len__(self):
+        return self.size
+
+
+def make_lot_book(tax_method, lot_store, remaining_quantity):
+    if tax_method.sort_key is tax_optimizer_key:
+        return TaxOptimizerLotBook(lot_store)
+    if tax_method.price_independent:
+        return HeapLotBook(tax_method.sort_key, lot_store, remaining_quantity)
+    return SortedLotBook(tax_method.sort_key, lot_store, remaining_quantity)
@@ -0,0 +1,38 @@
+from array import array
+
+from constants import TRANSACTION_BUY
+from transaction import Transaction
+
+
+# Column store of every lot that was bought, indexed by lot id (the order the
+# lots were acquired in). Accountants can share one store and only keep their
+# own remaining quantity per lot id.
+class LotStore:
+    def __init__(self):
+        self.quantity = array("d")
+        self.cost_basis = array("d")
+        self.datetime = []
+
+    def add(self, transaction):
+        lot_id = len(self.datetime)
+        self.quantity.append(transaction.transaction_size)
+        self.cost_basis.append(transaction.cost_basis)
+        self.datetime.append(transaction.datetime)
+        return lot_id
+
+    def copy(self):
+        lot_store = LotStore()
+        lot_store.quantity = array("d", self.quantity)
+        lot_store.cost_basis = array("d", self.cost_basis)
+        lot_store.datetime = list(self.datetime)
+        return lot_store
+
+    def lot(self, lot_id, quantity=None):
+        if quantity is None:
+            quantity = self.quantity[lot_id]
+        return Transaction(
+            quantity, self.cost_basis[lot_id], self.datetime[lot_id], TRANSACTION_BUY
+        )
+
+    def __len__(self):
+        return len(self.datetime)
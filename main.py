@@ -1,16 +1,26 @@
 import sys
-import csv
-import heapq
-import copy
+import json
 import logging
 import argparse
-from datetime import datetime, timedelta
-from functools import cmp_to_key
+import dataclasses
+from dataclasses import dataclass
 
-from parse import parse_config, parse_transactions
+from parse import TransactionSource, parse_config, parse_source_config, parse_transactions, parse_transactions_by_ticker
 from tax_methods import tax_methods
-from accountant import Accountant
-from constants import LAST_DATE_KEY, LAST_PRICE_KEY, CAPTIAL_GAINS_TAX_RATE_KEY, INCOME_TAX_RATE_KEY
+from engine import AccountingEngine, run_tax_methods
+from checkpoint import run_checkpointed
+from corporate_actions import apply_corporate_actions, get_split_adjustment
+from optimizer import optimize_tax_burden
+from ledger import open_ledger
+from stats import Stats, timer
+from simulation import SIMULATION_PERCENTILES, ScheduledSell, SimulationSettings, generate_price_paths, parse_scheduled_sells, simulate_tax_methods
+from schwab.merge_schwab import merge_transactions, parse_merged_transactions
+from sweep import parse_sweep_dates, parse_sweep_prices, sweep_liquidation
+from parallel import run_tax_methods_parallel, run_work_items_parallel
+from taxes import TaxTable, calculate_tax_burden, get_flat_tax_year
+from transaction import pack_transactions
+from transaction_cache import load_transactions, load_transactions_by_ticker
+from constants import LAST_DATE_KEY, LAST_PRICE_KEY, CAPTIAL_GAINS_TAX_RATE_KEY, CAPITAL_LOSS_LIMIT_KEY, INCOME_TAX_RATE_KEY, TAX_TABLE_KEY, TICKER_TO_TRACK_KEY, TICKERS_TO_TRACK_KEY, TRANSACTION_PARSER_KEY
 
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
@@ -20,60 +30,400 @@ ch.setFormatter(formatter)
 logger.addHandler(ch)
 
 
-def main(transactions_filepath, config_filepath):
-    accountants = []
-    for [tax_method_name, tax_method_comparartor] in tax_methods:
-        accountants.append(Accountant(tax_method_name, tax_method_comparartor))
-    config = parse_config(config_filepath)
+# What main runs with besides the transactions and config files.
+# `stats_filepath` writes the timers and counters of the run there as JSON, "-"
+# prints them after the results. `ledger_filepath` writes every lot sold by
+# the tax methods (or those named in `ledger_methods`) there, see ledger.py.
+# With `schwab_equity_filepath` the transactions file is a Schwab transactions
+# export, merged with that equity awards export in memory (and written to
+# `schwab_output_filepath` if given), see schwab/. `wash_sales` defers the
+# losses of wash sales into the replacement lots, see wash_sale.py.
+# `tax_years` prints each method's taxes per year, see taxes.TaxTable.
+# `accounts` are (transactions file, config file) pairs of other accounts whose
+# transactions are merged by date with those of `transactions_filepath`, each
+# config giving the columns of its file, see parse.parse_sources.
+@dataclass
+class RunSettings:
+    jobs: int = 1
+    all_tickers: bool = False
+    cache_dir: str = None
+    rebuild_cache: bool = False
+    checkpoint_filepath: str = None
+    sweep_prices: list = None
+    sweep_datetimes: list = None
+    optimize: bool = False
+    simulation: SimulationSettings = None
+    stats_filepath: str = None
+    ledger_filepath: str = None
+    ledger_methods: list = None
+    schwab_equity_filepath: str = None
+    schwab_output_filepath: str = None
+    wash_sales: bool = False
+    tax_years: bool = False
+    accounts: list = None
+
+
+def main(transactions_filepath, config_filepath, settings=None):
+    if settings is None:
+        settings = RunSettings()
+    stats = Stats() if settings.stats_filepath else None
+    try:
+        run(transactions_filepath, config_filepath, settings, stats)
+    finally:
+        if stats is not None:
+            write_stats(stats, settings.stats_filepath)
+
+
+def run(transactions_filepath, config_filepath, settings, stats):
+    # options are turned off below when they do not apply
+    settings = dataclasses.replace(settings)
+    with timer(stats, "config_parse"):
+        config = parse_config(config_filepath)
     # todo: check the config for None
+    config[TRANSACTION_PARSER_KEY].stats = stats
+
+    if settings.accounts:
+        if settings.schwab_equity_filepath:
+            logger.error("The Schwab merge reads a single export, it cannot be merged with other accounts")
+            return
+        if settings.cache_dir:
+            logger.warning("The cache only keeps a single transactions file, ignoring the cache")
+            settings.cache_dir = None
+        if settings.checkpoint_filepath:
+            logger.warning("Checkpoints only resume a single transactions file, ignoring the checkpoint")
+            settings.checkpoint_filepath = None
+        try:
+            with timer(stats, "config_parse"):
+                transactions_filepath = [TransactionSource(transactions_filepath, config)] + [
+                    TransactionSource(account_filepath, parse_source_config(account_config_filepath, config))
+                    for account_filepath, account_config_filepath in settings.accounts
+                ]
+        except ValueError as e:
+            logger.error(f"Could not read the account configs: {e}")
+            return
+        transaction_parsers = [source.config[TRANSACTION_PARSER_KEY] for source in transactions_filepath]
+        if any(transaction_parser.split_values for transaction_parser in transaction_parsers):
+            # the ratio of a split row is worked out from the shares held in every account
+            logger.error("Split rows only add the shares of their own account, list the splits in the corporate_actions_file of the main config instead")
+            return
+        for transaction_parser in transaction_parsers:
+            transaction_parser.stats = stats
+
+    if settings.all_tickers or config.get(TICKERS_TO_TRACK_KEY):
+        if settings.schwab_equity_filepath:
+            logger.error("The Schwab merge only applies to ticker_to_track")
+            return
+        if settings.checkpoint_filepath:
+            logger.warning("Checkpoints only apply to ticker_to_track, ignoring the checkpoint")
+        if settings.sweep_prices:
+            logger.warning("Sweeps only apply to ticker_to_track, ignoring the sweep")
+        if settings.simulation:
+            logger.warning("Simulations only apply to ticker_to_track, ignoring the simulation")
+        if settings.ledger_filepath:
+            logger.warning("Ledgers only apply to ticker_to_track, not writing the ledger")
+        if settings.wash_sales:
+            logger.warning("Wash sales only apply to ticker_to_track, ignoring them")
+        if settings.tax_years:
+            logger.warning("The taxes per year are only printed for ticker_to_track")
+        main_multi_ticker(transactions_filepath, config, settings.jobs, settings.all_tickers, settings.cache_dir, settings.rebuild_cache, stats)
+        return
+
+    last_price = config.get(LAST_PRICE_KEY)
+    last_datetime = config.get(LAST_DATE_KEY)
+    engine = None
+    # None without corporate actions in the config, see corporate_actions.py
+    split_adjustment = get_split_adjustment(config, config.get(TICKER_TO_TRACK_KEY))
+    if settings.checkpoint_filepath and split_adjustment is not None:
+        logger.warning("The checkpoint does not keep corporate actions, ignoring the checkpoint")
+        settings.checkpoint_filepath = None
+    if settings.checkpoint_filepath and settings.ledger_filepath:
+        logger.warning("The ledger needs every sell, ignoring the checkpoint")
+        settings.checkpoint_filepath = None
+    if settings.checkpoint_filepath and settings.wash_sales:
+        logger.warning("The checkpoint does not keep wash sales, ignoring the checkpoint")
+        settings.checkpoint_filepath = None
+    if settings.simulation and settings.wash_sales:
+        logger.warning("Simulations do not apply wash sales, ignoring them")
+        settings.wash_sales = False
+    if settings.schwab_equity_filepath:
+        if settings.checkpoint_filepath:
+            logger.warning("The Schwab merge reads the whole export, ignoring the checkpoint")
+            settings.checkpoint_filepath = None
+        if settings.cache_dir:
+            logger.warning("The Schwab merge reads the whole export, ignoring the cache")
+            settings.cache_dir = None
+    if settings.checkpoint_filepath:
+        engine = run_checkpointed(transactions_filepath, config, settings.checkpoint_filepath, tax_methods, stats)
+    else:
+        if settings.schwab_equity_filepath:
+            with timer(stats, "schwab_merge"):
+                merged_transactions = merge_transactions(transactions_filepath, settings.schwab_equity_filepath)
+            transactions = parse_merged_transactions(merged_transactions, config[TRANSACTION_PARSER_KEY], settings.schwab_output_filepath)
+        elif settings.cache_dir:
+            transactions = load_transactions(transactions_filepath, config, settings.cache_dir, settings.rebuild_cache)
+        else:
+            transactions = parse_transactions(transactions_filepath, config)
+        if stats is not None:
+            transactions = stats.timed_iter(transactions, "parsing")
+        if split_adjustment is not None:
+            transactions = split_adjustment.adjust(transactions)
+        parallel = settings.jobs > 1 and not settings.sweep_prices and not settings.simulation and not settings.ledger_filepath and not settings.wash_sales
+        if settings.optimize or (parallel and split_adjustment is not None):
+            transactions = list(transactions)
+        if parallel:
+            if split_adjustment is not None:
+                last_price = split_adjustment.to_base_price(last_price, last_datetime)
+            with timer(stats, "accounting"):
+                results = run_tax_methods_parallel(transactions, settings.jobs, last_price, last_datetime, tax_methods)
+        else:
+            engine = AccountingEngine(tax_methods)
+            if stats is not None:
+                engine.attach_stats(stats)
+            if settings.wash_sales:
+                engine.attach_wash_sales()
+            if settings.ledger_filepath:
+                ledger = open_ledger(settings.ledger_filepath)
+                ledger.split_adjustment = split_adjustment
+                engine.attach_ledger(ledger, settings.ledger_methods)
+            try:
+                engine.account_for_transactions(transactions)
+            finally:
+                if settings.ledger_filepath:
+                    engine.detach_ledger()
+                    ledger.close()
+            if stats is not None:
+                engine.detach_stats()
+            if split_adjustment is not None:
+                last_price = split_adjustment.to_base_price(last_price, last_datetime)
+
+    tax_table = config.get(TAX_TABLE_KEY)
+    if settings.tax_years and tax_table is None:
+        tax_table = TaxTable(default_tax_year=get_flat_tax_year(config[CAPTIAL_GAINS_TAX_RATE_KEY], config[INCOME_TAX_RATE_KEY], config.get(CAPITAL_LOSS_LIMIT_KEY)), capital_loss_limit=config.get(CAPITAL_LOSS_LIMIT_KEY))
+
+    if settings.sweep_prices:
+        if not settings.sweep_datetimes:
+            settings.sweep_datetimes = [last_datetime or engine.last_transaction_datetime]
+        with timer(stats, "sweep"):
+            sweep_results = sweep_liquidation(engine, settings.sweep_prices, settings.sweep_datetimes, config[CAPTIAL_GAINS_TAX_RATE_KEY], config[INCOME_TAX_RATE_KEY], split_adjustment, tax_table)
+        with timer(stats, "reporting"):
+            print_sweep_results(sweep_results)
+        return
+
+    if settings.simulation:
+        if split_adjustment is not None:
+            settings.simulation = dataclasses.replace(
+                settings.simulation,
+                scheduled_sells=[
+                    ScheduledSell(scheduled_sell.datetime, split_adjustment.to_base_quantity(scheduled_sell.quantity, scheduled_sell.datetime))
+                    for scheduled_sell in settings.simulation.scheduled_sells
+                ],
+            )
+        try:
+            with timer(stats, "simulation"):
+                simulation_results = run_simulation(engine, settings.simulation, last_price, last_datetime, config[CAPTIAL_GAINS_TAX_RATE_KEY], config[INCOME_TAX_RATE_KEY], settings.jobs, tax_table)
+        except ValueError as e:
+            logger.error(f"Could not run the simulation: {e}")
+            return
+        with timer(stats, "reporting"):
+            print_simulation_results(simulation_results)
+        return
+
+    if engine is not None:
+        results = engine.get_results(last_price, last_datetime)
+    if settings.optimize:
+        if settings.checkpoint_filepath:
+            transactions = parse_transactions(transactions_filepath, config)
+        try:
+            with timer(stats, "optimize"):
+                results.append(optimize_tax_burden(transactions, last_price, last_datetime, config[CAPTIAL_GAINS_TAX_RATE_KEY], config[INCOME_TAX_RATE_KEY]))
+        except ValueError as e:
+            logger.error(f"Could not optimize the lot selection: {e}")
+        if tax_table is not None:
+            logger.warning("The optimal lot selection is for the flat rates on the lifetime profits, it has no tax burden by year")
+    with timer(stats, "reporting"):
+        print_results(results, config[CAPTIAL_GAINS_TAX_RATE_KEY], config[INCOME_TAX_RATE_KEY], tax_table)
+        if settings.wash_sales:
+            print_wash_sales(engine)
+        if settings.tax_years:
+            print_yearly_taxes(results, tax_table)
+
+
+# Price paths start at last_price on last_date, or at the last transaction
+def run_simulation(engine, simulation, last_price, last_datetime, capital_gains_tax_rate, income_tax_rate, jobs, tax_table=None):
+    if last_price is None or last_datetime is None:
+        last_price = engine.last_transaction_price
+        last_datetime = engine.last_transaction_datetime
+    horizon = simulation.horizon or simulation.scheduled_sells[-1].datetime
+    price_paths = generate_price_paths(
+        last_price,
+        last_datetime,
+        [scheduled_sell.datetime for scheduled_sell in simulation.scheduled_sells] + [horizon],
+        simulation.path_count,
+        simulation.drift,
+        simulation.volatility,
+        simulation.seed,
+    )
+    return simulate_tax_methods(engine, simulation.scheduled_sells, horizon, price_paths, capital_gains_tax_rate, income_tax_rate, jobs, tax_table)
+
+
+# Reads the CSV once and runs every tax method for each ticker in it (or the
+# configured tickers_to_track). last_date / last_price only apply to
+# ticker_to_track, other tickers use their own last transaction.
+def main_multi_ticker(transactions_filepath, config, jobs, all_tickers, cache_dir=None, rebuild_cache=False, stats=None):
+    tickers = None if all_tickers else config[TICKERS_TO_TRACK_KEY]
+    with timer(stats, "parsing"):
+        if cache_dir:
+            transactions_by_ticker = load_transactions_by_ticker(transactions_filepath, config, cache_dir, tickers, rebuild_cache)
+        else:
+            transactions_by_ticker = parse_transactions_by_ticker(transactions_filepath, config, tickers)
+
+    work_items = []
+    for ticker, transactions in transactions_by_ticker.items():
+        if ticker == config.get(TICKER_TO_TRACK_KEY):
+            last_price, last_datetime = config.get(LAST_PRICE_KEY), config.get(LAST_DATE_KEY)
+        else:
+            last_price, last_datetime = None, None
+        transactions, last_price = apply_corporate_actions(config, ticker, transactions, last_price, last_datetime)
+        work_items.append((transactions, last_price, last_datetime))
+
+    with timer(stats, "accounting"):
+        if jobs > 1:
+            packed_work_items = [
+                (pack_transactions(transactions), last_price, last_datetime)
+                for transactions, last_price, last_datetime in work_items
+            ]
+            results_per_ticker = run_work_items_parallel(packed_work_items, jobs, tax_methods)
+        else:
+            results_per_ticker = [
+                run_tax_methods(transactions, last_price, last_datetime, tax_methods)
+                for transactions, last_price, last_datetime in work_items
+            ]
+
+    with timer(stats, "reporting"):
+        table_rows = [["Ticker"] + RESULT_HEADER]
+        for ticker, results in zip(transactions_by_ticker, results_per_ticker):
+            for row in result_rows(results, config[CAPTIAL_GAINS_TAX_RATE_KEY], config[INCOME_TAX_RATE_KEY], config.get(TAX_TABLE_KEY)):
+                table_rows.append([ticker] + row)
+        print_table(table_rows, spacing=20)
+
 
-    last_transaction_price = None
-    last_transaction_datetime = None
-    for transaction in parse_transactions(transactions_filepath, config):
-        for accountant in accountants:
-            accountant.account_for_transaction(copy.copy(transaction))
-            last_transaction_price = transaction.cost_basis
-            last_transaction_datetime = transaction.datetime
-    if config.get(LAST_DATE_KEY) and config.get(LAST_PRICE_KEY):
-        last_transaction_price = config.get(LAST_PRICE_KEY)
-        last_transaction_datetime = config.get(LAST_DATE_KEY)
+RESULT_HEADER = ["Method Name", "Current Profit", "Total Short Term Profit", "Total Long Term Profit", "Total Tax Burden"]
 
-    print_results(accountants, last_transaction_price, last_transaction_datetime, config[CAPTIAL_GAINS_TAX_RATE_KEY], config[INCOME_TAX_RATE_KEY])
+
+def print_results(results, capital_gains_tax_rate, income_tax_rate, tax_table=None):
+    table_rows = [RESULT_HEADER] + result_rows(results, capital_gains_tax_rate, income_tax_rate, tax_table)
+    print_table(table_rows, spacing=20)
 
 
-def print_results(accountants, last_transaction_price, last_transaction_datetime, capital_gains_tax_rate, income_tax_rate):
+# With a tax_table the tax burden is the sum of the taxes of every year,
+# otherwise the flat rates on the lifetime profits
+def result_rows(results, capital_gains_tax_rate, income_tax_rate, tax_table=None):
     table_rows = []
-    table_rows.append(["Method Name", "Current Profit", "Total Short Term Profit", "Total Long Term Profit", "Total Tax Burden"])
-    for accountant in accountants:
-        tax_method_name = accountant.tax_method_name
-        current_profit = accountant.get_profit()
-        accountant.sell_all_transactions(last_transaction_price, last_transaction_datetime)
-        total_unrealized_short_term_profits = accountant.get_short_term_profit()
-        total_unrealized_long_term_profits = accountant.get_long_term_profit()
+    for result in results:
+        total_unrealized_short_term_profits = result.short_term_profit
+        total_unrealized_long_term_profits = result.long_term_profit
         total_tax_burden = "N/A"
-        if capital_gains_tax_rate is not None and income_tax_rate is not None:
-            if (total_unrealized_long_term_profits + total_unrealized_short_term_profits) <= 0:
-                tax_burden_number = 0
-            elif total_unrealized_long_term_profits > 0 and total_unrealized_short_term_profits > 0:
-                tax_burden_number = total_unrealized_long_term_profits * capital_gains_tax_rate + total_unrealized_short_term_profits * income_tax_rate
-            elif total_unrealized_long_term_profits > 0:
-                tax_burden_number = (total_unrealized_long_term_profits - total_unrealized_short_term_profits) * capital_gains_tax_rate
-            elif total_unrealized_short_term_profits > 0:
-                tax_burden_number = (total_unrealized_short_term_profits - total_unrealized_long_term_profits) * income_tax_rate
+        if tax_table is not None:
+            # None for the optimal row, see optimizer.optimize_tax_burden
+            tax_burden_number = None if result.profits_by_year is None else tax_table.calculate_tax_burden(result.profits_by_year)
+        else:
+            tax_burden_number = calculate_tax_burden(total_unrealized_short_term_profits, total_unrealized_long_term_profits, capital_gains_tax_rate, income_tax_rate)
+        if tax_burden_number is not None:
             total_tax_burden = "{:.2f}".format(tax_burden_number)
 
         table_rows.append(
             [
-                tax_method_name,
-                "{:.2f}".format(current_profit),
+                result.tax_method_name,
+                "{:.2f}".format(result.current_profit),
                 "{:.2f}".format(total_unrealized_short_term_profits),
                 "{:.2f}".format(total_unrealized_long_term_profits),
                 total_tax_burden
             ]
         )
+    return table_rows
+
+
+# the losses each method had disallowed, they are in the cost basis of its lots
+def print_wash_sales(engine):
+    table_rows = [["Method Name", "Wash Sales", "Disallowed Losses"]]
+    for accountant in engine.accountants:
+        table_rows.append(
+            [
+                accountant.get_tax_method_name(),
+                str(accountant.wash_sales.wash_sale_count),
+                "{:.2f}".format(accountant.wash_sales.disallowed_loss),
+            ]
+        )
+    print()
     print_table(table_rows, spacing=20)
 
 
+# a row per method and year, carryforwards are the losses carried into the next
+# year
+def print_yearly_taxes(results, tax_table):
+    table_rows = [["Method Name", "Year", "Short Term Profit", "Long Term Profit", "Loss Deduction", "Carryforward", "Tax Burden"]]
+    for result in results:
+        if result.profits_by_year is None:
+            continue
+        for year_tax in tax_table.calculate_yearly_taxes(result.profits_by_year) or []:
+            table_rows.append(
+                [
+                    result.tax_method_name,
+                    str(year_tax.year),
+                    "{:.2f}".format(year_tax.short_term_profit),
+                    "{:.2f}".format(year_tax.long_term_profit),
+                    "{:.2f}".format(year_tax.loss_deduction),
+                    "{:.2f}".format(year_tax.short_term_carryforward + year_tax.long_term_carryforward),
+                    "{:.2f}".format(year_tax.tax_burden),
+                ]
+            )
+    print()
+    print_table(table_rows, spacing=4)
+
+
+# one table per date, a row per method and price
+def print_sweep_results(sweep_results):
+    table_rows = [["Date", "Method Name", "Price", "Total Short Term Profit", "Total Long Term Profit", "Total Tax Burden"]]
+    for date_index, current_datetime in enumerate(sweep_results[0].datetimes if sweep_results else []):
+        for sweep_result in sweep_results:
+            for price_index, price in enumerate(sweep_result.prices):
+                tax_burden = sweep_result.tax_burden[date_index][price_index]
+                table_rows.append(
+                    [
+                        current_datetime.strftime("%Y/%m/%d"),
+                        sweep_result.tax_method_name,
+                        "{:.2f}".format(price),
+                        "{:.2f}".format(sweep_result.short_term_profit[date_index][price_index]),
+                        "{:.2f}".format(sweep_result.long_term_profit[date_index][price_index]),
+                        "N/A" if tax_burden is None else "{:.2f}".format(tax_burden)
+                    ]
+                )
+    print_table(table_rows, spacing=4)
+
+
+def print_simulation_results(simulation_results):
+    table_rows = [["Method Name", "Mean Tax Burden"] + [f"P{percentile}" for percentile in SIMULATION_PERCENTILES] + ["Win Rate"]]
+    for simulation_result in simulation_results:
+        table_rows.append(
+            [simulation_result.tax_method_name, "{:.2f}".format(simulation_result.get_mean())]
+            + ["{:.2f}".format(tax_burden) for tax_burden in simulation_result.get_percentiles()]
+            + ["{:.1%}".format(simulation_result.win_rate)]
+        )
+    print_table(table_rows, spacing=4)
+
+
+# "parsing" is the time spent producing transactions, which includes reading the
+# rows of the CSV
+def write_stats(stats, stats_filepath):
+    stats.split_time("parsing", "csv_decode", "row_parse")
+    if stats_filepath == "-":
+        json.dump(stats.to_dict(), sys.stdout, indent=2)
+        print()
+        return
+    with open(stats_filepath, "w") as f:
+        json.dump(stats.to_dict(), f, indent=2)
+
+
 def print_table(data, spacing=1):
     max_column_size = []
     for row_index in range(len(data)):
@@ -94,6 +444,152 @@ def print_table(data, spacing=1):
 
 
 if __name__ == "__main__":
-    transaction_filepath = sys.argv[1]
-    config_filepath = sys.argv[2]
-    main(transaction_filepath, config_filepath)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("transactions_path")
+    parser.add_argument("config_path")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--all-tickers",
+        action="store_true",
+        help="report every ticker in the transactions file",
+    )
+    parser.add_argument(
+        "--cache-dir", help="keep the parsed transactions in this directory"
+    )
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="parse the CSV again even if the cache is up to date",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="save the accounting state to this file and only process rows "
+        "appended since the last run",
+    )
+    parser.add_argument(
+        "--sweep-prices",
+        type=parse_sweep_prices,
+        help="liquidation prices to report, e.g. 5:50:5 or 10,20,30",
+    )
+    parser.add_argument(
+        "--sweep-dates",
+        type=parse_sweep_dates,
+        help="liquidation dates for --sweep-prices, e.g. 2025/01/01,2025/06/30",
+    )
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="add the lot selection with the lowest tax burden to the results",
+    )
+    parser.add_argument(
+        "--simulate",
+        type=int,
+        metavar="PATHS",
+        help="simulate the tax burden of --simulate-sells over this many price paths",
+    )
+    parser.add_argument(
+        "--simulate-sells",
+        type=parse_scheduled_sells,
+        help="future sells as date:quantity, e.g. 2025/03/01:100,2025/09/01:50",
+    )
+    parser.add_argument(
+        "--simulate-horizon",
+        type=parse_sweep_dates,
+        help="date the remaining lots are sold on, defaults to the last sell",
+    )
+    parser.add_argument(
+        "--simulate-drift", type=float, default=0.0, help="annual price drift"
+    )
+    parser.add_argument(
+        "--simulate-volatility",
+        type=float,
+        default=0.3,
+        help="annual price volatility",
+    )
+    parser.add_argument(
+        "--simulate-seed", type=int, default=0, help="seed of the price paths"
+    )
+    parser.add_argument(
+        "--stats",
+        metavar="FILE",
+        help="write timings and counters of the run to this file as JSON, - for "
+        "stdout",
+    )
+    parser.add_argument(
+        "--ledger",
+        metavar="FILE",
+        help="write every lot sold by each tax method to this file, JSON lines "
+        "for .jsonl files and CSV otherwise",
+    )
+    parser.add_argument(
+        "--ledger-methods",
+        type=lambda value: value.split(","),
+        help="only write the ledger of these tax methods, e.g. fifo,lifo",
+    )
+    parser.add_argument(
+        "--schwab-equity",
+        metavar="FILE",
+        help="read transactions_path as a Schwab transactions export and merge "
+        "it with this equity awards export, see schwab/",
+    )
+    parser.add_argument(
+        "--schwab-output",
+        metavar="FILE",
+        help="also write the merged Schwab transactions to this file",
+    )
+    parser.add_argument(
+        "--wash-sales",
+        action="store_true",
+        help="disallow the losses of sells with a buy within 30 days and add them "
+        "to the cost basis of the shares bought",
+    )
+    parser.add_argument(
+        "--tax-years",
+        action="store_true",
+        help="print each method's taxes per year, with losses netted and carried "
+        "forward",
+    )
+    parser.add_argument(
+        "--account",
+        nargs=2,
+        action="append",
+        metavar=("TRANSACTIONS", "CONFIG"),
+        help="also read the transactions of another account, with the columns of "
+        "its own config, and merge them by date (can be repeated)",
+    )
+
+    args = parser.parse_args()
+    simulation = None
+    if args.simulate:
+        if not args.simulate_sells:
+            parser.error("--simulate needs --simulate-sells")
+        simulation = SimulationSettings(
+            args.simulate,
+            args.simulate_sells,
+            args.simulate_horizon[0] if args.simulate_horizon else None,
+            args.simulate_drift,
+            args.simulate_volatility,
+            args.simulate_seed,
+        )
+    settings = RunSettings(
+        jobs=args.jobs,
+        all_tickers=args.all_tickers,
+        cache_dir=args.cache_dir,
+        rebuild_cache=args.rebuild_cache,
+        checkpoint_filepath=args.checkpoint,
+        sweep_prices=args.sweep_prices,
+        sweep_datetimes=args.sweep_dates,
+        optimize=args.optimize,
+        simulation=simulation,
+        stats_filepath=args.stats,
+        ledger_filepath=args.ledger,
+        ledger_methods=args.ledger_methods,
+        schwab_equity_filepath=args.schwab_equity,
+        schwab_output_filepath=args.schwab_output,
+        wash_sales=args.wash_sales,
+        tax_years=args.tax_years,
+        accounts=args.account,
+    )
+    main(args.transactions_path, args.config_path, settings)
@@ -0,0 +1,305 @@
+from itertools import islice
+from math import ceil, sqrt
+
+
+# Min cost flow by the (primal) network simplex method: a spanning tree of the
+# edges carries the flow, each pivot brings in one edge with a negative reduced
+# cost and drops the first edge that blocks the cycle it closes. Edges are
+# priced in blocks of about sqrt(edge count), so a pivot only looks at a small
+# part of the graph.
+#
+# Nodes have supplies (negative for demands) that must balance. Costs should be
+# integers so reduced costs compare exactly, capacities and supplies may be
+# floats.
+class MinCostFlow:
+    def __init__(self, node_count):
+        self.node_count = node_count
+        self.supply = [0] * node_count
+        self.edge_source = []
+        self.edge_target = []
+        self.edge_capacity = []
+        self.edge_cost = []
+        self.edge_flow = []
+
+    def add_edge(self, source, target, capacity, cost):
+        self.edge_source.append(source)
+        self.edge_target.append(target)
+        self.edge_capacity.append(capacity)
+        self.edge_cost.append(cost)
+        return len(self.edge_source) - 1
+
+    def add_supply(self, node, supply):
+        self.supply[node] += supply
+
+    def flow(self, edge):
+        return self.edge_flow[edge]
+
+    # Returns the cost of the cheapest flow meeting every supply, raises
+    # ValueError if there is none
+    def solve(self):
+        edge_count = len(self.edge_source)
+        node_count = self.node_count
+        # artificial edges to an extra root node give the first spanning tree
+        big_cost = 3 * (sum(abs(cost) for cost in self.edge_cost) + 1)
+        big_capacity = (
+            3
+            * max(
+                [
+                    sum(
+                        capacity
+                        for capacity in self.edge_capacity
+                        if capacity != float("inf")
+                    ),
+                    sum(abs(supply) for supply in self.supply),
+                ]
+            )
+            + 1
+        )
+        root = node_count
+        source = list(self.edge_source)
+        target = list(self.edge_target)
+        capacity = [min(capacity, big_capacity) for capacity in self.edge_capacity]
+        cost = list(self.edge_cost)
+        flow = [0] * edge_count
+        potential = [0] * (node_count + 1)
+        for node, supply in enumerate(self.supply):
+            # zero supply nodes point at the root too, keeping the tree strongly
+            # feasible
+            if supply >= 0:
+                source.append(node)
+                target.append(root)
+                potential[node] = big_cost
+            else:
+                source.append(root)
+                target.append(node)
+                potential[node] = -big_cost
+            capacity.append(big_capacity)
+            cost.append(big_cost)
+            flow.append(abs(supply))
+
+        tree = SpanningTree(node_count, edge_count)
+        for edge, start, end in self.entering_edges(
+            source, target, cost, flow, potential
+        ):
+            cycle_nodes, cycle_edges = tree.find_cycle(edge, start, end)
+            leaving_edge, leaving_start = None, None
+            leaving_capacity = None
+            # the last blocking edge in cycle order keeps the tree strongly feasible
+            for cycle_edge, cycle_node in zip(
+                reversed(cycle_edges), reversed(cycle_nodes)
+            ):
+                if source[cycle_edge] == cycle_node:
+                    residual = capacity[cycle_edge] - flow[cycle_edge]
+                else:
+                    residual = flow[cycle_edge]
+                if leaving_capacity is None or residual < leaving_capacity:
+                    leaving_capacity = residual
+                    leaving_edge = cycle_edge
+                    leaving_start = cycle_node
+            if leaving_capacity:
+                for cycle_edge, cycle_node in zip(cycle_edges, cycle_nodes):
+                    if source[cycle_edge] == cycle_node:
+                        flow[cycle_edge] += leaving_capacity
+                    else:
+                        flow[cycle_edge] -= leaving_capacity
+            if leaving_edge == edge:
+                continue
+            if source[leaving_edge] == leaving_start:
+                leaving_end = target[leaving_edge]
+            else:
+                leaving_end = source[leaving_edge]
+            if tree.parent[leaving_end] != leaving_start:
+                leaving_start, leaving_end = leaving_end, leaving_start
+            if cycle_edges.index(edge) > cycle_edges.index(leaving_edge):
+                start, end = end, start
+            tree.remove_edge(leaving_start, leaving_end)
+            tree.make_root(end)
+            tree.add_edge(edge, start, end)
+            if end == target[edge]:
+                change = potential[start] - cost[edge] - potential[end]
+            else:
+                change = potential[start] + cost[edge] - potential[end]
+            for node in tree.subtree(end):
+                potential[node] += change
+
+        tolerance = 1e-9 * big_capacity
+        if any(
+            abs(flow[edge]) > tolerance
+            for edge in range(edge_count, edge_count + node_count)
+        ):
+            raise ValueError("No flow meets every supply")
+        self.edge_flow = flow[:edge_count]
+        return sum(
+            edge_cost * edge_flow
+            for edge_cost, edge_flow in zip(self.edge_cost, self.edge_flow)
+        )
+
+    # Yields (edge, start, end) for edges with a negative reduced cost, flow
+    # would go start -> end. Looks at one block of edges at a time and takes the
+    # best edge of the first block with any, until a full round finds none.
+    def entering_edges(self, source, target, cost, flow, potential):
+        total_edge_count = len(source)
+        if not total_edge_count:
+            return
+        block_size = int(ceil(sqrt(total_edge_count)))
+        block_count = (total_edge_count + block_size - 1) // block_size
+        blocks_without_edge = 0
+        block_start = 0
+        while blocks_without_edge < block_count:
+            block_end = block_start + block_size
+            if block_end <= total_edge_count:
+                edges = range(block_start, block_end)
+            else:
+                block_end -= total_edge_count
+                edges = list(range(block_start, total_edge_count)) + list(
+                    range(block_end)
+                )
+            block_start = block_end
+            best_edge = None
+            best_cost = 0
+            for edge in edges:
+                reduced_cost = (
+                    cost[edge] - potential[source[edge]] + potential[target[edge]]
+                )
+                if flow[edge]:
+                    reduced_cost = -reduced_cost
+                if reduced_cost < best_cost:
+                    best_cost = reduced_cost
+                    best_edge = edge
+            if best_edge is None:
+                blocks_without_edge += 1
+                continue
+            blocks_without_edge = 0
+            if flow[best_edge]:
+                yield best_edge, target[best_edge], source[best_edge]
+            else:
+                yield best_edge, source[best_edge], target[best_edge]
+
+
+# The spanning tree of the network simplex, with the nodes threaded in depth
+# first order so that a subtree is a contiguous run of the thread
+class SpanningTree:
+    def __init__(self, node_count, edge_count):
+        root = node_count
+        self.parent = [root] * node_count + [None]
+        self.parent_edge = list(range(edge_count, edge_count + node_count)) + [None]
+        self.subtree_size = [1] * node_count + [node_count + 1]
+        self.next_node = list(range(1, node_count)) + [root, 0]
+        self.previous_node = [root] + list(range(node_count))
+        self.last_descendant = list(range(node_count)) + [node_count - 1]
+
+    def find_apex(self, first, second):
+        parent = self.parent
+        subtree_size = self.subtree_size
+        first_size = subtree_size[first]
+        second_size = subtree_size[second]
+        while True:
+            while first_size < second_size:
+                first = parent[first]
+                first_size = subtree_size[first]
+            while first_size > second_size:
+                second = parent[second]
+                second_size = subtree_size[second]
+            if first == second:
+                return first
+            if first_size == second_size:
+                first = parent[first]
+                first_size = subtree_size[first]
+                second = parent[second]
+                second_size = subtree_size[second]
+
+    def trace_path(self, node, apex):
+        nodes = [node]
+        edges = []
+        while node != apex:
+            edges.append(self.parent_edge[node])
+            node = self.parent[node]
+            nodes.append(node)
+        return nodes, edges
+
+    # The cycle `edge` closes, as nodes and the edges leaving them in the
+    # direction flow would be pushed: start -> end
+    def find_cycle(self, edge, start, end):
+        apex = self.find_apex(start, end)
+        nodes, edges = self.trace_path(start, apex)
+        nodes.reverse()
+        edges.reverse()
+        if edges != [edge]:
+            edges.append(edge)
+        end_nodes, end_edges = self.trace_path(end, apex)
+        del end_nodes[-1]
+        nodes += end_nodes
+        edges += end_edges
+        return nodes, edges
+
+    def subtree(self, node):
+        yield node
+        last = self.last_descendant[node]
+        while node != last:
+            node = self.next_node[node]
+            yield node
+
+    def remove_edge(self, parent_node, node):
+        size = self.subtree_size[node]
+        previous = self.previous_node[node]
+        last = self.last_descendant[node]
+        next_after_last = self.next_node[last]
+        self.parent[node] = None
+        self.parent_edge[node] = None
+        self.next_node[previous] = next_after_last
+        self.previous_node[next_after_last] = previous
+        self.next_node[last] = node
+        self.previous_node[node] = last
+        while parent_node is not None:
+            self.subtree_size[parent_node] -= size
+            if self.last_descendant[parent_node] == last:
+                self.last_descendant[parent_node] = previous
+            parent_node = self.parent[parent_node]
+
+    def make_root(self, node):
+        ancestors = []
+        while node is not None:
+            ancestors.append(node)
+            node = self.parent[node]
+        ancestors.reverse()
+        for ancestor, child in zip(ancestors, islice(ancestors, 1, None)):
+            ancestor_size = self.subtree_size[ancestor]
+            ancestor_last = self.last_descendant[ancestor]
+            child_previous = self.previous_node[child]
+            child_last = self.last_descendant[child]
+            next_after_child_last = self.next_node[child_last]
+            self.parent[ancestor] = child
+            self.parent[child] = None
+            self.parent_edge[ancestor] = self.parent_edge[child]
+            self.parent_edge[child] = None
+            self.subtree_size[ancestor] = ancestor_size - self.subtree_size[child]
+            self.subtree_size[child] = ancestor_size
+            self.next_node[child_previous] = next_after_child_last
+            self.previous_node[next_after_child_last] = child_previous
+            self.next_node[child_last] = child
+            self.previous_node[child] = child_last
+            if ancestor_last == child_last:
+                self.last_descendant[ancestor] = child_previous
+                ancestor_last = child_previous
+            self.previous_node[ancestor] = child_last
+            self.next_node[child_last] = ancestor
+            self.next_node[ancestor_last] = child
+            self.previous_node[child] = ancestor_last
+            self.last_descendant[child] = ancestor_last
+
+    def add_edge(self, edge, parent_node, node):
+        parent_last = self.last_descendant[parent_node]
+        next_after_parent_last = self.next_node[parent_last]
+        size = self.subtree_size[node]
+        last = self.last_descendant[node]
+        self.parent[node] = parent_node
+        self.parent_edge[node] = edge
+        self.next_node[parent_last] = node
+        self.previous_node[node] = parent_last
+        self.previous_node[next_after_parent_last] = last
+        self.next_node[last] = next_after_parent_last
+        while parent_node is not None:
+            self.subtree_size[parent_node] += size
+            if self.last_descendant[parent_node] == parent_last:
+                self.last_descendant[parent_node] = last
+            parent_node = self.parent[parent_node]
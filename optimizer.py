@@ -0,0 +1,404 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+
+from accountant import LONG_TERM_AGE
+from constants import TRANSACTION_BUY, TRANSACTION_SELL
+from engine import AccountingResult
+from min_cost_flow import MinCostFlow
+
+OPTIMAL_TAX_METHOD_NAME = "optimal"
+# a blend of two lot selections, see solve_lowest_tax_burden
+OPTIMAL_BOUND_TAX_METHOD_NAME = "optimal-bound"
+# prices and costs are turned into integers for the flow, micro dollars keep
+# them exact
+PRICE_SCALE = 10**6
+# share quantities below this are rounding noise
+QUANTITY_EPSILON = 1e-9
+
+
+# A buy, `sells_before` is how many sells came before it in the history
+@dataclass
+class Lot:
+    quantity: float
+    cost_basis: float
+    datetime: object
+    sells_before: int
+
+
+@dataclass
+class Sell:
+    quantity: float
+    price: float
+    datetime: object
+
+
+# Lots that can be sold short term to the same sells (`sells_before` up to
+# `long_term_sell`), go long term at the same sell and are short / long term
+# at the liquidation date alike. Within a group only the cost basis differs, so
+# the flow just needs to know how many of its shares are sold long term: those
+# are taken from the lots with the best cost basis first.
+@dataclass
+class LotGroup:
+    sells_before: int
+    long_term_sell: int
+    long_term_at_liquidation: bool
+    lots: list
+
+
+# Every buy and sell of a history plus the liquidation of the open lots at the
+# end, as a flow of shares from lot groups to sells:
+#
+#   group -> segment tree -> sell                 sold short term
+#   group -> long term -> long term chain -> sell  sold long term
+#   group (-> long term) -> liquidation
+#
+# "long term" has one edge per lot priced at its cost basis, the long term chain
+# runs along the sells from the first one the group is long term for, and exits
+# to each sell at its price. The cost of a flow is then +/- the long-term profit.
+class LotSelectionProblem:
+    def __init__(self, transactions, last_price=None, last_datetime=None):
+        self.lots = []
+        self.sells = []
+        last_transaction = None
+        for transaction in transactions:
+            if (
+                last_transaction is not None
+                and transaction.datetime < last_transaction.datetime
+            ):
+                raise ValueError("Transactions must be in date order to optimize")
+            last_transaction = transaction
+            if transaction.transaction_type == TRANSACTION_BUY:
+                self.lots.append(
+                    Lot(
+                        transaction.transaction_size,
+                        transaction.cost_basis,
+                        transaction.datetime,
+                        len(self.sells),
+                    )
+                )
+            elif transaction.transaction_type == TRANSACTION_SELL:
+                self.sells.append(
+                    Sell(
+                        transaction.transaction_size,
+                        transaction.cost_basis,
+                        transaction.datetime,
+                    )
+                )
+        if last_price is None or last_datetime is None:
+            if last_transaction is None:
+                raise ValueError("No transactions to optimize")
+            last_price = last_transaction.cost_basis
+            last_datetime = last_transaction.datetime
+        self.last_price = last_price
+        self.last_datetime = last_datetime
+        self.liquidated_quantity = sum(lot.quantity for lot in self.lots) - sum(
+            sell.quantity for sell in self.sells
+        )
+        if self.liquidated_quantity < -QUANTITY_EPSILON:
+            raise ValueError("More shares were sold than bought")
+        self.groups = self.group_lots()
+
+    def group_lots(self):
+        sell_datetimes = [sell.datetime for sell in self.sells]
+        groups = {}
+        for lot in self.lots:
+            long_term_sell = max(
+                lot.sells_before,
+                bisect_left(sell_datetimes, lot.datetime + LONG_TERM_AGE),
+            )
+            long_term_at_liquidation = (
+                self.last_datetime - lot.datetime >= LONG_TERM_AGE
+            )
+            key = (lot.sells_before, long_term_sell, long_term_at_liquidation)
+            if key not in groups:
+                groups[key] = LotGroup(*key, [])
+            groups[key].lots.append(lot)
+        return list(groups.values())
+
+    # short term + long term profit, the same for every way of picking lots
+    def get_total_profit(self):
+        return (
+            sum(sell.price * sell.quantity for sell in self.sells)
+            + self.last_price * self.liquidated_quantity
+            - sum(lot.cost_basis * lot.quantity for lot in self.lots)
+        )
+
+    # The AccountingResult of the lot selection with the most (or least)
+    # long-term profit
+    def solve(self, maximize_long_term):
+        sign = -1 if maximize_long_term else 1
+        sell_count = len(self.sells)
+        network = LotSelectionNetwork(sell_count, len(self.groups))
+        flow_graph = network.flow_graph
+        infinity = float("inf")
+
+        group_lot_edges = []
+        group_liquidation_edges = []
+        for group_index, group in enumerate(self.groups):
+            group_node = network.group_node(group_index)
+            long_term_node = network.group_long_term_node(group_index)
+            flow_graph.add_supply(group_node, sum(lot.quantity for lot in group.lots))
+            for node in network.sell_range_nodes(
+                group.sells_before, group.long_term_sell
+            ):
+                flow_graph.add_edge(group_node, node, infinity, 0)
+            group_lot_edges.append(
+                [
+                    flow_graph.add_edge(
+                        group_node,
+                        long_term_node,
+                        lot.quantity,
+                        -sign * scale_price(lot.cost_basis),
+                    )
+                    for lot in group.lots
+                ]
+            )
+            if group.long_term_sell < sell_count:
+                flow_graph.add_edge(
+                    long_term_node,
+                    network.chain_node(group.long_term_sell),
+                    infinity,
+                    0,
+                )
+            if group.long_term_at_liquidation:
+                liquidation_cost = sign * scale_price(self.last_price)
+                liquidation_source = long_term_node
+            else:
+                liquidation_cost = 0
+                liquidation_source = group_node
+            group_liquidation_edges.append(
+                flow_graph.add_edge(
+                    liquidation_source,
+                    network.liquidation,
+                    infinity,
+                    liquidation_cost,
+                )
+            )
+
+        sell_long_term_edges = []
+        for sell_index, sell in enumerate(self.sells):
+            chain_node = network.chain_node(sell_index)
+            if sell_index + 1 < sell_count:
+                flow_graph.add_edge(
+                    chain_node, network.chain_node(sell_index + 1), infinity, 0
+                )
+            sell_long_term_edges.append(
+                flow_graph.add_edge(
+                    chain_node,
+                    network.sell_node(sell_index),
+                    infinity,
+                    sign * scale_price(sell.price),
+                )
+            )
+            flow_graph.add_supply(network.sell_node(sell_index), -sell.quantity)
+        flow_graph.add_supply(network.liquidation, -self.liquidated_quantity)
+
+        try:
+            flow_graph.solve()
+        except ValueError:
+            raise ValueError("Some sells have fewer shares bought before them")
+
+        short_term_profit = 0
+        long_term_profit = 0
+        realized_cost = 0
+        for group, lot_edges, liquidation_edge in zip(
+            self.groups, group_lot_edges, group_liquidation_edges
+        ):
+            long_term_quantities = [flow_graph.flow(edge) for edge in lot_edges]
+            short_term_quantities = [
+                lot.quantity - quantity
+                for lot, quantity in zip(group.lots, long_term_quantities)
+            ]
+            liquidated = flow_graph.flow(liquidation_edge)
+            for lot, long_term_quantity, short_term_quantity in zip(
+                group.lots, long_term_quantities, short_term_quantities
+            ):
+                long_term_profit -= lot.cost_basis * long_term_quantity
+                short_term_profit -= lot.cost_basis * short_term_quantity
+            if group.long_term_at_liquidation:
+                long_term_profit += self.last_price * liquidated
+                sold_long_term = sum(long_term_quantities) - liquidated
+                sold_short_term = sum(short_term_quantities)
+            else:
+                short_term_profit += self.last_price * liquidated
+                sold_long_term = sum(long_term_quantities)
+                sold_short_term = sum(short_term_quantities) - liquidated
+            # which lots of the group were sold and which are still open does not
+            # change the taxes, count the earliest lots as sold
+            realized_cost += first_in_cost(
+                group.lots, long_term_quantities, sold_long_term
+            ) + first_in_cost(group.lots, short_term_quantities, sold_short_term)
+
+        for sell, long_term_edge in zip(self.sells, sell_long_term_edges):
+            long_term_quantity = flow_graph.flow(long_term_edge)
+            long_term_profit += sell.price * long_term_quantity
+            short_term_profit += sell.price * (sell.quantity - long_term_quantity)
+
+        current_profit = (
+            sum(sell.price * sell.quantity for sell in self.sells) - realized_cost
+        )
+        return AccountingResult(
+            OPTIMAL_TAX_METHOD_NAME,
+            current_profit,
+            short_term_profit,
+            long_term_profit,
+        )
+
+
+# Node numbering of the flow graph of LotSelectionProblem.solve. Sells are the
+# leaves of a segment tree, so a group reaches a range of sells through
+# O(log sells) edges.
+class LotSelectionNetwork:
+    def __init__(self, sell_count, group_count):
+        self.sell_count = sell_count
+        self.group_count = group_count
+        self.liquidation = 0
+        self.first_group_node = 1
+        self.first_chain_node = self.first_group_node + 2 * group_count
+        self.first_sell_node = self.first_chain_node + sell_count
+        self.first_tree_node = self.first_sell_node + sell_count
+        # tree node i covers [tree_start[i], tree_end[i]) and has children 2i + 1
+        # and 2i + 2 unless it is a leaf
+        self.tree_start = []
+        self.tree_end = []
+        self.tree_size = 0
+        if sell_count:
+            self.tree_size = self.count_tree_nodes(0, 0, sell_count)
+        self.flow_graph = MinCostFlow(self.first_tree_node + self.tree_size)
+        if sell_count:
+            self.add_tree_edges(0, 0, sell_count)
+
+    def count_tree_nodes(self, tree_index, start, end):
+        if tree_index >= len(self.tree_start):
+            self.tree_start.extend([0] * (tree_index + 1 - len(self.tree_start)))
+            self.tree_end.extend([0] * (tree_index + 1 - len(self.tree_end)))
+        self.tree_start[tree_index] = start
+        self.tree_end[tree_index] = end
+        if end - start == 1:
+            return tree_index + 1
+        middle = (start + end) // 2
+        return max(
+            self.count_tree_nodes(2 * tree_index + 1, start, middle),
+            self.count_tree_nodes(2 * tree_index + 2, middle, end),
+        )
+
+    def add_tree_edges(self, tree_index, start, end):
+        node = self.tree_node(tree_index)
+        if end - start == 1:
+            self.flow_graph.add_edge(node, self.sell_node(start), float("inf"), 0)
+            return
+        middle = (start + end) // 2
+        for child, child_start, child_end in [
+            (2 * tree_index + 1, start, middle),
+            (2 * tree_index + 2, middle, end),
+        ]:
+            self.flow_graph.add_edge(node, self.tree_node(child), float("inf"), 0)
+            self.add_tree_edges(child, child_start, child_end)
+
+    # tree nodes exactly covering the sells [start, end)
+    def sell_range_nodes(self, start, end):
+        nodes = []
+        if start >= end:
+            return nodes
+        stack = [0]
+        while stack:
+            tree_index = stack.pop()
+            node_start = self.tree_start[tree_index]
+            node_end = self.tree_end[tree_index]
+            if node_end <= start or end <= node_start:
+                continue
+            if start <= node_start and node_end <= end:
+                nodes.append(self.tree_node(tree_index))
+                continue
+            stack.append(2 * tree_index + 2)
+            stack.append(2 * tree_index + 1)
+        return nodes
+
+    def group_node(self, group_index):
+        return self.first_group_node + 2 * group_index
+
+    def group_long_term_node(self, group_index):
+        return self.first_group_node + 2 * group_index + 1
+
+    def chain_node(self, sell_index):
+        return self.first_chain_node + sell_index
+
+    def sell_node(self, sell_index):
+        return self.first_sell_node + sell_index
+
+    def tree_node(self, tree_index):
+        return self.first_tree_node + tree_index
+
+
+def scale_price(price):
+    return round(price * PRICE_SCALE)
+
+
+# cost of the first `quantity` shares of `lots`, taking at most quantities[i]
+# from lots[i]
+def first_in_cost(lots, quantities, quantity):
+    cost = 0
+    for lot, lot_quantity in zip(lots, quantities):
+        if quantity <= QUANTITY_EPSILON:
+            break
+        used = min(lot_quantity, quantity)
+        cost += lot.cost_basis * used
+        quantity -= used
+    return cost
+
+
+# The lot selection over the whole history with the lowest calculate_tax_burden,
+# or a lower bound on that burden. With every lot sold in the end, short + long
+# term profit is fixed and the tax burden is a convex function of the long-term
+# profit alone: lowest with all of the profit long term (or short term if that
+# rate is lower). So the selections with the most and least long-term profit
+# bound what is possible. When one of them reaches the best split it is the
+# optimum. Otherwise the result blends the two as if lots were split into
+# fractional shares. No selection of whole lots has a lower tax burden, but the
+# blend may not be a selection that can be carried out, so it is named
+# OPTIMAL_BOUND_TAX_METHOD_NAME.
+def optimize_tax_burden(
+    transactions,
+    last_price=None,
+    last_datetime=None,
+    capital_gains_tax_rate=None,
+    income_tax_rate=None,
+):
+    problem = LotSelectionProblem(transactions, last_price, last_datetime)
+    # sells are not told apart by year here, so there are no profits_by_year and
+    # no tax burden with a taxes.TaxTable
+    return solve_lowest_tax_burden(problem, capital_gains_tax_rate, income_tax_rate)
+
+
+def solve_lowest_tax_burden(problem, capital_gains_tax_rate, income_tax_rate):
+    total_profit = problem.get_total_profit()
+    if (
+        capital_gains_tax_rate is not None
+        and income_tax_rate is not None
+        and income_tax_rate < capital_gains_tax_rate
+    ):
+        target_long_term_profit = 0
+    else:
+        target_long_term_profit = total_profit
+
+    most_long_term = problem.solve(maximize_long_term=True)
+    # nothing to pay when there is no profit at all
+    if total_profit <= 0 or most_long_term.long_term_profit <= target_long_term_profit:
+        return most_long_term
+    least_long_term = problem.solve(maximize_long_term=False)
+    if least_long_term.long_term_profit >= target_long_term_profit:
+        return least_long_term
+
+    share = (target_long_term_profit - least_long_term.long_term_profit) / (
+        most_long_term.long_term_profit - least_long_term.long_term_profit
+    )
+    return AccountingResult(
+        OPTIMAL_BOUND_TAX_METHOD_NAME,
+        blend(least_long_term.current_profit, most_long_term.current_profit, share),
+        total_profit - target_long_term_profit,
+        target_long_term_profit,
+    )
+
+
+def blend(start, end, share):
+    return start + (end - start) * share
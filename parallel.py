@@ -0,0 +1,56 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import run_tax_methods
+from tax_methods import tax_methods as default_tax_methods
+from transaction import pack_transactions, unpack_transactions
+
+
+def split_tax_methods(tax_methods, number_of_chunks):
+    number_of_chunks = max(1, min(number_of_chunks, len(tax_methods)))
+    return [tax_methods[i::number_of_chunks] for i in range(number_of_chunks)]
+
+
+def run_packed_tax_methods(packed_transactions, tax_methods, last_price, last_datetime):
+    transactions = unpack_transactions(packed_transactions)
+    return run_tax_methods(transactions, last_price, last_datetime, tax_methods)
+
+
+# Evaluates (packed transactions, last price, last datetime) work items in a
+# process pool, spreading the tax methods of every item over the workers.
+# Returns the results of each work item in input order, with the methods in
+# `tax_methods` order, whatever order the workers finish in.
+def run_work_items_parallel(work_items, jobs, tax_methods=None):
+    if tax_methods is None:
+        tax_methods = default_tax_methods
+    chunks = split_tax_methods(tax_methods, jobs)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            [
+                executor.submit(
+                    run_packed_tax_methods,
+                    packed_transactions,
+                    chunk,
+                    last_price,
+                    last_datetime,
+                )
+                for chunk in chunks
+            ]
+            for packed_transactions, last_price, last_datetime in work_items
+        ]
+        all_results = []
+        for item_futures in futures:
+            results_by_name = {}
+            for future in item_futures:
+                for result in future.result():
+                    results_by_name[result.tax_method_name] = result
+            all_results.append(
+                [results_by_name[tax_method.name] for tax_method in tax_methods]
+            )
+    return all_results
+
+
+def run_tax_methods_parallel(
+    transactions, jobs, last_price=None, last_datetime=None, tax_methods=None
+):
+    work_item = (pack_transactions(transactions), last_price, last_datetime)
+    return run_work_items_parallel([work_item], jobs, tax_methods)[0]
@@ -1,9 +1,21 @@
+import codecs
+import copy
 import csv
+import heapq
 import json
+import locale
 import logging
+import os
+import queue
+import threading
+from dataclasses import dataclass
 from datetime import datetime
+from operator import itemgetter
 
 from transaction import Transaction
+from corporate_actions import read_corporate_actions
+from stats import Stats
+from taxes import TaxTable, get_flat_tax_year, parse_tax_years
 from constants import *
 
 
@@ -44,92 +56,607 @@ def parse_config(filepath):
         else:
             config[INCOME_TAX_RATE_KEY] = None
 
+        tax_years_value = config.get(TAX_YEARS_KEY)
+        if tax_years_value:
+            config[TAX_TABLE_KEY] = TaxTable(
+                parse_tax_years(
+                    tax_years_value,
+                    config[CAPTIAL_GAINS_TAX_RATE_KEY],
+                    config[INCOME_TAX_RATE_KEY],
+                ),
+                get_flat_tax_year(
+                    config[CAPTIAL_GAINS_TAX_RATE_KEY],
+                    config[INCOME_TAX_RATE_KEY],
+                    config.get(CAPITAL_LOSS_LIMIT_KEY),
+                ),
+                config.get(CAPITAL_LOSS_LIMIT_KEY),
+            )
 
+        corporate_actions_value = config.get(CORPORATE_ACTIONS_FILE_KEY)
+        if corporate_actions_value:
+            # relative to the config file
+            config[CORPORATE_ACTIONS_KEY] = read_corporate_actions(
+                os.path.join(os.path.dirname(filepath), corporate_actions_value)
+            )
 
         # todo: add a bunch of error checking here for the various required files
+        config[TRANSACTION_PARSER_KEY] = TransactionParser(config)
         return config
 
 
-def parse_transactions(transactions_filepath, config):
+# Reads the config of another transactions file (another account) to parse
+# along with the one of `config`: its own columns, date format and transaction
+# type values. The ticker to track defaults to that of `config`. Corporate
+# actions are applied once to the merged transactions, so they come from
+# `config`: another corporate actions file is an error.
+def parse_source_config(filepath, config):
+    with open(filepath) as f:
+        source_config = json.load(f)
+    corporate_actions_value = source_config.get(CORPORATE_ACTIONS_FILE_KEY)
+    if corporate_actions_value:
+        corporate_actions = config.get(CORPORATE_ACTIONS_KEY)
+        corporate_actions_filepath = os.path.abspath(
+            os.path.join(os.path.dirname(filepath), corporate_actions_value)
+        )
+        if corporate_actions is None or corporate_actions_filepath != (
+            os.path.abspath(corporate_actions.filepath)
+        ):
+            raise ValueError(
+                f"{filepath} has its own {CORPORATE_ACTIONS_FILE_KEY}, corporate "
+                "actions apply to every account and belong in the main config"
+            )
+    for key in [TICKER_TO_TRACK_KEY, TICKERS_TO_TRACK_KEY, CORPORATE_ACTIONS_KEY]:
+        if source_config.get(key) is None and config.get(key) is not None:
+            source_config[key] = config[key]
+    source_config[TRANSACTION_PARSER_KEY] = TransactionParser(source_config)
+    return source_config
+
+
+# A transactions file with the config to parse it with
+@dataclass
+class TransactionSource:
+    filepath: str
+    config: dict
+
+
+# `transactions_filepath` is a file or a list of TransactionSource (or files
+# parsed with `config`) that are merged by date, see parse_sources.
+# `position` resumes parsing part way through a single file, see ParsePosition.
+def parse_transactions(transactions_filepath, config, position=None):
     if not config:
         raise Exception("Bad configuration input")
 
-    with open(transactions_filepath, newline="") as csvfile:
-        reader = csv.DictReader(csvfile)
-        for i, row in enumerate(reader):
-            transaction = parse_transaction(row, config, i + 2)
-            if not transaction:
-                continue
-            yield transaction
+    if isinstance(transactions_filepath, (list, tuple)):
+        if position is not None:
+            raise ValueError("Only a single transactions file can be resumed")
+        pairs = parse_sources(
+            get_sources(transactions_filepath, config), accept_ticker_to_track
+        )
+    else:
+        transaction_parser = get_transaction_parser(config)
+        pairs = transaction_parser.parse_file(
+            transactions_filepath, accept_ticker_to_track(transaction_parser), position
+        )
+    for _, transaction in pairs:
+        yield transaction
+
+
+def accept_ticker_to_track(transaction_parser):
+    ticker_to_track = transaction_parser.ticker_to_track
+    return lambda ticker: ticker == ticker_to_track
+
+
+# Reads the CSV once and splits the transactions per ticker. `tickers` limits
+# the result to those tickers, otherwise every ticker in the file is returned.
+# Several files are merged as in parse_transactions.
+def parse_transactions_by_ticker(transactions_filepath, config, tickers=None):
+    if not config:
+        raise Exception("Bad configuration input")
+
+    transactions_by_ticker = {}
+    if tickers is None:
+        accept_ticker = bool
+    else:
+        for ticker in tickers:
+            transactions_by_ticker[ticker] = []
+        accept_ticker = transactions_by_ticker.__contains__
+    if isinstance(transactions_filepath, (list, tuple)):
+        pairs = parse_sources(
+            get_sources(transactions_filepath, config), lambda _: accept_ticker
+        )
+    else:
+        pairs = get_transaction_parser(config).parse_file(
+            transactions_filepath, accept_ticker
+        )
+    for ticker, transaction in pairs:
+        ticker_transactions = transactions_by_ticker.get(ticker)
+        if ticker_transactions is None:
+            ticker_transactions = transactions_by_ticker[ticker] = []
+        ticker_transactions.append(transaction)
+    if tickers is None:
+        # tickers that only had unrelated transaction types
+        transactions_by_ticker = {
+            ticker: transactions
+            for ticker, transactions in transactions_by_ticker.items()
+            if transactions
+        }
+    return transactions_by_ticker
 
 
 def parse_transaction(transaction_row, config, line_number):
+    transaction_parser = get_transaction_parser(config)
     if transaction_row.get(config[TICKER_COLUMN_KEY]) != config[TICKER_TO_TRACK_KEY]:
         logger.info(
             f"Skipping line number {line_number} - unrelated transaction to ticker"
         )
         return
-    transaction_type = transaction_row.get(config[TRANSACTION_TYPE_KEY])
-    if transaction_type not in config.get(
-        TRANSACTION_BUY_VALUE, []
-    ) and transaction_type not in config.get(TRANSACTION_SELL_VALUE, []):
-        logger.info(f"Skipping line number {line_number} - unrelated transaction type")
-        return
-    # transaction datetime
-    datetime_raw = transaction_row.get(config[DATE_COLUMN_KEY])
-    datetime_format = config[DATE_FORMAT_KEY]
-    if not datetime_raw:
-        logger.error(f"Datetime not found on line {line_number}")
-        return None
-
-    datetime_value = datetime.strptime(datetime_raw, datetime_format)
-    if not datetime_value:
-        logger.error(
-            f"Datetime ({datetime_raw}) unable to be parsed by {datetime_format} on line {line_number}"
+    return transaction_parser.parse_values(
+        *transaction_parser.dict_row_values(transaction_row), line_number
+    )
+
+
+def parse_transaction_fields(transaction_row, config, line_number):
+    transaction_parser = get_transaction_parser(config)
+    return transaction_parser.parse_values(
+        *transaction_parser.dict_row_values(transaction_row), line_number
+    )
+
+
+# Config values that change what parse_transactions returns for a file.
+PARSING_CONFIG_KEYS = [
+    DATE_COLUMN_KEY,
+    DATE_FORMAT_KEY,
+    TICKER_COLUMN_KEY,
+    QUANTITY_COLUMN_KEY,
+    SECURITY_PRICE_COLUMN_KEY,
+    TRANSACTION_TYPE_KEY,
+    TRANSACTION_BUY_VALUE,
+    TRANSACTION_SELL_VALUE,
+    TRANSACTION_SPLIT_VALUE,
+    CORPORATE_ACTIONS_FILE_KEY,
+]
+
+
+def get_parsing_config(config):
+    return {key: config.get(key) for key in PARSING_CONFIG_KEYS}
+
+
+# Where parse_transactions stopped reading a file: the byte offset just past the
+# last complete line and the line number of the last row on it.
+@dataclass
+class ParsePosition:
+    offset: int = 0
+    line_number: int = 1
+
+
+# Iterates the decoded lines of a binary file, keeping track of the offset of
+# the bytes read so far. csv.reader only asks for a line once it has finished
+# the previous row, so after every row `offset` is where that row ended.
+class LineReader:
+    def __init__(self, binary_file, encoding, offset=0):
+        self.binary_file = binary_file
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.offset = offset
+        self.complete_offset = offset
+
+    def __iter__(self):
+        decode = self.decoder.decode
+        for line in self.binary_file:
+            self.offset += len(line)
+            if line.endswith(b"\n"):
+                self.complete_offset = self.offset
+            yield decode(line)
+
+
+def get_sources(transactions_filepaths, config):
+    return [
+        (
+            source
+            if isinstance(source, TransactionSource)
+            else TransactionSource(source, config)
         )
-        return None
+        for source in transactions_filepaths
+    ]
 
-    # transaction size
-    transaction_size_raw = transaction_row.get(config[QUANTITY_COLUMN_KEY])
-    if not transaction_size_raw:
-        logger.error(f"Quantity not found on line {line_number}")
-        return None
-    try:
-        transaction_size_value = int(transaction_size_raw)
-    except ValueError:
-        logger.error(
-            f"Quantity ({transaction_size_raw}) is not an integer value on line {line_number}"
+
+# Transactions per batch and batches per queue of a SourceReader
+SOURCE_BATCH_SIZE = 1024
+SOURCE_QUEUE_SIZE = 4
+
+
+# Parses a transactions file in a thread into a bounded queue of batches of
+# (ticker, transaction), iterating it yields them back. The thread waits while
+# the queue is full, so at most SOURCE_QUEUE_SIZE + 1 batches are held. With
+# stats the thread counts into stats of its own, added to the parser's once it
+# is stopped.
+class SourceReader:
+    def __init__(self, transactions_filepath, transaction_parser, accept_ticker):
+        self.transactions_filepath = transactions_filepath
+        self.stats = transaction_parser.stats
+        if self.stats is not None:
+            transaction_parser = copy.copy(transaction_parser)
+            transaction_parser.stats = Stats()
+        self.transaction_parser = transaction_parser
+        self.accept_ticker = accept_ticker
+        self.queue = queue.Queue(SOURCE_QUEUE_SIZE)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.read, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    # Lets the thread exit without reading the rest of the file. Only the
+    # counts of the thread are kept, its timers overlap the time the merge
+    # waited on it.
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        if self.stats is not None:
+            self.stats.add_counters(self.transaction_parser.stats)
+
+    def read(self):
+        try:
+            batch = []
+            last_datetime = None
+            warned = False
+            for pair in self.transaction_parser.parse_file(
+                self.transactions_filepath, self.accept_ticker
+            ):
+                transaction_datetime = pair[1].datetime
+                # only warned once
+                if (
+                    not warned
+                    and last_datetime is not None
+                    and transaction_datetime < last_datetime
+                ):
+                    logger.warning(
+                        f"{self.transactions_filepath} is not in ascending date order, "
+                        "the merged transactions will not be either"
+                    )
+                    warned = True
+                last_datetime = transaction_datetime
+                batch.append(pair)
+                if len(batch) == SOURCE_BATCH_SIZE:
+                    if not self.put(batch):
+                        return
+                    batch = []
+            if batch and not self.put(batch):
+                return
+            self.put(None)
+        except Exception as e:
+            self.put(e)
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield from batch
+
+
+# Yields the (ticker, transaction) of every source, each in ascending date
+# order, as one stream in date order. Every file is read concurrently by a
+# SourceReader and the readers are k-way merged, so the memory used grows with
+# the number of files and not their rows. Transactions on the same date keep
+# the order of the sources. `get_accept_ticker` returns the accept_ticker of
+# TransactionParser.parse_file for the parser of a source.
+def parse_sources(sources, get_accept_ticker):
+    readers = []
+    for source in sources:
+        transaction_parser = get_transaction_parser(source.config)
+        readers.append(
+            SourceReader(
+                source.filepath,
+                transaction_parser,
+                get_accept_ticker(transaction_parser),
+            )
         )
-        return None
-
-    # transaction cost
-    cost_basis_raw = transaction_row.get(config[SECURITY_PRICE_COLUMN_KEY])
-    if not cost_basis_raw:
-        logger.error(f"Transaction cost not found on line {line_number}")
-        return None
-    cost_basis_raw_number = cost_basis_raw.replace("$", "")
+    for reader in readers:
+        reader.start()
     try:
-        cost_basis_value = float(cost_basis_raw_number)
-    except ValueError:
-        logger.error(
-            f"Security price ({cost_basis_raw_number}) is not a number on line {line_number}"
+        yield from heapq.merge(*readers, key=lambda pair: pair[1].datetime)
+    finally:
+        for reader in readers:
+            reader.stop()
+
+
+def get_transaction_parser(config):
+    transaction_parser = config.get(TRANSACTION_PARSER_KEY)
+    if transaction_parser is None:
+        transaction_parser = TransactionParser(config)
+    return transaction_parser
+
+
+# Date formats that can be split on a separator instead of going through
+# strptime, with the position of the (year, month, day) parts.
+FAST_DATE_FORMATS = {
+    "%m/%d/%Y": ("/", (2, 0, 1)),
+    "%d/%m/%Y": ("/", (2, 1, 0)),
+    "%Y/%m/%d": ("/", (0, 1, 2)),
+    "%m-%d-%Y": ("-", (2, 0, 1)),
+    "%Y-%m-%d": ("-", (0, 1, 2)),
+}
+DATE_CACHE_SIZE = 100_000
+
+
+def is_ascii_number(value, max_length):
+    return 0 < len(value) <= max_length and value.isascii() and value.isdigit()
+
+
+# Parses dates for a single format. Exports repeat the same few hundred dates,
+# so parsed values are memoized by their raw string.
+class DateParser:
+    def __init__(self, date_format):
+        self.date_format = date_format
+        self.fast_format = FAST_DATE_FORMATS.get(date_format)
+        self.cache = {}
+
+    def parse(self, value):
+        parsed_value = self.cache.get(value)
+        if parsed_value is None:
+            parsed_value = self.parse_fast(value)
+            if parsed_value is None:
+                parsed_value = datetime.strptime(value, self.date_format)
+            if len(self.cache) < DATE_CACHE_SIZE:
+                self.cache[value] = parsed_value
+        return parsed_value
+
+    def parse_fast(self, value):
+        if self.fast_format is None:
+            return None
+        separator, (year_index, month_index, day_index) = self.fast_format
+        parts = value.split(separator)
+        if len(parts) != 3:
+            return None
+        year, month, day = parts[year_index], parts[month_index], parts[day_index]
+        if not (
+            len(year) == 4
+            and is_ascii_number(year, 4)
+            and is_ascii_number(month, 2)
+            and is_ascii_number(day, 2)
+        ):
+            return None
+        try:
+            return datetime(int(year), int(month), int(day))
+        except ValueError:
+            # let strptime raise its usual error
+            return None
+
+
+# Config compiled for parsing: column names, frozensets of transaction type
+# values and a memoizing date parser. Column positions are resolved once per
+# file from the header row.
+class TransactionParser:
+    def __init__(self, config):
+        self.ticker_column = config[TICKER_COLUMN_KEY]
+        self.ticker_to_track = config.get(TICKER_TO_TRACK_KEY)
+        self.transaction_type_column = config[TRANSACTION_TYPE_KEY]
+        self.date_column = config[DATE_COLUMN_KEY]
+        self.quantity_column = config[QUANTITY_COLUMN_KEY]
+        self.security_price_column = config[SECURITY_PRICE_COLUMN_KEY]
+        self.buy_values = frozenset(config.get(TRANSACTION_BUY_VALUE, []))
+        self.sell_values = frozenset(config.get(TRANSACTION_SELL_VALUE, []))
+        self.split_values = frozenset(config.get(TRANSACTION_SPLIT_VALUE, []))
+        # old tickers -> the tracked ticker they were renamed to
+        corporate_actions = config.get(CORPORATE_ACTIONS_KEY)
+        self.ticker_aliases = (
+            {} if corporate_actions is None else corporate_actions.get_ticker_aliases()
         )
-        return None
-
-    # transaction type
-    transaction_type_raw = transaction_row.get(config[TRANSACTION_TYPE_KEY])
-    if transaction_type_raw in config[TRANSACTION_BUY_VALUE]:
-        transaction_type_value = TRANSACTION_BUY
-    elif transaction_type_raw in config[TRANSACTION_SELL_VALUE]:
-        transaction_type_value = TRANSACTION_SELL
-    else:
-        logger.error(
-            f"Transaction type ({transaction_type_raw}) is not defined in the config on line {line_number}"
+        self.date_parser = DateParser(config[DATE_FORMAT_KEY])
+        # a stats.Stats to count skipped rows in and time the csv decoding with
+        self.stats = None
+
+    def columns(self):
+        return [
+            self.ticker_column,
+            self.transaction_type_column,
+            self.date_column,
+            self.quantity_column,
+            self.security_price_column,
+        ]
+
+    def dict_row_values(self, transaction_row):
+        return [transaction_row.get(column) for column in self.columns()]
+
+    # Yields (ticker, transaction) for every buy, sell or split row of a ticker
+    # that passes accept_ticker, logs and skips the rest. Renamed tickers are
+    # yielded (and passed to accept_ticker) under their new name.
+    #
+    # With a `position` parsing starts at position.offset and the position is
+    # moved past every complete (newline terminated) line that was read.
+    def parse_file(self, transactions_filepath, accept_ticker, position=None):
+        if position is not None:
+            yield from self.parse_file_from(
+                transactions_filepath, accept_ticker, position
+            )
+            return
+        with open(transactions_filepath, newline="") as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, None)
+            if header is None:
+                return
+            yield from self.parse_rows(header, reader, accept_ticker, 1)
+
+    def parse_file_from(self, transactions_filepath, accept_ticker, position):
+        encoding = locale.getpreferredencoding(False)
+        with open(transactions_filepath, "rb") as binary_file:
+            lines = LineReader(binary_file, encoding)
+            header = next(csv.reader(lines), None)
+            if header is None:
+                return
+            if position.offset:
+                binary_file.seek(position.offset)
+                lines = LineReader(binary_file, encoding, position.offset)
+            else:
+                position.offset = lines.complete_offset
+            yield from self.parse_rows(
+                header,
+                csv.reader(lines),
+                accept_ticker,
+                position.line_number,
+                lines,
+                position,
+            )
+            position.offset = lines.complete_offset
+
+    def parse_rows(
+        self, header, reader, accept_ticker, line_number, lines=None, position=None
+    ):
+        row_values = self.row_values_getter(header)
+        parse_values = self.parse_values
+        stats = self.stats
+        ticker_aliases = self.ticker_aliases
+        if ticker_aliases:
+            accept_any_ticker = accept_ticker
+
+            def accept_ticker(ticker):
+                return accept_any_ticker(ticker_aliases.get(ticker, ticker))
+
+        if stats is not None:
+            reader = stats.timed_iter(reader, "csv_decode", ("parsing", "rows"))
+        for row in reader:
+            if not row:
+                # csv.DictReader skips blank rows without counting them
+                if stats is not None:
+                    stats.count("skipped_rows", "blank")
+                continue
+            line_number += 1
+            if position is not None and lines.offset == lines.complete_offset:
+                position.offset = lines.offset
+                position.line_number = line_number
+            values = row_values(row)
+            if not accept_ticker(values[0]):
+                if stats is not None:
+                    stats.count("skipped_rows", "unrelated_ticker")
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info(
+                        "Skipping line number %s - unrelated transaction to ticker",
+                        line_number,
+                    )
+                continue
+            transaction = parse_values(*values, line_number)
+            if transaction is not None:
+                yield ticker_aliases.get(values[0], values[0]), transaction
+
+    # Returns a function mapping a csv row to the values of columns(), None for
+    # missing columns or short rows (as csv.DictReader would).
+    def row_values_getter(self, header):
+        positions = {}
+        for index, column in enumerate(header):
+            # csv.DictReader keeps the last column with a duplicated name
+            positions[column] = index
+        indexes = [positions.get(column) for column in self.columns()]
+        if None not in indexes:
+            getter = itemgetter(*indexes)
+            row_length = max(indexes) + 1
+
+            def row_values(row):
+                if len(row) >= row_length:
+                    return getter(row)
+                return [row[index] if index < len(row) else None for index in indexes]
+
+            return row_values
+
+        def row_values(row):
+            return [
+                row[index] if index is not None and index < len(row) else None
+                for index in indexes
+            ]
+
+        return row_values
+
+    def parse_values(
+        self,
+        ticker,
+        transaction_type_raw,
+        datetime_raw,
+        transaction_size_raw,
+        cost_basis_raw,
+        line_number,
+    ):
+        if transaction_type_raw in self.buy_values:
+            transaction_type_value = TRANSACTION_BUY
+        elif transaction_type_raw in self.sell_values:
+            transaction_type_value = TRANSACTION_SELL
+        elif transaction_type_raw in self.split_values:
+            transaction_type_value = TRANSACTION_SPLIT
+        else:
+            self.count_skipped_row("unrelated_transaction_type")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Skipping line number %s - unrelated transaction type", line_number
+                )
+            return None
+
+        # transaction datetime
+        if not datetime_raw:
+            self.count_skipped_row("missing_date")
+            logger.error(f"Datetime not found on line {line_number}")
+            return None
+        datetime_value = self.date_parser.parse(datetime_raw)
+
+        # transaction size
+        if not transaction_size_raw:
+            self.count_skipped_row("missing_quantity")
+            logger.error(f"Quantity not found on line {line_number}")
+            return None
+        try:
+            transaction_size_value = int(transaction_size_raw)
+        except ValueError:
+            self.count_skipped_row("invalid_quantity")
+            logger.error(
+                f"Quantity ({transaction_size_raw}) is not an integer value on line {line_number}"
+            )
+            return None
+        if transaction_type_value == TRANSACTION_SPLIT:
+            # the quantity is the shares the split added, there is no price
+            return Transaction(
+                transaction_size_value, 0.0, datetime_value, TRANSACTION_SPLIT
+            )
+
+        # transaction cost
+        if not cost_basis_raw:
+            self.count_skipped_row("missing_price")
+            logger.error(f"Transaction cost not found on line {line_number}")
+            return None
+        if isinstance(cost_basis_raw, float):
+            # a price that was never written out, see
+            # schwab/merge_schwab.parse_merged_transactions
+            cost_basis_value = cost_basis_raw
+        else:
+            cost_basis_raw_number = cost_basis_raw.replace("$", "")
+            try:
+                cost_basis_value = float(cost_basis_raw_number)
+            except ValueError:
+                self.count_skipped_row("invalid_price")
+                logger.error(
+                    f"Security price ({cost_basis_raw_number}) is not a number on line {line_number}"
+                )
+                return None
+
+        transaction = Transaction(
+            transaction_size_value,
+            cost_basis_value,
+            datetime_value,
+            transaction_type_value,
         )
-        return None
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "%s %s on line %s", transaction_type_value, transaction, line_number
+            )
+        return transaction
 
-    transaction = Transaction(
-        transaction_size_value, cost_basis_value, datetime_value, transaction_type_value
-    )
-    logger.debug(f"{transaction_type_value} {transaction} on line {line_number}")
-    return transaction
+    def count_skipped_row(self, reason):
+        if self.stats is not None:
+            self.stats.count("skipped_rows", reason)
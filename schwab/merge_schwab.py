@@ -1,13 +1,22 @@
 import csv
+import json
 import argparse
+import logging
+import sys
+import tempfile
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 import re
 from pprint import pprint
 import copy
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
 
 REGEX_STRING_PATTERN = r"(\d{2}\/\d{2}\/\d{4})"
 MONTH_YEAR_FORMAT = "%m/%Y"
+# rows of the transactions export kept in memory, the rest wait in temporary files
+SPILL_CHUNK_SIZE = 100000
 
 
 @dataclass
@@ -17,54 +26,137 @@ class EquityData:
     number_of_shares_sold_for_taxes: str
 
 
+# A Cancel Sell without an earlier Sell of the same amount and quantity.
+# `index` is its position in the oldest first transactions.
 @dataclass
-class CSVData:
-    fieldnames: list[str]
-    data: list[any]
-
+class UnmatchedCancel:
+    index: int
+    date: str
+    amount: str
+    quantity: str
 
-def remove_indexes_from_list(values, indexes_to_remove):
-    indexes_to_remove.sort(reverse=True)
-    for index_to_remove in indexes_to_remove:
-        values.pop(index_to_remove)
 
-
-def get_existing_transactions_file(transacations_path):
-    with open(transacations_path, "r") as transactions_file:
-        reader = csv.DictReader(transactions_file)
-        fieldnames = reader.fieldnames
-        data = []
-        for row in reader:
-            data.insert(0, row)
-        return CSVData(fieldnames, data)
+# The transactions export once merged: `transactions` yields (row, vesting
+# price) oldest first, and can only be read once. The vesting price is that of
+# the month for Stock Plan Activity rows, None for the rest (and for deposits of
+# a month missing from the equity awards).
+@dataclass
+class MergedTransactions:
+    fieldnames: list[str]
+    transactions: Iterator[tuple[dict, float]]
+    unmatched_cancels: list[UnmatchedCancel]
+
+
+# The rows of the newest first transactions export, pushed as they are read and
+# popped oldest first, so reversing the export is linear. Past `chunk_size` rows
+# the pushed rows go to temporary files a chunk at a time, and popping reads
+# them back a chunk at a time, so memory does not grow with the export.
+class RowStack:
+    def __init__(self, fieldnames, chunk_size=SPILL_CHUNK_SIZE):
+        self.fieldnames = fieldnames
+        self.chunk_size = chunk_size
+        # (index in the export, month / year, transaction)
+        self.rows = []
+        self.spill_files = []
+
+    def push(self, index, month_year_str, transaction):
+        self.rows.append((index, month_year_str, transaction))
+        if len(self.rows) >= self.chunk_size:
+            self.spill()
+
+    def spill(self):
+        spill_file = tempfile.TemporaryFile("w+", newline="")
+        writer = csv.writer(spill_file)
+        for index, month_year_str, transaction in self.rows:
+            writer.writerow(
+                [index, month_year_str]
+                + [transaction.get(fieldname) for fieldname in self.fieldnames]
+            )
+        self.spill_files.append(spill_file)
+        self.rows = []
+
+    def load(self, spill_file):
+        spill_file.seek(0)
+        self.rows = [
+            (int(row[0]), row[1], dict(zip(self.fieldnames, row[2:])))
+            for row in csv.reader(spill_file)
+        ]
+        spill_file.close()
+
+    def pop_all(self):
+        while True:
+            while self.rows:
+                yield self.rows.pop()
+            if not self.spill_files:
+                return
+            self.load(self.spill_files.pop())
+
+    def close(self):
+        for spill_file in self.spill_files:
+            spill_file.close()
+        self.spill_files = []
+        self.rows = []
 
 
 # cancel sell is an odd case... why is Schwab Canceling Sells that have already happened
 # cancel sell needs to remove the previous sale item with corresponding values
-def remove_cancelled_sells(transactions):
-    indexes_to_remove = []
-    for i, transaction in enumerate(transactions):
-        if transaction.get("Action") == "Cancel Sell":
-            index_to_remove = None
-            for j in range(i - 1, -1, -1):
-                if (
-                    transactions[j]["Amount"] == transaction["Amount"][1:]
-                    and transactions[j]["Quantity"] == transaction["Quantity"]
-                ):
-                    # can check the month/year here as well
-                    index_to_remove = j
-                    break
-            if index_to_remove is None:
-                print(f"Missing corresponding Sell for Cancel Sell {transaction}")
-            else:
-                # remove the sell that was cancelled
-                indexes_to_remove.append(index_to_remove)
-                # remove the cancel sell transaction
-                indexes_to_remove.append(i)
-    remove_indexes_from_list(transactions, indexes_to_remove)
-
-
-def update_transaction_date(transaction):
+#
+# The export is newest first, so a Cancel Sell is read before the Sell it
+# cancels. The cancels without a sell yet are kept by (Amount, Quantity), and
+# the month / year with `match_month`, and a Sell is cancelled by the nearest of
+# them in O(1). Those are the same pairs as matching every cancel with the
+# latest earlier Sell oldest first.
+class CancelledSells:
+    def __init__(self, match_month=False):
+        self.match_month = match_month
+        # key -> [(index, transaction)], nearest last
+        self.pending_cancels = {}
+        self.matched_cancel_indexes = set()
+
+    # True if `transaction`, the `index`th of the export, is a cancelled Sell
+    def is_cancelled(self, index, transaction, month_year_str):
+        action = transaction.get("Action")
+        if action == "Sell":
+            key = self.get_key(transaction["Amount"], transaction, month_year_str)
+            cancels = self.pending_cancels.get(key)
+            if cancels:
+                cancel_index, _ = cancels.pop()
+                self.matched_cancel_indexes.add(cancel_index)
+                return True
+        elif action == "Cancel Sell":
+            key = self.get_key(transaction["Amount"][1:], transaction, month_year_str)
+            # a copy, the row's date is rewritten before its sell is found
+            self.pending_cancels.setdefault(key, []).append((index, dict(transaction)))
+        return False
+
+    def get_key(self, amount, transaction, month_year_str):
+        if self.match_month:
+            return amount, transaction["Quantity"], month_year_str
+        return amount, transaction["Quantity"]
+
+    # The Cancel Sells no Sell was found for, oldest first, once all the
+    # `row_count` rows of the export are read
+    def get_unmatched_cancels(self, row_count):
+        pending_cancels = sorted(
+            (cancel for cancels in self.pending_cancels.values() for cancel in cancels),
+            key=lambda cancel: cancel[0],
+            reverse=True,
+        )
+        unmatched_cancels = []
+        for index, transaction in pending_cancels:
+            logger.warning(f"Missing corresponding Sell for Cancel Sell {transaction}")
+            unmatched_cancels.append(
+                UnmatchedCancel(
+                    row_count - 1 - index,
+                    transaction.get("Date"),
+                    transaction["Amount"],
+                    transaction["Quantity"],
+                )
+            )
+        return unmatched_cancels
+
+
+def get_transaction_date(transaction):
     date_str_raw = transaction.get("Date")
     regex_search_result = re.findall(REGEX_STRING_PATTERN, date_str_raw)
     # todo: what values should we be using here
@@ -72,15 +164,56 @@ def update_transaction_date(transaction):
     #     date_str = regex_search_result[1]
     # else:
     #     date_str = regex_search_result[0]
-    date_str = regex_search_result[0]
-    date = date_parse(date_str)
-    transaction["Date"] = date_str
-
-
-def update_transaction_price_for_vesting(
-    transaction, tax_transactions_activity, fair_value_price_dict
+    if regex_search_result:
+        return regex_search_result[0]
+    return None
+
+
+# the exports repeat the same few hundred dates, each is parsed once
+def get_month_year_str(date_str, month_year_strs):
+    if date_str is None:
+        return None
+    month_year_str = month_year_strs.get(date_str)
+    if month_year_str is None:
+        month_year_str = date_parse(date_str).strftime(MONTH_YEAR_FORMAT)
+        month_year_strs[date_str] = month_year_str
+    return month_year_str
+
+
+# Reads the newest first `transactions` (dicts) into a RowStack, leaving out the
+# cancelled sells. Returns the stack and the number of rows read.
+def stack_transactions(
+    transactions, fieldnames, cancelled_sells, chunk_size=SPILL_CHUNK_SIZE
 ):
-    month_year_str = date_parse(transaction.get("Date")).strftime(MONTH_YEAR_FORMAT)
+    row_stack = RowStack(fieldnames, chunk_size)
+    month_year_strs = {}
+    row_count = 0
+    for index, transaction in enumerate(transactions):
+        row_count += 1
+        date_str = get_transaction_date(transaction)
+        month_year_str = get_month_year_str(date_str, month_year_strs)
+        if cancelled_sells.is_cancelled(index, transaction, month_year_str):
+            continue
+        if date_str is None:
+            row_stack.close()
+            raise ValueError(f"Missing date for transaction {transaction}")
+        transaction["Date"] = date_str
+        row_stack.push(index, month_year_str, transaction)
+    return row_stack, row_count
+
+
+# (month / year, transaction) oldest first, without the Cancel Sells that
+# cancelled a sell
+def unstack_transactions(row_stack, cancelled_sells):
+    try:
+        for index, month_year_str, transaction in row_stack.pop_all():
+            if index not in cancelled_sells.matched_cancel_indexes:
+                yield month_year_str, transaction
+    finally:
+        row_stack.close()
+
+
+def is_deposit_for_taxes(transaction, month_year_str, tax_transactions_activity):
     number_of_shares_sold = transaction.get("Quantity")
     number_of_shares_sold_for_taxes_list = tax_transactions_activity.get(
         month_year_str, []
@@ -88,17 +221,17 @@ def update_transaction_price_for_vesting(
     if number_of_shares_sold in number_of_shares_sold_for_taxes_list:
         number_of_shares_sold_for_taxes_list.remove(number_of_shares_sold)
         return True
+    return False
+
 
+def get_vesting_price(month_year_str, fair_value_price_dict):
     vesting_price = fair_value_price_dict.get(month_year_str)
     if vesting_price is None:
-        print(f"Missing vesting price data for {month_year_str}")
-    else:
-        transaction["Price"] = f"${vesting_price}"
-    return False
+        logger.warning(f"Missing vesting price data for {month_year_str}")
+    return vesting_price
 
 
-def remove_shares_sold_for_taxes(transaction, tax_transactions_sell):
-    month_year_str = date_parse(transaction.get("Date")).strftime(MONTH_YEAR_FORMAT)
+def remove_shares_sold_for_taxes(transaction, month_year_str, tax_transactions_sell):
     number_of_shares_sold = transaction.get("Quantity")
     number_of_shares_sold_for_taxes_list = tax_transactions_sell.get(month_year_str, [])
     if number_of_shares_sold in number_of_shares_sold_for_taxes_list:
@@ -107,29 +240,89 @@ def remove_shares_sold_for_taxes(transaction, tax_transactions_sell):
     return False
 
 
+# Yields (transaction, vesting price) for the (month / year, transaction)
+# `transactions` that were not sold or deposited for taxes, see
+# MergedTransactions
 def update_transactions(transactions, fair_value_price_dict, tax_transactions_dict):
     tax_transactions_sell = copy.deepcopy(tax_transactions_dict)
     tax_transactions_activity = copy.deepcopy(tax_transactions_dict)
-    indexes_to_remove = []
-
-    for i, transaction in enumerate(transactions):
-        update_transaction_date(transaction)
 
+    for month_year_str, transaction in transactions:
+        vesting_price = None
         if transaction.get("Action") == "Stock Plan Activity":
-            should_remove_transaction = update_transaction_price_for_vesting(
-                transaction, tax_transactions_activity, fair_value_price_dict
-            )
-            if should_remove_transaction:
-                indexes_to_remove.append(i)
+            if is_deposit_for_taxes(
+                transaction, month_year_str, tax_transactions_activity
+            ):
+                continue
+            vesting_price = get_vesting_price(month_year_str, fair_value_price_dict)
         elif transaction.get("Action") == "Sell":
             should_remove_transaction = remove_shares_sold_for_taxes(
-                transaction, tax_transactions_sell
+                transaction, month_year_str, tax_transactions_sell
             )
             if should_remove_transaction:
-                indexes_to_remove.append(i)
-    remove_indexes_from_list(transactions, indexes_to_remove)
-    print(tax_transactions_sell)
-    print(tax_transactions_activity)
+                continue
+        yield transaction, vesting_price
+    logger.info(tax_transactions_sell)
+    logger.info(tax_transactions_activity)
+
+
+# the rows as written to the merged file, with the vesting price as Price
+def set_vesting_prices(transactions):
+    for transaction, vesting_price in transactions:
+        if vesting_price is not None:
+            transaction["Price"] = f"${vesting_price}"
+        yield transaction
+
+
+# Parses the MergedTransactions of `ticker_to_track` as parse_transactions would
+# parse the merged file with `transaction_parser`, so they go straight to the
+# accountants. The vesting prices are used as they are instead of being written
+# out and parsed back. `output_filepath` also writes the merged file.
+def parse_merged_transactions(
+    merged_transactions, transaction_parser, output_filepath=None
+):
+    output_file = None
+    if output_filepath:
+        output_file = open(output_filepath, "w")
+        writer = csv.DictWriter(output_file, merged_transactions.fieldnames)
+        writer.writeheader()
+    ticker_to_track = transaction_parser.ticker_to_track
+    # rows of a ticker's old names count as the ticker, see TransactionParser
+    ticker_aliases = transaction_parser.ticker_aliases
+    try:
+        # the line numbers of the merged file
+        for line_number, (transaction, vesting_price) in enumerate(
+            merged_transactions.transactions, 2
+        ):
+            if output_file is not None:
+                if vesting_price is not None:
+                    transaction["Price"] = f"${vesting_price}"
+                writer.writerow(transaction)
+            (
+                ticker,
+                transaction_type_raw,
+                datetime_raw,
+                transaction_size_raw,
+                cost_basis_raw,
+            ) = transaction_parser.dict_row_values(transaction)
+            if ticker_aliases.get(ticker, ticker) != ticker_to_track:
+                transaction_parser.count_skipped_row("unrelated_ticker")
+                continue
+            if vesting_price is not None:
+                cost_basis_raw = vesting_price
+            parsed_transaction = transaction_parser.parse_values(
+                ticker,
+                transaction_type_raw,
+                datetime_raw,
+                transaction_size_raw,
+                cost_basis_raw,
+                line_number,
+            )
+            if parsed_transaction is not None:
+                yield parsed_transaction
+    finally:
+        if output_file is not None:
+            output_file.close()
 
 
 def write_transaction_file(transactions, fieldnames, transactions_file_path):
@@ -172,7 +365,7 @@ def get_vesting_price_dict(equity_data):
             fair_value_price_dict.get(month_year_str, equity_item.vesting_price)
             != equity_item.vesting_price
         ):
-            print(
+            logger.warning(
                 f"Unexpected price mismatch for month: {month_year_str}. "
                 "Vesting price across the month should match."
             )
@@ -190,17 +383,55 @@ def get_tax_transactions_dict(equity_data):
     return tax_transactions_dict
 
 
-def main(transacations_path, equity_transactions_path, output_filepath):
+# Reads both exports. The transactions export is read through once here, the
+# merged rows are then streamed from MergedTransactions.transactions.
+def merge_transactions(
+    transacations_path,
+    equity_transactions_path,
+    match_month=False,
+    chunk_size=SPILL_CHUNK_SIZE,
+):
     equity_transactions_data = read_equity_transactions_file(equity_transactions_path)
     vesting_price_dict = get_vesting_price_dict(equity_transactions_data)
     tax_transactions_dict = get_tax_transactions_dict(equity_transactions_data)
-    print(tax_transactions_dict)
-    csv_data = get_existing_transactions_file(transacations_path)
-    transactions = csv_data.data
-    fieldnames = csv_data.fieldnames
-    remove_cancelled_sells(transactions)
-    update_transactions(transactions, vesting_price_dict, tax_transactions_dict)
-    write_transaction_file(transactions, fieldnames, output_filepath)
+    logger.info(tax_transactions_dict)
+    cancelled_sells = CancelledSells(match_month)
+    with open(transacations_path, "r") as transactions_file:
+        reader = csv.DictReader(transactions_file)
+        row_stack, row_count = stack_transactions(
+            reader, reader.fieldnames, cancelled_sells, chunk_size
+        )
+    unmatched_cancels = cancelled_sells.get_unmatched_cancels(row_count)
+    transactions = update_transactions(
+        unstack_transactions(row_stack, cancelled_sells),
+        vesting_price_dict,
+        tax_transactions_dict,
+    )
+    return MergedTransactions(reader.fieldnames, transactions, unmatched_cancels)
+
+
+def main(
+    transacations_path,
+    equity_transactions_path,
+    output_filepath,
+    unmatched_cancels_filepath=None,
+    match_month=False,
+):
+    merged_transactions = merge_transactions(
+        transacations_path, equity_transactions_path, match_month
+    )
+    if unmatched_cancels_filepath:
+        with open(unmatched_cancels_filepath, "w") as f:
+            json.dump(
+                [asdict(cancel) for cancel in merged_transactions.unmatched_cancels],
+                f,
+                indent=2,
+            )
+    write_transaction_file(
+        set_vesting_prices(merged_transactions.transactions),
+        merged_transactions.fieldnames,
+        output_filepath,
+    )
 
 
 def date_parse(date_str):
@@ -212,6 +443,22 @@ if __name__ == "__main__":
     parser.add_argument("-t", "--transactions_path", required=True)
     parser.add_argument("-e", "--equity_transactions_path", required=True)
     parser.add_argument("-o", "--output", required=True)
+    parser.add_argument(
+        "--unmatched-cancels",
+        help="write the Cancel Sells without a matching Sell to this JSON file",
+    )
+    parser.add_argument(
+        "--match-month",
+        action="store_true",
+        help="only let a Cancel Sell cancel a Sell of the same month",
+    )
 
     args = parser.parse_args()
-    main(args.transactions_path, args.equity_transactions_path, args.output)
+    logging.basicConfig(format="%(message)s", level=logging.INFO, stream=sys.stdout)
+    main(
+        args.transactions_path,
+        args.equity_transactions_path,
+        args.output,
+        args.unmatched_cancels,
+        args.match_month,
+    )
@@ -0,0 +1,356 @@
+import math
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+from constants import TRANSACTION_SELL
+from taxes import calculate_tax_burden, with_year_profits
+from transaction import Transaction
+
+DAYS_PER_YEAR = 365.25
+SIMULATION_PERCENTILES = [5, 25, 50, 75, 95]
+
+
+@dataclass
+class ScheduledSell:
+    datetime: datetime
+    quantity: float
+
+
+# What main runs with --simulate. horizon defaults to the last scheduled sell.
+@dataclass
+class SimulationSettings:
+    path_count: int
+    scheduled_sells: list
+    horizon: datetime = None
+    drift: float = 0.0
+    volatility: float = 0.3
+    seed: int = 0
+
+
+# Tax burden of one method on every simulated price path
+@dataclass
+class SimulationResult:
+    tax_method_name: str
+    tax_burdens: list
+    # share of the paths where no other method has a lower tax burden
+    win_rate: float = 0.0
+
+    def get_mean(self):
+        return statistics.fmean(self.tax_burdens)
+
+    def get_percentiles(self):
+        if len(self.tax_burdens) < 2:
+            return [self.tax_burdens[0]] * len(SIMULATION_PERCENTILES)
+        quantiles = statistics.quantiles(self.tax_burdens, n=100, method="inclusive")
+        return [quantiles[percentile - 1] for percentile in SIMULATION_PERCENTILES]
+
+
+# Geometric Brownian motion sampled on `datetimes` (ascending, after
+# start_datetime). drift and volatility are annual. Returns one list of prices
+# per path.
+def generate_price_paths(
+    start_price,
+    start_datetime,
+    datetimes,
+    path_count,
+    drift=0.0,
+    volatility=0.3,
+    seed=0,
+):
+    generator = random.Random(seed)
+    steps = []
+    previous_datetime = start_datetime
+    for current_datetime in datetimes:
+        years = max((current_datetime - previous_datetime).days, 0) / DAYS_PER_YEAR
+        steps.append(
+            (
+                (drift - volatility * volatility / 2) * years,
+                volatility * math.sqrt(years),
+            )
+        )
+        previous_datetime = current_datetime
+
+    paths = []
+    gauss = generator.gauss
+    for _ in range(path_count):
+        price = start_price
+        path = []
+        for mean, deviation in steps:
+            price *= math.exp(mean + deviation * gauss(0, 1))
+            path.append(price)
+        paths.append(path)
+    return paths
+
+
+# Sells the same shares at the same dates whatever the prices. Profits are then
+# linear in the path prices: each sell (and the liquidation at the horizon) adds
+# price * quantity - cost to the short and long term profit.
+class FixedSellPlan:
+    def __init__(self, accountant, scheduled_sells, horizon):
+        # going through the schedule at price 0 gives the costs, the difference
+        # to going through it at price 1 the quantities
+        free = accountant.fork()
+        priced = accountant.fork()
+        self.short_term_quantity = []
+        self.long_term_quantity = []
+        for scheduled_sell in scheduled_sells:
+            free_profits = get_sell_profits(free, scheduled_sell, 0)
+            priced_profits = get_sell_profits(priced, scheduled_sell, 1)
+            self.short_term_quantity.append(priced_profits[0] - free_profits[0])
+            self.long_term_quantity.append(priced_profits[1] - free_profits[1])
+        free_profits = get_unrealized_profits(free, 0, horizon)
+        priced_profits = get_unrealized_profits(priced, 1, horizon)
+        self.short_term_quantity.append(priced_profits[0] - free_profits[0])
+        self.long_term_quantity.append(priced_profits[1] - free_profits[1])
+        (
+            self.short_term_profit,
+            self.long_term_profit,
+            self.profits_by_year,
+        ) = free.get_liquidation_profits_by_year(0, horizon)
+        self.years = [
+            scheduled_sell.datetime.year for scheduled_sell in scheduled_sells
+        ] + [horizon.year]
+
+    # (short term profit, long term profit) with the sells and the liquidation
+    # happening at `prices`
+    def get_profits(self, prices):
+        short_term_profit = self.short_term_profit
+        long_term_profit = self.long_term_profit
+        for price, short_term_quantity, long_term_quantity in zip(
+            prices, self.short_term_quantity, self.long_term_quantity
+        ):
+            short_term_profit += price * short_term_quantity
+            long_term_profit += price * long_term_quantity
+        return short_term_profit, long_term_profit
+
+    # Same as get_profits, by year
+    def get_profits_by_year(self, prices):
+        profits_by_year = self.profits_by_year
+        for price, year, short_term_quantity, long_term_quantity in zip(
+            prices, self.years, self.short_term_quantity, self.long_term_quantity
+        ):
+            profits_by_year = with_year_profits(
+                profits_by_year,
+                year,
+                price * short_term_quantity,
+                price * long_term_quantity,
+            )
+        return profits_by_year
+
+
+# (short term, long term) profit of one scheduled sell
+def get_sell_profits(accountant, scheduled_sell, price):
+    short_term_profit = accountant.get_short_term_profit()
+    long_term_profit = accountant.get_long_term_profit()
+    accountant.sell(make_sell_transaction(scheduled_sell, price))
+    return (
+        accountant.get_short_term_profit() - short_term_profit,
+        accountant.get_long_term_profit() - long_term_profit,
+    )
+
+
+def get_unrealized_profits(accountant, price, current_datetime):
+    short_term_profit, long_term_profit = accountant.get_liquidation_profits(
+        price, current_datetime
+    )
+    return (
+        short_term_profit - accountant.get_short_term_profit(),
+        long_term_profit - accountant.get_long_term_profit(),
+    )
+
+
+def make_sell_transaction(scheduled_sell, price):
+    return Transaction(
+        scheduled_sell.quantity, price, scheduled_sell.datetime, TRANSACTION_SELL
+    )
+
+
+def simulate_accountant(accountant, scheduled_sells, horizon, price_path):
+    fork = sell_scheduled(accountant, scheduled_sells, price_path)
+    return fork.get_liquidation_profits(price_path[-1], horizon)
+
+
+# Same as simulate_accountant, by year
+def simulate_accountant_by_year(accountant, scheduled_sells, horizon, price_path):
+    fork = sell_scheduled(accountant, scheduled_sells, price_path)
+    return fork.get_liquidation_profits_by_year(price_path[-1], horizon)[2]
+
+
+def sell_scheduled(accountant, scheduled_sells, price_path):
+    fork = accountant.fork()
+    for scheduled_sell, price in zip(scheduled_sells, price_path):
+        fork.sell(make_sell_transaction(scheduled_sell, price))
+    return fork
+
+
+def simulate_paths(
+    accountant,
+    scheduled_sells,
+    horizon,
+    price_paths,
+    capital_gains_tax_rate,
+    income_tax_rate,
+    tax_table=None,
+):
+    if tax_table is not None:
+        return [
+            tax_table.calculate_tax_burden(
+                simulate_accountant_by_year(
+                    accountant, scheduled_sells, horizon, price_path
+                )
+            )
+            for price_path in price_paths
+        ]
+    return [
+        calculate_tax_burden(
+            *simulate_accountant(accountant, scheduled_sells, horizon, price_path),
+            capital_gains_tax_rate,
+            income_tax_rate,
+        )
+        for price_path in price_paths
+    ]
+
+
+# Runs every accountant of `engine` through the scheduled sells (in date order)
+# on every price path, then sells what is left at the horizon. Each path has a
+# price per scheduled sell and a last one for the horizon, see
+# generate_price_paths.
+# Price independent methods sell the same lots on every path and are evaluated
+# from one FixedSellPlan, the others replay the sells per path, in `jobs`
+# worker processes. With a taxes.TaxTable the tax burden of a path is that of
+# its profits by year.
+def simulate_tax_methods(
+    engine,
+    scheduled_sells,
+    horizon,
+    price_paths,
+    capital_gains_tax_rate,
+    income_tax_rate,
+    jobs=1,
+    tax_table=None,
+):
+    if tax_table is None:
+        missing_rates = capital_gains_tax_rate is None or income_tax_rate is None
+    else:
+        missing_rates = tax_table.get_tax_year(horizon.year) is None
+    if missing_rates:
+        raise ValueError("Simulating needs both tax rates")
+    if scheduled_sells and horizon < scheduled_sells[-1].datetime:
+        raise ValueError("The horizon is before the last scheduled sell")
+    scheduled_quantity = sum(
+        scheduled_sell.quantity for scheduled_sell in scheduled_sells
+    )
+    for accountant in engine.accountants:
+        open_quantity = sum(
+            lot.transaction_size for lot in accountant.get_unsold_lots()
+        )
+        if scheduled_quantity > open_quantity:
+            raise ValueError("The scheduled sells are for more shares than are held")
+
+    results = []
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        futures = []
+        for accountant in engine.accountants:
+            if accountant.tax_method.price_independent:
+                plan = FixedSellPlan(accountant, scheduled_sells, horizon)
+                if tax_table is None:
+                    tax_burdens = [
+                        calculate_tax_burden(
+                            *plan.get_profits(price_path),
+                            capital_gains_tax_rate,
+                            income_tax_rate,
+                        )
+                        for price_path in price_paths
+                    ]
+                else:
+                    tax_burdens = [
+                        tax_table.calculate_tax_burden(
+                            plan.get_profits_by_year(price_path)
+                        )
+                        for price_path in price_paths
+                    ]
+                futures.append(tax_burdens)
+            elif executor is None:
+                futures.append(
+                    simulate_paths(
+                        accountant,
+                        scheduled_sells,
+                        horizon,
+                        price_paths,
+                        capital_gains_tax_rate,
+                        income_tax_rate,
+                        tax_table,
+                    )
+                )
+            else:
+                futures.append(
+                    [
+                        executor.submit(
+                            simulate_paths,
+                            accountant,
+                            scheduled_sells,
+                            horizon,
+                            chunk,
+                            capital_gains_tax_rate,
+                            income_tax_rate,
+                            tax_table,
+                        )
+                        for chunk in split_paths(price_paths, jobs)
+                    ]
+                )
+        for accountant, tax_burdens in zip(engine.accountants, futures):
+            if executor is not None and not accountant.tax_method.price_independent:
+                tax_burdens = [
+                    tax_burden
+                    for future in tax_burdens
+                    for tax_burden in future.result()
+                ]
+            results.append(
+                SimulationResult(accountant.get_tax_method_name(), tax_burdens)
+            )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    set_win_rates(results)
+    return results
+
+
+def split_paths(price_paths, number_of_chunks):
+    chunk_size = max(1, -(-len(price_paths) // number_of_chunks))
+    return [
+        price_paths[start : start + chunk_size]
+        for start in range(0, len(price_paths), chunk_size)
+    ]
+
+
+def set_win_rates(results):
+    if not results or not results[0].tax_burdens:
+        return
+    path_count = len(results[0].tax_burdens)
+    wins = [0] * len(results)
+    for tax_burdens in zip(*(result.tax_burdens for result in results)):
+        lowest = min(tax_burdens)
+        for index, tax_burden in enumerate(tax_burdens):
+            if tax_burden <= lowest + 1e-9:
+                wins[index] += 1
+    for result, win_count in zip(results, wins):
+        result.win_rate = win_count / path_count
+
+
+# "2025/03/01:100,2025/06/01:50", sell dates in the last_date format and share
+# quantities, returned in date order
+def parse_scheduled_sells(value):
+    scheduled_sells = []
+    for part in value.split(","):
+        date_value, quantity_value = part.split(":")
+        scheduled_sells.append(
+            ScheduledSell(
+                datetime.strptime(date_value, "%Y/%m/%d"), float(quantity_value)
+            )
+        )
+    return sorted(scheduled_sells, key=lambda scheduled_sell: scheduled_sell.datetime)
@@ -0,0 +1,202 @@
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+from lot_book import SortedLotBook
+
+
+# Timers and counters of one run, reported by --stats. Nothing here is on the
+# default code path: parsers, engines and lot books only look at a Stats when
+# one was handed to them, and then switch to instrumented versions of their
+# loops once per file or run rather than checking per row.
+class Stats:
+    def __init__(self):
+        # name -> [wall seconds, cpu seconds]
+        self.timers = {}
+        # group -> name -> count
+        self.counters = {}
+
+    def add_time(self, name, wall_time, cpu_time):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [wall_time, cpu_time]
+        else:
+            timer[0] += wall_time
+            timer[1] += cpu_time
+
+    @contextmanager
+    def timer(self, name):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            self.add_time(
+                name,
+                time.perf_counter() - wall_start,
+                time.process_time() - cpu_start,
+            )
+
+    # Iterates `iterable`, timing only what it takes to produce each item. The
+    # items are counted in `counter`, a (group, name) pair, if given.
+    def timed_iter(self, iterable, name, counter=None):
+        iterator = iter(iterable)
+        items = 0
+        perf_counter = time.perf_counter
+        process_time = time.process_time
+        wall_time = 0.0
+        cpu_time = 0.0
+        try:
+            while True:
+                wall_start = perf_counter()
+                cpu_start = process_time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    wall_time += perf_counter() - wall_start
+                    cpu_time += process_time() - cpu_start
+                items += 1
+                yield item
+        finally:
+            self.add_time(name, wall_time, cpu_time)
+            if counter is not None:
+                self.count(*counter, items)
+
+    # Replaces timer `total`, which nests timer `part`, by timer `rest`: the time
+    # spent in `total` outside of `part`
+    def split_time(self, total, part, rest):
+        total_time = self.timers.pop(total, None)
+        if total_time is None:
+            return
+        part_time = self.timers.get(part, [0.0, 0.0])
+        self.timers[rest] = [
+            total_part - part_part
+            for total_part, part_part in zip(total_time, part_time)
+        ]
+
+    def count(self, group, name, value=1):
+        counters = self.counters.get(group)
+        if counters is None:
+            counters = self.counters[group] = {}
+        counters[name] = counters.get(name, 0) + value
+
+    def add_counters(self, other):
+        for group, counters in other.counters.items():
+            for name, value in counters.items():
+                self.count(group, name, value)
+
+    def set_max(self, group, name, value):
+        counters = self.counters.setdefault(group, {})
+        counters[name] = max(counters.get(name, value), value)
+
+    def to_dict(self):
+        return {
+            "timers": {
+                name: {"wall": wall_time, "cpu": cpu_time}
+                for name, (wall_time, cpu_time) in sorted(self.timers.items())
+            },
+            "counters": self.counters,
+            "peak_memory_bytes": get_peak_memory(),
+        }
+
+
+# stats.timer(name), or nothing when there are no stats
+def timer(stats, name):
+    if stats is None:
+        return nullcontext()
+    return stats.timer(name)
+
+
+# Peak resident set size of this process, None where it is not available
+def get_peak_memory():
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    if sys.platform == "darwin":
+        return max_rss
+    return max_rss * 1024
+
+
+# Stands in for an accountant's lot book to count what its sells do. A lot that
+# is popped and added straight back was only partly sold.
+class CountingLotBook:
+    def __init__(self, lot_book, stats, group):
+        self.lot_book = lot_book
+        self.stats = stats
+        self.group = group
+        self.sorts = isinstance(lot_book, SortedLotBook)
+        self.lots_touched = 0
+        self.last_popped = None
+        for name in ["sells", "lots_touched", "partial_lot_splits", "sorts"]:
+            stats.count(group, name, 0)
+
+    def add(self, lot_id):
+        if lot_id == self.last_popped:
+            self.stats.count(self.group, "partial_lot_splits")
+        self.last_popped = None
+        self.lot_book.add(lot_id)
+
+    def start_sell(self, current_price, current_datetime):
+        self.finish_sell()
+        self.stats.count(self.group, "sells")
+        if self.sorts:
+            self.stats.count(self.group, "sorts")
+        heap_rebuilds = getattr(self.lot_book, "heap_rebuilds", None)
+        self.lot_book.start_sell(current_price, current_datetime)
+        if heap_rebuilds is not None:
+            self.stats.count(
+                self.group, "sorts", self.lot_book.heap_rebuilds - heap_rebuilds
+            )
+
+    def pop(self):
+        self.lots_touched += 1
+        self.stats.count(self.group, "lots_touched")
+        self.last_popped = self.lot_book.pop()
+        return self.last_popped
+
+    # the lots touched by a sell are only known once the next one starts
+    def finish_sell(self):
+        if self.lots_touched:
+            self.stats.set_max(
+                self.group, "max_lots_touched_per_sell", self.lots_touched
+            )
+        self.lots_touched = 0
+        self.last_popped = None
+
+    def clear(self):
+        self.finish_sell()
+        self.lot_book.clear()
+
+    def copy(self, remaining_quantity, lot_store=None):
+        return self.lot_book.copy(remaining_quantity, lot_store)
+
+    def __iter__(self):
+        return iter(self.lot_book)
+
+    def __len__(self):
+        return len(self.lot_book)
+
+
+def count_accountant(accountant, stats):
+    if not isinstance(accountant.unsold_transactions, CountingLotBook):
+        accountant.unsold_transactions = CountingLotBook(
+            accountant.unsold_transactions,
+            stats,
+            f"accountant[{accountant.get_tax_method_name()}]",
+        )
+
+
+def uncount_accountant(accountant):
+    lot_book = accountant.unsold_transactions
+    if isinstance(lot_book, CountingLotBook):
+        lot_book.finish_sell()
+        accountant.unsold_transactions = lot_book.lot_book
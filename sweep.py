@@ -0,0 +1,165 @@
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import accumulate
+
+from accountant import LONG_TERM_AGE
+from taxes import calculate_tax_burden, with_year_profits
+
+
+# Unrealized profits of every method over a grid of liquidation prices and
+# dates. The profit lists are indexed [date][price].
+@dataclass
+class SweepResult:
+    tax_method_name: str
+    prices: list
+    datetimes: list
+    short_term_profit: list
+    long_term_profit: list
+    tax_burden: list
+
+
+# The open lots of an accountant, ordered by acquisition date with running
+# totals of their quantity and cost. Liquidating at price p on a date splits the
+# lots at one index: the older ones are long term, so each side's profit is
+# p * quantity - cost.
+class OpenLotTotals:
+    def __init__(self, accountant):
+        lot_store = accountant.lot_store
+        remaining_quantity = accountant.remaining_quantity
+        lot_ids = sorted(
+            accountant.unsold_transactions,
+            key=lambda lot_id: lot_store.datetime[lot_id],
+        )
+        self.datetimes = [lot_store.datetime[lot_id] for lot_id in lot_ids]
+        self.quantity = [0.0] + list(
+            accumulate(remaining_quantity[lot_id] for lot_id in lot_ids)
+        )
+        self.cost = [0.0] + list(
+            accumulate(
+                lot_store.cost_basis[lot_id] * remaining_quantity[lot_id]
+                for lot_id in lot_ids
+            )
+        )
+
+    # (short term quantity, short term cost, long term quantity, long term cost)
+    def split(self, current_datetime):
+        long_term_lots = bisect_right(self.datetimes, current_datetime - LONG_TERM_AGE)
+        return (
+            self.quantity[-1] - self.quantity[long_term_lots],
+            self.cost[-1] - self.cost[long_term_lots],
+            self.quantity[long_term_lots],
+            self.cost[long_term_lots],
+        )
+
+
+# Same numbers as AccountingEngine.get_results (and the tax burden of them) for
+# every price / date pair, without selling any lots. Each accountant's open
+# lots are only gone through once, every grid point is then O(1). With a
+# corporate_actions.SplitAdjustment the lot quantities are multiplied by the
+# shares per share of the accounting on each date. With a taxes.TaxTable the
+# tax burden is that of the profits by year, the liquidation's in its year.
+def sweep_liquidation(
+    engine,
+    prices,
+    datetimes,
+    capital_gains_tax_rate=None,
+    income_tax_rate=None,
+    split_adjustment=None,
+    tax_table=None,
+):
+    results = []
+    for accountant in engine.accountants:
+        open_lot_totals = OpenLotTotals(accountant)
+        realized_short_term_profit = accountant.get_short_term_profit()
+        realized_long_term_profit = accountant.get_long_term_profit()
+        short_term_profits = []
+        long_term_profits = []
+        tax_burdens = []
+        for current_datetime in datetimes:
+            (
+                short_term_quantity,
+                short_term_cost,
+                long_term_quantity,
+                long_term_cost,
+            ) = open_lot_totals.split(current_datetime)
+            share_factor = (
+                1
+                if split_adjustment is None
+                else split_adjustment.get_factor(current_datetime)
+            )
+            short_term_quantity *= share_factor
+            long_term_quantity *= share_factor
+            short_term_row = [
+                realized_short_term_profit
+                + price * short_term_quantity
+                - short_term_cost
+                for price in prices
+            ]
+            long_term_row = [
+                realized_long_term_profit + price * long_term_quantity - long_term_cost
+                for price in prices
+            ]
+            short_term_profits.append(short_term_row)
+            long_term_profits.append(long_term_row)
+            if tax_table is None:
+                tax_burdens.append(
+                    [
+                        calculate_tax_burden(
+                            short_term_profit,
+                            long_term_profit,
+                            capital_gains_tax_rate,
+                            income_tax_rate,
+                        )
+                        for short_term_profit, long_term_profit in zip(
+                            short_term_row, long_term_row
+                        )
+                    ]
+                )
+            else:
+                tax_burdens.append(
+                    [
+                        tax_table.calculate_tax_burden(
+                            with_year_profits(
+                                accountant.profits_by_year,
+                                current_datetime.year,
+                                short_term_profit - realized_short_term_profit,
+                                long_term_profit - realized_long_term_profit,
+                            )
+                        )
+                        for short_term_profit, long_term_profit in zip(
+                            short_term_row, long_term_row
+                        )
+                    ]
+                )
+        results.append(
+            SweepResult(
+                accountant.get_tax_method_name(),
+                list(prices),
+                list(datetimes),
+                short_term_profits,
+                long_term_profits,
+                tax_burdens,
+            )
+        )
+    return results
+
+
+# "5,7.5,10" or a "start:stop:step" range including stop, or a mix of both
+def parse_sweep_prices(value):
+    prices = []
+    for part in value.split(","):
+        if ":" not in part:
+            prices.append(float(part))
+            continue
+        start, stop, step = (float(number) for number in part.split(":"))
+        if step <= 0:
+            raise ValueError(f"Price step must be positive: {part}")
+        steps = int((stop - start) / step + 1e-9)
+        prices.extend(start + index * step for index in range(steps + 1))
+    return prices
+
+
+# comma separated dates in the last_date format, YYYY/MM/DD
+def parse_sweep_dates(value):
+    return [datetime.strptime(part, "%Y/%m/%d") for part in value.split(",")]
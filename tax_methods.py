@@ -1,4 +1,6 @@
-from datetime import timedelta
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
 
 X_IS_GREATER = 1
 Y_IS_GREATER = -1
@@ -66,10 +68,65 @@ def low_cost_comparator(x, y, current_price, current_datetime):
     return x.cost_basis - y.cost_basis
 
 
+# Sort keys: the lot with the smallest key is sold first. They take the same
+# (lot, current price, current datetime) inputs as the comparators above, which
+# are kept as the reference implementation.
+DATETIME_ORIGIN = datetime.min
+
+TAX_OPTIMIZER_SHORT_TERM_LOSS = 0
+TAX_OPTIMIZER_LONG_TERM_LOSS = 1
+TAX_OPTIMIZER_SHORT_TERM_EVEN = 2
+TAX_OPTIMIZER_LONG_TERM_EVEN = 3
+TAX_OPTIMIZER_LONG_TERM_GAIN = 4
+TAX_OPTIMIZER_SHORT_TERM_GAIN = 5
+
+
+def tax_optimizer_key(lot, current_price, current_datetime):
+    short_term = (current_datetime - lot.datetime) <= timedelta(days=365)
+    gain = current_price - lot.cost_basis
+    if gain < 0:
+        if short_term:
+            return (TAX_OPTIMIZER_SHORT_TERM_LOSS, gain)
+        return (TAX_OPTIMIZER_LONG_TERM_LOSS, gain)
+    if gain == 0:
+        if short_term:
+            return (TAX_OPTIMIZER_SHORT_TERM_EVEN, gain)
+        return (TAX_OPTIMIZER_LONG_TERM_EVEN, gain)
+    if short_term:
+        return (TAX_OPTIMIZER_SHORT_TERM_GAIN, gain)
+    return (TAX_OPTIMIZER_LONG_TERM_GAIN, gain)
+
+
+def fifo_key(lot, current_price, current_datetime):
+    return lot.datetime - DATETIME_ORIGIN
+
+
+def lifo_key(lot, current_price, current_datetime):
+    return DATETIME_ORIGIN - lot.datetime
+
+
+def high_cost_key(lot, current_price, current_datetime):
+    return -lot.cost_basis
+
+
+def low_cost_key(lot, current_price, current_datetime):
+    return lot.cost_basis
+
+
+# price_independent: the key ignores the current price and datetime, so a lot's
+# key can be computed once when it is bought and reused for every sell
+@dataclass(frozen=True)
+class TaxMethod:
+    name: str
+    sort_key: Callable
+    price_independent: bool
+    comparator: Callable
+
+
 tax_methods = [
-    ("fifo", fifo_comparator),
-    ("lifo", lifo_comparator),
-    ("tax-optimizer", tax_optimizer_comparator),
-    ("high-cost", high_cost_comparator),
-    ("low-cost", low_cost_comparator),
+    TaxMethod("fifo", fifo_key, True, fifo_comparator),
+    TaxMethod("lifo", lifo_key, True, lifo_comparator),
+    TaxMethod("tax-optimizer", tax_optimizer_key, False, tax_optimizer_comparator),
+    TaxMethod("high-cost", high_cost_key, True, high_cost_comparator),
+    TaxMethod("low-cost", low_cost_key, True, low_cost_comparator),
 ]
@@ -0,0 +1,216 @@
+from bisect import bisect_right
+from dataclasses import dataclass
+
+
+def calculate_tax_burden(
+    short_term_profit, long_term_profit, capital_gains_tax_rate, income_tax_rate
+):
+    if capital_gains_tax_rate is None or income_tax_rate is None:
+        return None
+    if (long_term_profit + short_term_profit) <= 0:
+        return 0
+    elif long_term_profit > 0 and short_term_profit > 0:
+        return (
+            long_term_profit * capital_gains_tax_rate
+            + short_term_profit * income_tax_rate
+        )
+    elif long_term_profit > 0:
+        return (long_term_profit - short_term_profit) * capital_gains_tax_rate
+    elif short_term_profit > 0:
+        return (short_term_profit - long_term_profit) * income_tax_rate
+
+
+# net capital losses deducted from ordinary income per year, the rest is carried
+# forward
+CAPITAL_LOSS_LIMIT = 3000
+
+
+# The rates of one tax year. Brackets are (threshold, rate) with ascending
+# thresholds, the first at 0: income above a threshold (and below the next) is
+# taxed at its rate.
+@dataclass
+class TaxYear:
+    ordinary_income: float
+    income_brackets: list
+    long_term_brackets: list
+
+
+# What one tax year came to for one method. Carryforwards are the short and long
+# term losses (as positive numbers) carried into the next year.
+@dataclass
+class YearTax:
+    year: int
+    short_term_profit: float
+    long_term_profit: float
+    taxable_short_term_profit: float
+    taxable_long_term_profit: float
+    loss_deduction: float
+    short_term_carryforward: float
+    long_term_carryforward: float
+    tax_burden: float
+
+
+# tax on the part of an income between start and end
+def bracket_tax(brackets, start, end):
+    start = max(start, 0)
+    tax = 0
+    for index, (threshold, rate) in enumerate(brackets):
+        if threshold >= end:
+            break
+        next_threshold = (
+            brackets[index + 1][0] if index + 1 < len(brackets) else float("inf")
+        )
+        if next_threshold <= start:
+            continue
+        tax += (min(end, next_threshold) - max(start, threshold)) * rate
+    return tax
+
+
+# Per year taxes of the profits of AccountingResult.profits_by_year. Years not in
+# `tax_years` use the closest year before them in it (the first one for earlier
+# years), and flat default_tax_year rates without any.
+class TaxTable:
+    def __init__(self, tax_years=None, default_tax_year=None, capital_loss_limit=None):
+        self.tax_years = dict(tax_years or {})
+        self.years = sorted(self.tax_years)
+        self.default_tax_year = default_tax_year
+        self.capital_loss_limit = (
+            CAPITAL_LOSS_LIMIT if capital_loss_limit is None else capital_loss_limit
+        )
+
+    def get_tax_year(self, year):
+        if not self.years:
+            return self.default_tax_year
+        index = bisect_right(self.years, year) - 1
+        return self.tax_years[self.years[max(index, 0)]]
+
+    # One pass over the years, oldest first: the short and long term profits of
+    # a year are netted against each other (after the losses carried into it),
+    # a net gain is taxed, a net loss is deducted from ordinary income up to
+    # capital_loss_limit and the rest carried forward, short term first.
+    def calculate_yearly_taxes(self, profits_by_year):
+        if not profits_by_year:
+            return []
+        yearly_taxes = []
+        short_term_carryforward = long_term_carryforward = 0
+        for year in range(min(profits_by_year), max(profits_by_year) + 1):
+            tax_year = self.get_tax_year(year)
+            if tax_year is None:
+                return None
+            short_term_profit, long_term_profit = profits_by_year.get(year, (0, 0))
+            short_term = short_term_profit - short_term_carryforward
+            long_term = long_term_profit - long_term_carryforward
+            if short_term < 0 < long_term or long_term < 0 < short_term:
+                net_profit = short_term + long_term
+                if net_profit < 0:
+                    short_term, long_term = (
+                        (net_profit, 0) if short_term < 0 else (0, net_profit)
+                    )
+                else:
+                    short_term, long_term = (
+                        (0, net_profit) if short_term < 0 else (net_profit, 0)
+                    )
+            income = tax_year.ordinary_income
+            loss_deduction = 0
+            if short_term < 0 or long_term < 0:
+                short_term_loss = -min(short_term, 0)
+                long_term_loss = -min(long_term, 0)
+                loss_deduction = min(
+                    self.capital_loss_limit, short_term_loss + long_term_loss
+                )
+                short_term_carryforward = max(short_term_loss - loss_deduction, 0)
+                long_term_carryforward = max(
+                    long_term_loss - max(loss_deduction - short_term_loss, 0), 0
+                )
+                tax_burden = -bracket_tax(
+                    tax_year.income_brackets, income - loss_deduction, income
+                )
+                short_term = long_term = 0
+            else:
+                short_term_carryforward = long_term_carryforward = 0
+                tax_burden = bracket_tax(
+                    tax_year.income_brackets, income, income + short_term
+                ) + bracket_tax(
+                    tax_year.long_term_brackets,
+                    income + short_term,
+                    income + short_term + long_term,
+                )
+            yearly_taxes.append(
+                YearTax(
+                    year,
+                    short_term_profit,
+                    long_term_profit,
+                    short_term,
+                    long_term,
+                    loss_deduction,
+                    short_term_carryforward,
+                    long_term_carryforward,
+                    tax_burden,
+                )
+            )
+        return yearly_taxes
+
+    def calculate_tax_burden(self, profits_by_year):
+        yearly_taxes = self.calculate_yearly_taxes(profits_by_year)
+        if yearly_taxes is None:
+            return None
+        return sum(year_tax.tax_burden for year_tax in yearly_taxes)
+
+
+# A copy of profits_by_year with short_term_profit and long_term_profit added to
+# those of `year`
+def with_year_profits(profits_by_year, year, short_term_profit, long_term_profit):
+    profits_by_year = dict(profits_by_year)
+    year_short_term_profit, year_long_term_profit = profits_by_year.get(year, (0, 0))
+    profits_by_year[year] = (
+        year_short_term_profit + short_term_profit,
+        year_long_term_profit + long_term_profit,
+    )
+    return profits_by_year
+
+
+# A flat TaxYear of the capital_gains_tax_rate / income_tax_rate config values.
+# With one rate the ordinary income only matters to what the loss deduction
+# saves, it is just enough for all of it.
+def get_flat_tax_year(capital_gains_tax_rate, income_tax_rate, capital_loss_limit=None):
+    if capital_gains_tax_rate is None or income_tax_rate is None:
+        return None
+    return TaxYear(
+        CAPITAL_LOSS_LIMIT if capital_loss_limit is None else capital_loss_limit,
+        [(0, income_tax_rate)],
+        [(0, capital_gains_tax_rate)],
+    )
+
+
+# The tax_years config value: {"2024": {"ordinary_income": 95000,
+# "income_brackets": [[0, 10], [11600, 12], ...], "long_term_brackets": [[0, 0],
+# [47025, 15], [518900, 20]]}, ...} with rates in percent like the flat rates,
+# which a year without brackets falls back to.
+def parse_tax_years(value, capital_gains_tax_rate=None, income_tax_rate=None):
+    tax_years = {}
+    for year, year_value in value.items():
+        income_brackets = parse_brackets(year_value.get("income_brackets"))
+        long_term_brackets = parse_brackets(year_value.get("long_term_brackets"))
+        if income_brackets is None:
+            if income_tax_rate is None:
+                raise ValueError(f"No income_brackets for {year}")
+            income_brackets = [(0, income_tax_rate)]
+        if long_term_brackets is None:
+            if capital_gains_tax_rate is None:
+                raise ValueError(f"No long_term_brackets for {year}")
+            long_term_brackets = [(0, capital_gains_tax_rate)]
+        tax_years[int(year)] = TaxYear(
+            float(year_value.get("ordinary_income", 0)),
+            income_brackets,
+            long_term_brackets,
+        )
+    return tax_years
+
+
+def parse_brackets(value):
+    if not value:
+        return None
+    brackets = sorted((float(threshold), rate / 100) for threshold, rate in value)
+    if brackets[0][0] != 0:
+        brackets.insert(0, (0, 0))
+    return brackets
@@ -0,0 +1,230 @@
+import copy
+import random
+import unittest
+from datetime import datetime, timedelta
+from functools import cmp_to_key
+
+from accountant import Accountant
+from constants import TRANSACTION_BUY, TRANSACTION_SELL
+from lot_book import TaxOptimizerLotBook
+from lot_store import LotStore
+from tax_methods import (
+    TaxMethod,
+    tax_methods,
+    tax_optimizer_comparator,
+    tax_optimizer_key,
+)
+from transaction import Transaction
+from test.test_tax_methods import transactions2
+
+
+# the original list based implementation, kept here to check the lot books against
+def reference_profits(tax_method_comparator, transactions, last_price, last_datetime):
+    unsold_transactions = []
+    short_term = 0
+    long_term = 0
+    for transaction in transactions:
+        if transaction.transaction_type == TRANSACTION_BUY:
+            unsold_transactions.append(transaction)
+            continue
+        tax_method_cmp = lambda x, y: tax_method_comparator(
+            x, y, transaction.cost_basis, transaction.datetime
+        )
+        unsold_transactions = sorted(
+            unsold_transactions, key=cmp_to_key(tax_method_cmp)
+        )
+        volume_left = transaction.transaction_size
+        while volume_left > 0:
+            transaction_to_sell = unsold_transactions.pop(0)
+            volume = min(transaction_to_sell.transaction_size, volume_left)
+            profit = (transaction.cost_basis - transaction_to_sell.cost_basis) * volume
+            if (transaction.datetime - transaction_to_sell.datetime).days > 365:
+                long_term += profit
+            else:
+                short_term += profit
+            if volume < transaction_to_sell.transaction_size:
+                transaction_to_sell.transaction_size -= volume
+                unsold_transactions.append(transaction_to_sell)
+            volume_left -= volume
+    current_profit = short_term + long_term
+    for transaction in unsold_transactions:
+        profit = (last_price - transaction.cost_basis) * transaction.transaction_size
+        if (last_datetime - transaction.datetime).days > 365:
+            long_term += profit
+        else:
+            short_term += profit
+    return current_profit, short_term, long_term
+
+
+def random_history(seed, number_of_transactions=400):
+    generator = random.Random(seed)
+    transactions = []
+    shares_held = 0
+    current_datetime = datetime(2018, 1, 1)
+    for _ in range(number_of_transactions):
+        current_datetime += timedelta(days=generator.choice([0, 0, 1, 7, 30]))
+        # whole dollar prices so that equal cost bases (and ties) are common
+        price = float(generator.randint(5, 25))
+        if shares_held and generator.random() < 0.35:
+            size = generator.randint(1, shares_held)
+            shares_held -= size
+            transaction_type = TRANSACTION_SELL
+        else:
+            size = generator.randint(1, 50)
+            shares_held += size
+            transaction_type = TRANSACTION_BUY
+        transactions.append(
+            Transaction(size, price, current_datetime, transaction_type)
+        )
+    return transactions, current_datetime + timedelta(days=90)
+
+
+class TestAccountant(unittest.TestCase):
+    def run_accountant(self, tax_method, transactions, last_datetime):
+        accountant = Accountant(tax_method)
+        for transaction in transactions:
+            accountant.account_for_transaction(copy.copy(transaction))
+        current_profit = accountant.get_profit()
+        accountant.sell_all_transactions(15.0, last_datetime)
+        return (
+            current_profit,
+            accountant.get_short_term_profit(),
+            accountant.get_long_term_profit(),
+        )
+
+    def test_matches_reference_implementation(self):
+        # a key the lot books do not special case, to cover the sorted fallback
+        sorted_tax_optimizer = TaxMethod(
+            "sorted-tax-optimizer",
+            lambda *args: tax_optimizer_key(*args),
+            False,
+            tax_optimizer_comparator,
+        )
+        for seed in range(5):
+            transactions, last_datetime = random_history(seed)
+            for tax_method in tax_methods + [sorted_tax_optimizer]:
+                with self.subTest(seed=seed, tax_method=tax_method.name):
+                    expected = reference_profits(
+                        tax_method.comparator,
+                        [copy.copy(transaction) for transaction in transactions],
+                        15.0,
+                        last_datetime,
+                    )
+                    actual = self.run_accountant(
+                        tax_method, transactions, last_datetime
+                    )
+                    for expected_value, actual_value in zip(expected, actual):
+                        self.assertAlmostEqual(expected_value, actual_value, places=6)
+
+    def test_partial_lot_goes_behind_equal_lots(self):
+        accountant = Accountant(tax_methods[0])
+        for transaction in [
+            Transaction(10, 5, datetime(2024, 1, 1), TRANSACTION_BUY),
+            Transaction(10, 8, datetime(2024, 1, 1), TRANSACTION_BUY),
+            Transaction(4, 10, datetime(2024, 2, 1), TRANSACTION_SELL),
+            Transaction(10, 10, datetime(2024, 3, 1), TRANSACTION_SELL),
+        ]:
+            accountant.account_for_transaction(transaction)
+        self.assertEqual(accountant.get_short_term_profit(), 4 * 5 + 10 * 2)
+        self.assertEqual(
+            list(accountant.get_unsold_lots()),
+            [Transaction(6, 5, datetime(2024, 1, 1), TRANSACTION_BUY)],
+        )
+
+    def test_shared_lot_store(self):
+        transactions, last_datetime = random_history(0)
+        lot_store = LotStore()
+        accountants = [Accountant(tax_method, lot_store) for tax_method in tax_methods]
+        for transaction in transactions:
+            if transaction.transaction_type == TRANSACTION_BUY:
+                lot_id = lot_store.add(transaction)
+                for accountant in accountants:
+                    accountant.add_lot(lot_id)
+            else:
+                for accountant in accountants:
+                    accountant.account_for_transaction(transaction)
+        for accountant in accountants:
+            with self.subTest(tax_method=accountant.tax_method_name):
+                accountant.sell_all_transactions(15.0, last_datetime)
+                expected = self.run_accountant(
+                    accountant.tax_method, transactions, last_datetime
+                )
+                self.assertEqual(accountant.get_short_term_profit(), expected[1])
+                self.assertEqual(accountant.get_long_term_profit(), expected[2])
+        # the buys themselves are untouched
+        self.assertEqual(
+            lot_store.quantity.tolist(),
+            [
+                transaction.transaction_size
+                for transaction in transactions
+                if transaction.transaction_type == TRANSACTION_BUY
+            ],
+        )
+
+    def test_fork(self):
+        transactions, last_datetime = random_history(3)
+        middle = len(transactions) // 2
+        for tax_method in tax_methods:
+            with self.subTest(tax_method=tax_method.name):
+                accountant = Accountant(tax_method)
+                for transaction in transactions[:middle]:
+                    accountant.account_for_transaction(transaction)
+                fork = accountant.fork()
+                for transaction in transactions[middle:]:
+                    fork.account_for_transaction(transaction)
+                fork.sell_all_transactions(15.0, last_datetime)
+                expected = self.run_accountant(tax_method, transactions, last_datetime)
+                self.assertEqual(fork.get_short_term_profit(), expected[1])
+                self.assertEqual(fork.get_long_term_profit(), expected[2])
+                # the original carries on as if the fork never happened
+                for transaction in transactions[middle:]:
+                    accountant.account_for_transaction(transaction)
+                accountant.sell_all_transactions(15.0, last_datetime)
+                self.assertEqual(accountant.get_short_term_profit(), expected[1])
+                self.assertEqual(accountant.get_long_term_profit(), expected[2])
+
+
+class TestTaxOptimizerLotBook(unittest.TestCase):
+    def test_pops_in_comparator_order(self):
+        sell_price = 10
+        sell_datetime = datetime(2024, 12, 31)
+        tax_method_cmp = lambda x, y: tax_optimizer_comparator(
+            x, y, sell_price, sell_datetime
+        )
+        expected_transactions = sorted(transactions2, key=cmp_to_key(tax_method_cmp))
+
+        lot_store = LotStore()
+        lot_book = TaxOptimizerLotBook(lot_store)
+        for transaction in reversed(transactions2):
+            lot_book.add(lot_store.add(transaction))
+        lot_book.start_sell(sell_price, sell_datetime)
+        popped_lots = [lot_store.lot(lot_book.pop()) for _ in range(len(transactions2))]
+        self.assertEqual(
+            [(lot.cost_basis, lot.datetime) for lot in popped_lots],
+            [(lot.cost_basis, lot.datetime) for lot in expected_transactions],
+        )
+        self.assertEqual(len(lot_book), 0)
+
+    def test_lots_become_long_term(self):
+        lot_store = LotStore()
+        lot_book = TaxOptimizerLotBook(lot_store)
+        old_loss = lot_store.add(
+            Transaction(10, 12, datetime(2024, 1, 1), TRANSACTION_BUY)
+        )
+        new_loss = lot_store.add(
+            Transaction(10, 11, datetime(2024, 6, 1), TRANSACTION_BUY)
+        )
+        lot_book.add(old_loss)
+        lot_book.add(new_loss)
+        # both short term: the bigger loss goes first
+        lot_book.start_sell(10, datetime(2024, 7, 1))
+        self.assertEqual(lot_book.pop(), old_loss)
+        lot_book.add(old_loss)
+        # old_loss is now long term, short-term losses go first
+        lot_book.start_sell(10, datetime(2025, 3, 1))
+        self.assertEqual(lot_book.pop(), new_loss)
+        self.assertEqual(lot_book.pop(), old_loss)
+
+
+if __name__ == "__main__":
+    unittest.main()
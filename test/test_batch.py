@@ -0,0 +1,148 @@
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import batch
+from batch import read_manifest, run_batch
+from engine import run_tax_methods
+from parse import parse_config, parse_transactions
+from test.test_parse import CONFIG, CSV_DATA
+
+CORPORATE_ACTIONS_HEADER = "date,ticker,action,value\n"
+BAD_CSV_DATA = """Date,Action,Symbol,Quantity,Price
+2024-01-02,Buy,TICK,10,$5.00
+"""
+
+run_job = batch.run_job
+
+
+# Kills the worker on crash.csv, runs in the workers forked with the patch
+def run_job_or_crash(transactions_filepath, config_key):
+    if transactions_filepath.endswith("crash.csv"):
+        os._exit(1)
+    return run_job(transactions_filepath, config_key)
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for name, content in [
+            ("good.csv", CSV_DATA),
+            ("bad.csv", BAD_CSV_DATA),
+            ("config.json", json.dumps({**CONFIG, "income_tax_rate": 22})),
+            ("copy.json", json.dumps({**CONFIG, "income_tax_rate": 22})),
+            ("broken.json", "{"),
+        ]:
+            with open(self.get_filepath(name), "w") as f:
+                f.write(content)
+        with open(self.get_filepath("manifest.csv"), "w") as f:
+            f.write(
+                "name,transactions,config\n"
+                "first,good.csv,config.json\n"
+                "bad date,bad.csv,config.json\n"
+                "missing,missing.csv,copy.json\n"
+                "second,good.csv,copy.json\n"
+                "broken config,good.csv,broken.json\n"
+            )
+
+    def get_filepath(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def run_manifest(self, jobs):
+        output_file = io.StringIO()
+        with self.assertLogs(level="ERROR"):
+            failures = run_batch(
+                read_manifest(self.get_filepath("manifest.csv")), output_file, jobs
+            )
+        records = [json.loads(line) for line in output_file.getvalue().splitlines()]
+        return failures, sorted(records, key=lambda record: record["index"])
+
+    def test_errors_are_isolated(self):
+        failures, records = self.run_manifest(1)
+        self.assertEqual(failures, 3)
+        self.assertEqual(
+            [record["status"] for record in records],
+            ["ok", "error", "error", "ok", "error"],
+        )
+        self.assertIn("Bad config", records[4]["error"])
+        self.assertIn("FileNotFoundError", records[2]["error"])
+        config = parse_config(self.get_filepath("config.json"))
+        expected_results = run_tax_methods(
+            parse_transactions(self.get_filepath("good.csv"), config)
+        )
+        for record in [records[0], records[3]]:
+            [ticker_results] = record["tickers"]
+            self.assertEqual(ticker_results["ticker"], "TICK")
+            self.assertEqual(
+                [result["short_term_profit"] for result in ticker_results["results"]],
+                [result.short_term_profit for result in expected_results],
+            )
+
+    def test_worker_pool(self):
+        self.assertEqual(self.run_manifest(2), self.run_manifest(1))
+
+    def test_crashed_worker(self):
+        if multiprocessing.get_start_method() != "fork":
+            self.skipTest("the workers need the patched run_job")
+        with open(self.get_filepath("crash.csv"), "w") as f:
+            f.write(CSV_DATA)
+        with open(self.get_filepath("manifest.csv"), "w") as f:
+            f.write("transactions,config\n")
+            for index in range(8):
+                name = "crash.csv" if index == 1 else "good.csv"
+                f.write(f"{name},config.json\n")
+        with mock.patch("batch.run_job", run_job_or_crash):
+            failures, records = self.run_manifest(2)
+        self.assertEqual(failures, 1)
+        self.assertEqual([record["index"] for record in records], list(range(8)))
+        self.assertEqual(
+            [record["status"] for record in records],
+            ["ok", "error"] + ["ok"] * 6,
+        )
+        self.assertIn("Worker crashed", records[1]["error"])
+
+    def test_same_config_in_other_directories(self):
+        manifest = "name,transactions,config\n"
+        for name, corporate_actions in [
+            ("split", "2024/01/15,TICK,split,2:1\n"),
+            ("no split", "2024/01/15,MISC,ticker_change,OTHR\n"),
+        ]:
+            os.mkdir(self.get_filepath(name))
+            for filename, content in [
+                (
+                    "config.json",
+                    json.dumps(
+                        {
+                            **CONFIG,
+                            "income_tax_rate": 22,
+                            "corporate_actions_file": "corporate_actions.csv",
+                        }
+                    ),
+                ),
+                ("corporate_actions.csv", CORPORATE_ACTIONS_HEADER + corporate_actions),
+            ]:
+                with open(self.get_filepath(os.path.join(name, filename)), "w") as f:
+                    f.write(content)
+            manifest += f"{name},good.csv,{name}/config.json\n"
+        records = self.run_manifest_data(manifest)
+        self.assertNotEqual(records[0]["tickers"], records[1]["tickers"])
+        # each as the only job of the batch
+        for index, line in enumerate(manifest.splitlines()[1:]):
+            [record] = self.run_manifest_data(f"name,transactions,config\n{line}\n")
+            self.assertEqual(record["tickers"], records[index]["tickers"])
+
+    def run_manifest_data(self, manifest):
+        with open(self.get_filepath("manifest.csv"), "w") as f:
+            f.write(manifest)
+        output_file = io.StringIO()
+        run_batch(read_manifest(self.get_filepath("manifest.csv")), output_file, 1)
+        return [json.loads(line) for line in output_file.getvalue().splitlines()]
+
+
+if __name__ == "__main__":
+    unittest.main()
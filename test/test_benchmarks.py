@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.workload import (
+    CONFIG,
+    LOT_SIZE,
+    Workload,
+    write_schwab_csvs,
+    write_transactions_csv,
+)
+from constants import TRANSACTION_BUY, TRANSACTION_SELL
+from parse import parse_transactions, parse_transactions_by_ticker
+from schwab import merge_schwab
+
+
+class TestWorkload(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_filepath(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_transactions_csv(self):
+        workload = Workload(lots=300, sells=100, tickers=3, other_rows=40, seed=4)
+        filepath = self.get_filepath("transactions.csv")
+        write_transactions_csv(filepath, workload)
+        with open(filepath) as f:
+            self.assertEqual(len(f.readlines()) - 1, workload.get_row_count())
+        transactions_by_ticker = parse_transactions_by_ticker(filepath, dict(CONFIG))
+        self.assertEqual(len(transactions_by_ticker), 3)
+        for transactions in transactions_by_ticker.values():
+            buys = [
+                transaction
+                for transaction in transactions
+                if transaction.transaction_type == TRANSACTION_BUY
+            ]
+            sells = [
+                transaction
+                for transaction in transactions
+                if transaction.transaction_type == TRANSACTION_SELL
+            ]
+            self.assertEqual(len(buys), 300)
+            self.assertEqual(len(sells), 100)
+            self.assertLessEqual(
+                sum(sell.transaction_size for sell in sells),
+                sum(buy.transaction_size for buy in buys),
+            )
+        # same seed, same file
+        second_filepath = self.get_filepath("second.csv")
+        write_transactions_csv(second_filepath, workload)
+        with open(filepath) as f, open(second_filepath) as second_f:
+            self.assertEqual(f.read(), second_f.read())
+
+    def test_partial_fill_ratio(self):
+        for partial_fill_ratio in [0.0, 1.0]:
+            filepath = self.get_filepath(f"{partial_fill_ratio}.csv")
+            write_transactions_csv(
+                filepath,
+                Workload(lots=200, sells=50, partial_fill_ratio=partial_fill_ratio),
+            )
+            partial_sells = [
+                transaction
+                for transaction in parse_transactions(filepath, dict(CONFIG))
+                if transaction.transaction_type == TRANSACTION_SELL
+                and transaction.transaction_size % LOT_SIZE
+            ]
+            if partial_fill_ratio:
+                self.assertGreater(len(partial_sells), 40)
+            else:
+                self.assertEqual(partial_sells, [])
+
+    def test_schwab_csvs_merge(self):
+        workload = Workload(lots=60, sells=30, seed=2)
+        transactions_filepath = self.get_filepath("schwab.csv")
+        equity_filepath = self.get_filepath("equity.csv")
+        output_filepath = self.get_filepath("merged.csv")
+        write_schwab_csvs(
+            transactions_filepath, equity_filepath, workload, cancel_ratio=0.2
+        )
+        merge_schwab.main(transactions_filepath, equity_filepath, output_filepath)
+        transactions = list(parse_transactions(output_filepath, dict(CONFIG)))
+        # the tax withholding and the cancelled sells are gone
+        self.assertEqual(len(transactions), 90)
+        self.assertEqual(
+            transactions,
+            sorted(transactions, key=lambda transaction: transaction.datetime),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from checkpoint import run_checkpointed
+from engine import run_tax_methods
+from parse import parse_transactions
+from test.test_parse import CONFIG, CSV_DATA
+
+NEW_ROWS = """02/10/2024,Buy,TICK,4,$7
+03/01/2024,Sell,TICK,6,$9
+03/02/2024,Buy,OTHR,1,$1
+"""
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint_filepath = os.path.join(self.directory, "state.checkpoint")
+        self.transactions_filepath = os.path.join(self.directory, "data.csv")
+        self.write(CSV_DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data, mode="w"):
+        with open(self.transactions_filepath, mode) as f:
+            f.write(data)
+
+    def run_checkpointed(self):
+        with self.assertLogs(level="INFO") as logs:
+            engine = run_checkpointed(
+                self.transactions_filepath, CONFIG, self.checkpoint_filepath
+            )
+        resumed = "Resuming from checkpoint" in "\n".join(logs.output)
+        return engine.get_results(), resumed
+
+    def expected_results(self):
+        return run_tax_methods(parse_transactions(self.transactions_filepath, CONFIG))
+
+    def test_resumes_after_append(self):
+        results, resumed = self.run_checkpointed()
+        self.assertEqual(results, self.expected_results())
+        self.assertFalse(resumed)
+        self.write(NEW_ROWS, "a")
+        results, resumed = self.run_checkpointed()
+        self.assertEqual(results, self.expected_results())
+        self.assertTrue(resumed)
+        # nothing new
+        results, resumed = self.run_checkpointed()
+        self.assertEqual(results, self.expected_results())
+        self.assertTrue(resumed)
+
+    def test_line_numbers_continue(self):
+        self.run_checkpointed()
+        self.write("02/10/2024,Buy,TICK,4,\n", "a")
+        with self.assertLogs(level="ERROR") as logs:
+            run_checkpointed(
+                self.transactions_filepath, CONFIG, self.checkpoint_filepath
+            )
+        line_count = len((CSV_DATA + "x").splitlines())
+        self.assertIn(f"on line {line_count}", "\n".join(logs.output))
+
+    def test_changed_history_replays(self):
+        self.run_checkpointed()
+        self.write(CSV_DATA.replace("$5.00", "$6.00") + NEW_ROWS)
+        results, resumed = self.run_checkpointed()
+        self.assertEqual(results, self.expected_results())
+        self.assertFalse(resumed)
+
+    def test_unterminated_last_line(self):
+        self.write(NEW_ROWS.rstrip("\n"), "a")
+        results, _ = self.run_checkpointed()
+        self.assertEqual(results, self.expected_results())
+        self.assertFalse(os.path.exists(self.checkpoint_filepath))
+        # the last line gets finished off by the next append
+        self.write("\n" + NEW_ROWS, "a")
+        results, resumed = self.run_checkpointed()
+        self.assertEqual(results, self.expected_results())
+        self.assertFalse(resumed)
+
+
+if __name__ == "__main__":
+    unittest.main()
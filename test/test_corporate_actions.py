@@ -0,0 +1,224 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from fractions import Fraction
+
+from constants import TRANSACTION_BUY, TRANSACTION_SELL, TRANSACTION_SPLIT
+from corporate_actions import SplitAdjustment, parse_split_ratio
+from engine import AccountingEngine
+from ledger import CsvLedgerWriter
+from parse import parse_config, parse_transactions, parse_transactions_by_ticker
+from sweep import sweep_liquidation
+from test.test_accountant import random_history
+from test.test_parse import CONFIG
+from transaction import Transaction
+
+CSV_DATA = """Date,Action,Symbol,Quantity,Price
+01/02/2020,Buy,OLD,100,$40.00
+03/02/2020,Buy,OTHR,5,$10.00
+06/01/2020,Stock Split,OLD,300,
+06/02/2020,Sell,NEW,200,$11.00
+"""
+
+CORPORATE_ACTIONS_DATA = """date,ticker,action,value
+2020/05/01,OLD,ticker_change,NEW
+2021/01/04,NEW,split,1:10
+"""
+
+
+def run_engine(transactions, last_price, last_datetime):
+    engine = AccountingEngine()
+    engine.account_for_transactions(transactions)
+    return engine.get_results(last_price, last_datetime)
+
+
+class TestSplitAdjustment(unittest.TestCase):
+    def test_split(self):
+        split_adjustment = SplitAdjustment([(datetime(2020, 6, 1), Fraction(4))])
+        transactions = list(
+            split_adjustment.adjust(
+                [
+                    Transaction(100, 40.0, datetime(2020, 1, 2), TRANSACTION_BUY),
+                    Transaction(400, 11.0, datetime(2020, 6, 1), TRANSACTION_SELL),
+                ]
+            )
+        )
+        self.assertEqual(transactions[1].transaction_size, 100)
+        self.assertEqual(transactions[1].cost_basis, 44.0)
+        for result in run_engine(transactions, None, None):
+            with self.subTest(tax_method=result.tax_method_name):
+                self.assertEqual(result.short_term_profit, 400.0)
+
+    def test_matches_the_hand_edited_history(self):
+        for seed in range(5):
+            transactions, last_datetime = random_history(seed)
+            split_datetime = transactions[len(transactions) // 2].datetime
+            # what we used to do: every row before the split in new shares
+            edited_transactions = [
+                (
+                    Transaction(
+                        transaction.transaction_size * 3,
+                        transaction.cost_basis / 3,
+                        transaction.datetime,
+                        transaction.transaction_type,
+                    )
+                    if transaction.datetime < split_datetime
+                    else transaction
+                )
+                for transaction in transactions
+            ]
+            split_adjustment = SplitAdjustment([(split_datetime, Fraction(3))])
+            results = run_engine(
+                list(split_adjustment.adjust(transactions)),
+                split_adjustment.to_base_price(15.0, last_datetime),
+                last_datetime,
+            )
+            for result, expected in zip(
+                results, run_engine(edited_transactions, 15.0, last_datetime)
+            ):
+                with self.subTest(seed=seed, tax_method=result.tax_method_name):
+                    self.assertAlmostEqual(
+                        result.current_profit, expected.current_profit, places=6
+                    )
+                    self.assertAlmostEqual(
+                        result.short_term_profit, expected.short_term_profit, places=6
+                    )
+                    self.assertAlmostEqual(
+                        result.long_term_profit, expected.long_term_profit, places=6
+                    )
+
+    def test_pending_splits(self):
+        split_adjustment = SplitAdjustment(
+            [(datetime(2020, 6, 1), Fraction(2)), (datetime(2021, 6, 1), Fraction(3))]
+        )
+        list(
+            split_adjustment.adjust(
+                [Transaction(10, 5.0, datetime(2020, 7, 1), TRANSACTION_BUY)]
+            )
+        )
+        self.assertEqual(split_adjustment.to_base_price(1.0), 2.0)
+        self.assertEqual(split_adjustment.to_base_price(1.0, datetime(2021, 6, 1)), 6.0)
+        self.assertEqual(split_adjustment.to_base_quantity(12, datetime(2022, 1, 1)), 2)
+
+    def test_ledger_quantities_are_shares(self):
+        split_adjustment = SplitAdjustment([(datetime(2020, 6, 1), Fraction(4))])
+        ledger = CsvLedgerWriter(io.StringIO())
+        ledger.split_adjustment = split_adjustment
+        engine = AccountingEngine()
+        engine.attach_ledger(ledger, ["fifo"])
+        engine.account_for_transactions(
+            split_adjustment.adjust(
+                [
+                    Transaction(100, 40.0, datetime(2020, 1, 2), TRANSACTION_BUY),
+                    Transaction(400, 11.0, datetime(2020, 6, 1), TRANSACTION_SELL),
+                ]
+            )
+        )
+        row = ledger.ledger_file.getvalue().splitlines()[1].split(",")
+        self.assertEqual(row[3:7], ["400.0", "4400.0", "4000.0", "400.0"])
+
+    def test_sweep_dates_around_a_split(self):
+        transactions, last_datetime = random_history(3)
+        split_datetime = last_datetime + timedelta(days=100)
+        split_adjustment = SplitAdjustment([(split_datetime, Fraction(2))])
+        engine = AccountingEngine()
+        engine.account_for_transactions(split_adjustment.adjust(transactions))
+        prices = [10.0, 20.0]
+        datetimes = [last_datetime, split_datetime + timedelta(days=1)]
+        sweep_results = sweep_liquidation(
+            engine, prices, datetimes, split_adjustment=split_adjustment
+        )
+        for date_index, current_datetime in enumerate(datetimes):
+            for price_index, price in enumerate(prices):
+                results = engine.get_results(
+                    split_adjustment.to_base_price(price, current_datetime),
+                    current_datetime,
+                )
+                for result, sweep_result in zip(results, sweep_results):
+                    with self.subTest(
+                        tax_method=result.tax_method_name,
+                        price=price,
+                        datetime=current_datetime,
+                    ):
+                        self.assertAlmostEqual(
+                            sweep_result.short_term_profit[date_index][price_index]
+                            + sweep_result.long_term_profit[date_index][price_index],
+                            result.short_term_profit + result.long_term_profit,
+                            places=6,
+                        )
+
+    def test_parse_split_ratio(self):
+        self.assertEqual(parse_split_ratio("4:1"), 4)
+        self.assertEqual(parse_split_ratio("1:10"), Fraction(1, 10))
+        self.assertEqual(parse_split_ratio("1.5"), Fraction(3, 2))
+        with self.assertRaises(ValueError):
+            parse_split_ratio("0:1")
+
+
+class TestCorporateActionsConfig(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.transactions_filepath = self.write("transactions.csv", CSV_DATA)
+        self.write("actions.csv", CORPORATE_ACTIONS_DATA)
+        config = dict(
+            CONFIG,
+            ticker_to_track="NEW",
+            transaction_split_values=["Stock Split"],
+            corporate_actions_file="actions.csv",
+        )
+        self.config_filepath = self.write("config.json", json.dumps(config))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, data):
+        filepath = os.path.join(self.directory.name, name)
+        with open(filepath, "w") as f:
+            f.write(data)
+        return filepath
+
+    def test_renamed_ticker(self):
+        config = parse_config(self.config_filepath)
+        transactions = list(parse_transactions(self.transactions_filepath, config))
+        self.assertEqual(
+            [transaction.transaction_type for transaction in transactions],
+            [TRANSACTION_BUY, TRANSACTION_SPLIT, TRANSACTION_SELL],
+        )
+        transactions_by_ticker = parse_transactions_by_ticker(
+            self.transactions_filepath, config
+        )
+        self.assertEqual(list(transactions_by_ticker), ["NEW", "OTHR"])
+
+    def test_split_rows_and_side_file(self):
+        config = parse_config(self.config_filepath)
+        split_adjustment = SplitAdjustment(
+            config["_corporate_actions"].get_splits("NEW")
+        )
+        last_datetime = datetime(2021, 2, 1)
+        # the factor is only known once the split row has gone by
+        transactions = list(
+            split_adjustment.adjust(
+                parse_transactions(self.transactions_filepath, config)
+            )
+        )
+        results = run_engine(
+            transactions,
+            split_adjustment.to_base_price(120.0, last_datetime),
+            last_datetime,
+        )
+        # 4:1 from the split row, then the 1:10 reverse split: the 200 shares
+        # left are 20 shares at $120
+        for result in results:
+            with self.subTest(tax_method=result.tax_method_name):
+                self.assertAlmostEqual(result.current_profit, 2200 - 2000)
+                self.assertAlmostEqual(
+                    result.short_term_profit + result.long_term_profit,
+                    200 + 2400 - 2000,
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
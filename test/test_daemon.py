@@ -0,0 +1,207 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from datetime import datetime
+from unittest import mock
+
+from checkpoint import hash_prefix
+from daemon import DaemonHTTPServer, LotSelectionState
+from engine import run_tax_methods
+from parse import parse_transactions
+from test.test_checkpoint import NEW_ROWS
+from test.test_parse import CONFIG, CSV_DATA
+
+SELL_DATETIME = datetime(2024, 3, 5)
+
+
+class TestLotSelectionState(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.transactions_filepath = os.path.join(self.directory, "data.csv")
+        self.config_filepath = os.path.join(self.directory, "config.json")
+        with open(self.config_filepath, "w") as f:
+            json.dump(dict(CONFIG, capital_gains_tax_rate=15, income_tax_rate=30), f)
+        self.write(CSV_DATA)
+        self.state = LotSelectionState(self.transactions_filepath, self.config_filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data, mode="w"):
+        with open(self.transactions_filepath, mode) as f:
+            f.write(data)
+
+    def expected_results(self):
+        return run_tax_methods(
+            parse_transactions(self.transactions_filepath, self.state.config)
+        )
+
+    def test_preview_does_not_change_the_state(self):
+        results = self.state.engine.get_results()
+        preview = self.state.preview_sell(4, 8.0, SELL_DATETIME)
+        self.assertEqual(self.state.engine.get_results(), results)
+        for method in preview["methods"]:
+            with self.subTest(tax_method=method["tax_method"]):
+                # 6 shares bought at $5 are left
+                self.assertEqual(method["short_term_profit"], 12.0)
+                self.assertAlmostEqual(method["tax"], 12.0 * 0.3)
+                self.assertEqual(
+                    method["lots"],
+                    [
+                        {
+                            "acquisition_date": "2024-01-02",
+                            "quantity": 4,
+                            "proceeds": 32.0,
+                            "cost_basis": 20.0,
+                            "gain": 12.0,
+                            "term": "short",
+                        }
+                    ],
+                )
+
+    def test_capital_loss_limit(self):
+        # an $18 loss against the $10 gain of the year, the net $8 loss is
+        # deducted from ordinary income up to the limit
+        preview = self.state.preview_sell(6, 2.0, SELL_DATETIME)
+        self.assertAlmostEqual(preview["methods"][0]["tax"], -(10 + 8) * 0.3)
+        with open(self.config_filepath, "w") as f:
+            json.dump(
+                dict(
+                    CONFIG,
+                    capital_gains_tax_rate=15,
+                    income_tax_rate=30,
+                    capital_loss_limit=0,
+                ),
+                f,
+            )
+        self.state.reload()
+        preview = self.state.preview_sell(6, 2.0, SELL_DATETIME)
+        self.assertAlmostEqual(preview["methods"][0]["tax"], -10 * 0.3)
+
+    def test_cannot_sell_more_than_is_held(self):
+        with self.assertRaises(ValueError):
+            self.state.preview_sell(7, 8.0, SELL_DATETIME)
+
+    def test_splits_after_the_last_transaction(self):
+        with open(os.path.join(self.directory, "corporate_actions.csv"), "w") as f:
+            f.write("date,ticker,action,value\n2024/03/01,TICK,split,2:1\n")
+        with open(self.config_filepath, "w") as f:
+            json.dump(
+                dict(
+                    CONFIG,
+                    capital_gains_tax_rate=15,
+                    income_tax_rate=30,
+                    corporate_actions_file="corporate_actions.csv",
+                ),
+                f,
+            )
+        self.state.reload()
+        # 6 shares are held before the split and 12 after it
+        self.state.preview_sell(12, 4.0, SELL_DATETIME)
+        with self.assertRaises(ValueError):
+            self.state.preview_sell(13, 4.0, SELL_DATETIME)
+        self.state.preview_sell(6, 8.0, datetime(2024, 2, 20))
+        with self.assertRaises(ValueError):
+            self.state.preview_sell(7, 8.0, datetime(2024, 2, 20))
+
+    def test_refresh_picks_up_appended_rows(self):
+        self.assertFalse(self.state.refresh())
+        self.write(NEW_ROWS, "a")
+        self.assertTrue(self.state.refresh())
+        self.assertEqual(self.state.engine.get_results(), self.expected_results())
+        self.assertEqual(self.state.get_shares_held(), 4)
+
+    def test_refresh_waits_for_the_end_of_the_line(self):
+        self.write("02/10/2024,Buy,TICK,4", "a")
+        with mock.patch("daemon.hash_prefix", wraps=hash_prefix) as hash_prefix_mock:
+            self.assertFalse(self.state.refresh())
+            # the prefix is only hashed again once the file changes
+            self.assertFalse(self.state.refresh())
+            self.assertEqual(hash_prefix_mock.call_count, 1)
+        self.write(",$7\n", "a")
+        self.assertTrue(self.state.refresh())
+        self.assertEqual(self.state.get_shares_held(), 10)
+
+    def test_refresh_replays_edits_of_the_same_size(self):
+        rows = "".join(f"01/{day:02d}/2024,Buy,OTHR,1,$1\n" for day in range(3, 31))
+        self.write(CSV_DATA + rows * 30)
+        self.state.reload()
+        self.assertGreater(os.path.getsize(self.transactions_filepath), 4096 * 4)
+        # the first row, far from the end of the file
+        self.write(CSV_DATA.replace("TICK,10", "TICK,12") + rows * 30)
+        stat = os.stat(self.transactions_filepath)
+        os.utime(
+            self.transactions_filepath,
+            ns=(stat.st_atime_ns, self.state.file_stat.st_mtime_ns + 10**9),
+        )
+        with self.assertLogs(level="INFO"):
+            self.assertTrue(self.state.refresh())
+        self.assertEqual(self.state.get_shares_held(), 8)
+        self.assertEqual(self.state.engine.get_results(), self.expected_results())
+        # touching the file changes nothing
+        os.utime(self.transactions_filepath)
+        self.assertFalse(self.state.refresh())
+
+    def test_refresh_replays_changed_files(self):
+        self.write(CSV_DATA.replace("TICK,10", "TICK,12") + NEW_ROWS)
+        with self.assertLogs(level="INFO"):
+            self.assertTrue(self.state.refresh())
+        self.assertEqual(self.state.engine.get_results(), self.expected_results())
+
+
+class TestDaemonHTTPServer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        transactions_filepath = os.path.join(self.directory, "data.csv")
+        config_filepath = os.path.join(self.directory, "config.json")
+        with open(transactions_filepath, "w") as f:
+            f.write(CSV_DATA)
+        with open(config_filepath, "w") as f:
+            json.dump(CONFIG, f)
+        self.server = DaemonHTTPServer(
+            ("127.0.0.1", 0),
+            LotSelectionState(transactions_filepath, config_filepath),
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def get(self, path):
+        url = f"http://127.0.0.1:{self.server.server_port}{path}"
+        try:
+            with urllib.request.urlopen(url) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            return e.code, json.load(e)
+
+    def test_sell(self):
+        status, body = self.get("/sell?quantity=2&price=9&date=2024/03/05")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["date"], "2024-03-05")
+        self.assertEqual(
+            [method["short_term_profit"] for method in body["methods"]], [8.0] * 5
+        )
+        # no rates in the config
+        self.assertIsNone(body["methods"][0]["tax"])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.get("/sell?quantity=2")[0], 400)
+        self.assertEqual(self.get("/sell?quantity=100&price=9")[0], 400)
+        self.assertEqual(self.get("/nothing")[0], 404)
+        status, body = self.get("/status")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["shares_held"], 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
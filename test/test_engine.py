@@ -0,0 +1,53 @@
+import unittest
+from datetime import datetime
+
+from accountant import Accountant
+from constants import TRANSACTION_BUY, TRANSACTION_SELL
+from engine import AccountingEngine, run_tax_methods
+from tax_methods import tax_methods
+from transaction import Transaction
+from test.test_accountant import random_history
+
+
+class TestAccountingEngine(unittest.TestCase):
+    def test_matches_separate_accountants(self):
+        transactions, last_datetime = random_history(3)
+        results = run_tax_methods(transactions, 15.0, last_datetime)
+        self.assertEqual(
+            [result.tax_method_name for result in results],
+            [tax_method.name for tax_method in tax_methods],
+        )
+        for tax_method, result in zip(tax_methods, results):
+            with self.subTest(tax_method=tax_method.name):
+                accountant = Accountant(tax_method)
+                for transaction in transactions:
+                    accountant.account_for_transaction(transaction)
+                self.assertEqual(result.current_profit, accountant.get_profit())
+                accountant.sell_all_transactions(15.0, last_datetime)
+                self.assertEqual(
+                    result.short_term_profit, accountant.get_short_term_profit()
+                )
+                self.assertEqual(
+                    result.long_term_profit, accountant.get_long_term_profit()
+                )
+
+    def test_results_do_not_sell_lots(self):
+        engine = AccountingEngine()
+        engine.account_for_transactions(
+            [
+                Transaction(10, 5, datetime(2024, 1, 1), TRANSACTION_BUY),
+                Transaction(4, 7, datetime(2024, 2, 1), TRANSACTION_SELL),
+            ]
+        )
+        # defaults to the last transaction's price and date
+        first_results = engine.get_results()
+        second_results = engine.get_results()
+        self.assertEqual(first_results, second_results)
+        for result in first_results:
+            self.assertEqual(result.current_profit, 8)
+            self.assertEqual(result.short_term_profit, 8 + 6 * 2)
+            self.assertEqual(result.long_term_profit, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,232 @@
+import csv
+import io
+import json
+import sys
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from constants import TRANSACTION_BUY, TRANSACTION_SELL
+from engine import AccountingEngine
+from ledger import (
+    LEDGER_FIELDNAMES,
+    CsvLedgerWriter,
+    JsonLinesLedgerWriter,
+    open_ledger,
+)
+from test.test_accountant import random_history
+from transaction import Transaction
+
+
+class TestLedger(unittest.TestCase):
+    def run_engine(self, ledger, transactions, tax_method_names=None, wash_sales=False):
+        engine = AccountingEngine()
+        if wash_sales:
+            engine.attach_wash_sales()
+        engine.attach_ledger(ledger, tax_method_names)
+        engine.account_for_transactions(transactions)
+        engine.detach_ledger()
+        return engine
+
+    def test_gains_add_up_to_the_profits(self):
+        transactions, _ = random_history(5)
+        ledger_file = io.StringIO()
+        engine = self.run_engine(JsonLinesLedgerWriter(ledger_file), transactions)
+        rows = [json.loads(line) for line in ledger_file.getvalue().splitlines()]
+        for accountant in engine.accountants:
+            with self.subTest(tax_method=accountant.get_tax_method_name()):
+                method_rows = [
+                    row
+                    for row in rows
+                    if row["tax_method"] == accountant.get_tax_method_name()
+                ]
+                for term, profit in [
+                    ("short", accountant.get_short_term_profit()),
+                    ("long", accountant.get_long_term_profit()),
+                ]:
+                    self.assertAlmostEqual(
+                        sum(row["gain"] for row in method_rows if row["term"] == term),
+                        profit,
+                        places=6,
+                    )
+                self.assertEqual(
+                    sum(row["quantity"] for row in method_rows),
+                    sum(
+                        transaction.transaction_size
+                        for transaction in transactions
+                        if transaction.transaction_type == TRANSACTION_SELL
+                    ),
+                )
+
+    def test_csv(self):
+        ledger_file = io.StringIO()
+        self.run_engine(
+            CsvLedgerWriter(ledger_file),
+            [
+                Transaction(10, 5, datetime(2023, 1, 1), TRANSACTION_BUY),
+                Transaction(10, 8, datetime(2024, 1, 10), TRANSACTION_BUY),
+                Transaction(15, 10, datetime(2024, 2, 1), TRANSACTION_SELL),
+                # less than the lot, still written as a float
+                Transaction(1, 10, datetime(2024, 2, 2), TRANSACTION_SELL),
+            ],
+            ["fifo"],
+        )
+        rows = list(csv.reader(io.StringIO(ledger_file.getvalue())))
+        self.assertEqual(rows[0], LEDGER_FIELDNAMES)
+        self.assertEqual(
+            rows[1:],
+            [
+                [
+                    "fifo",
+                    "2024-02-01",
+                    "2023-01-01",
+                    "10.0",
+                    "100.0",
+                    "50.0",
+                    "50.0",
+                    "long",
+                    "0.0",
+                ],
+                [
+                    "fifo",
+                    "2024-02-01",
+                    "2024-01-10",
+                    "5.0",
+                    "50.0",
+                    "40.0",
+                    "10.0",
+                    "short",
+                    "0.0",
+                ],
+                [
+                    "fifo",
+                    "2024-02-02",
+                    "2024-01-10",
+                    "1.0",
+                    "10.0",
+                    "8.0",
+                    "2.0",
+                    "short",
+                    "0.0",
+                ],
+            ],
+        )
+
+    def test_wash_sales(self):
+        ledger_file = io.StringIO()
+        self.run_engine(
+            CsvLedgerWriter(ledger_file),
+            [
+                Transaction(5, 1, datetime(2023, 12, 1), TRANSACTION_BUY),
+                Transaction(10, 10, datetime(2024, 1, 1), TRANSACTION_BUY),
+                Transaction(10, 8, datetime(2024, 2, 1), TRANSACTION_SELL),
+                Transaction(5, 8, datetime(2024, 2, 10), TRANSACTION_SELL),
+                # replaces half of the shares sold at a loss
+                Transaction(5, 8, datetime(2024, 2, 15), TRANSACTION_BUY),
+                Transaction(5, 9, datetime(2024, 6, 1), TRANSACTION_SELL),
+            ],
+            ["lifo"],
+            wash_sales=True,
+        )
+        rows = list(csv.reader(io.StringIO(ledger_file.getvalue())))
+        self.assertEqual(
+            rows[1:],
+            [
+                # held until its loss could no longer be washed, still first
+                [
+                    "lifo",
+                    "2024-02-01",
+                    "2024-01-01",
+                    "10.0",
+                    "80.0",
+                    "100.0",
+                    "-20.0",
+                    "short",
+                    "10.0",
+                ],
+                [
+                    "lifo",
+                    "2024-02-10",
+                    "2023-12-01",
+                    "5.0",
+                    "40.0",
+                    "5.0",
+                    "35.0",
+                    "short",
+                    "0.0",
+                ],
+                # the replacement shares, with the adjusted basis and date
+                [
+                    "lifo",
+                    "2024-06-01",
+                    "2024-01-15",
+                    "5.0",
+                    "45.0",
+                    "50.0",
+                    "-5.0",
+                    "short",
+                    "0.0",
+                ],
+            ],
+        )
+
+    def test_wash_sales_add_up_to_the_profits(self):
+        transactions, _ = random_history(5)
+        ledger_file = io.StringIO()
+        engine = self.run_engine(
+            JsonLinesLedgerWriter(ledger_file), transactions, wash_sales=True
+        )
+        rows = [json.loads(line) for line in ledger_file.getvalue().splitlines()]
+        for accountant in engine.accountants:
+            with self.subTest(tax_method=accountant.get_tax_method_name()):
+                method_rows = [
+                    row
+                    for row in rows
+                    if row["tax_method"] == accountant.get_tax_method_name()
+                ]
+                self.assertAlmostEqual(
+                    sum(row["wash_sale_disallowed"] for row in method_rows),
+                    accountant.wash_sales.disallowed_loss,
+                    places=6,
+                )
+                self.assertAlmostEqual(
+                    sum(
+                        row["gain"] + row["wash_sale_disallowed"] for row in method_rows
+                    ),
+                    accountant.get_short_term_profit()
+                    + accountant.get_long_term_profit(),
+                    places=6,
+                )
+
+    def test_stdout(self):
+        stdout = io.StringIO()
+        with mock.patch.object(sys, "stdout", stdout):
+            ledger = open_ledger("-")
+            self.run_engine(
+                ledger,
+                [
+                    Transaction(10, 5, datetime(2024, 1, 1), TRANSACTION_BUY),
+                    Transaction(4, 10, datetime(2024, 2, 1), TRANSACTION_SELL),
+                ],
+                ["fifo"],
+            )
+            ledger.close()
+        self.assertFalse(stdout.closed)
+        rows = list(csv.reader(io.StringIO(stdout.getvalue())))
+        self.assertEqual(rows[0], LEDGER_FIELDNAMES)
+        self.assertEqual(rows[1][:4], ["fifo", "2024-02-01", "2024-01-01", "4.0"])
+
+    def test_forks_are_not_written(self):
+        transactions, _ = random_history(2)
+        ledger_file = io.StringIO()
+        engine = AccountingEngine()
+        engine.attach_ledger(JsonLinesLedgerWriter(ledger_file))
+        engine.account_for_transactions(transactions[:-1])
+        written = ledger_file.getvalue()
+        fork = engine.accountants[0].fork()
+        fork.sell(Transaction(1, 10, transactions[-1].datetime, TRANSACTION_SELL))
+        self.assertEqual(ledger_file.getvalue(), written)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.workload import CONFIG, TRACKED_TICKER, Workload, write_schwab_csvs
+from constants import CORPORATE_ACTIONS_KEY
+from corporate_actions import read_corporate_actions
+from parse import TransactionParser, parse_transactions
+from schwab import merge_schwab
+from schwab.merge_schwab import (
+    CancelledSells,
+    RowStack,
+    UnmatchedCancel,
+    merge_transactions,
+    parse_merged_transactions,
+    stack_transactions,
+    unstack_transactions,
+)
+
+FIELDNAMES = ["Date", "Action", "Quantity", "Amount"]
+
+
+def make_row(date, action, quantity, amount):
+    return {"Date": date, "Action": action, "Quantity": quantity, "Amount": amount}
+
+
+# the backwards scan merge_schwab used to do, restricted to sells
+def remove_cancelled_sells_by_scan(transactions):
+    indexes_to_remove = set()
+    for i, transaction in enumerate(transactions):
+        if transaction["Action"] != "Cancel Sell":
+            continue
+        for j in range(i - 1, -1, -1):
+            if (
+                j not in indexes_to_remove
+                and transactions[j]["Action"] == "Sell"
+                and transactions[j]["Amount"] == transaction["Amount"][1:]
+                and transactions[j]["Quantity"] == transaction["Quantity"]
+            ):
+                indexes_to_remove.update([i, j])
+                break
+    return [
+        transaction
+        for i, transaction in enumerate(transactions)
+        if i not in indexes_to_remove
+    ]
+
+
+class TestCancelledSells(unittest.TestCase):
+    # removes the cancelled sells of the oldest first `transactions` in place,
+    # going through the newest first stack like merge_transactions
+    def remove(self, transactions, match_month=False, chunk_size=1000):
+        cancelled_sells = CancelledSells(match_month)
+        row_stack, row_count = stack_transactions(
+            reversed(transactions), FIELDNAMES, cancelled_sells, chunk_size
+        )
+        transactions[:] = [
+            transaction
+            for _, transaction in unstack_transactions(row_stack, cancelled_sells)
+        ]
+        return cancelled_sells.get_unmatched_cancels(row_count)
+
+    def test_matches_the_scan(self):
+        transactions = [
+            make_row("01/03/2020", "Stock Plan Activity", "10", ""),
+            make_row("01/04/2020", "Sell", "5", "$50.00"),
+            make_row("01/05/2020", "Sell", "5", "$50.00"),
+            make_row("01/05/2020", "Cancel Sell", "5", "-$50.00"),
+            make_row("01/06/2020", "Sell", "3", "$33.00"),
+            make_row("01/06/2020", "Cancel Sell", "5", "-$50.00"),
+            make_row("01/07/2020", "Cancel Sell", "5", "-$50.00"),
+            make_row("01/07/2020", "Sell", "3", "$33.00"),
+        ]
+        expected = remove_cancelled_sells_by_scan(transactions)
+        for chunk_size in [1000, 3, 1]:
+            with self.subTest(chunk_size=chunk_size):
+                remaining_transactions = [dict(row) for row in transactions]
+                unmatched_cancels = self.remove(
+                    remaining_transactions, chunk_size=chunk_size
+                )
+                self.assertEqual(remaining_transactions, expected)
+                self.assertEqual(
+                    unmatched_cancels,
+                    [UnmatchedCancel(6, "01/07/2020", "-$50.00", "5")],
+                )
+
+    def test_cancels_the_latest_sell(self):
+        first_sell = make_row("01/04/2020", "Sell", "5", "$50.00")
+        second_sell = make_row("01/05/2020", "Sell", "5", "$50.00")
+        transactions = [
+            first_sell,
+            second_sell,
+            make_row("01/05/2020", "Cancel Sell", "5", "-$50.00"),
+        ]
+        self.assertEqual(self.remove(transactions), [])
+        self.assertIs(transactions[0], first_sell)
+        self.assertEqual(len(transactions), 1)
+
+    def test_cancel_before_its_sell_is_unmatched(self):
+        transactions = [
+            make_row("01/04/2020", "Cancel Sell", "5", "-$50.00"),
+            make_row("01/05/2020", "Sell", "5", "$50.00"),
+        ]
+        unmatched_cancels = self.remove(transactions)
+        self.assertEqual([cancel.index for cancel in unmatched_cancels], [0])
+        # an unmatched cancel is kept
+        self.assertEqual(len(transactions), 2)
+
+    def test_match_month(self):
+        rows = [
+            make_row("01/30/2020 as of 01/29/2020", "Sell", "5", "$50.00"),
+            make_row("01/31/2020", "Cancel Sell", "5", "-$50.00"),
+        ]
+        transactions = list(rows)
+        self.assertEqual(self.remove(transactions, match_month=True), [])
+        self.assertEqual(transactions, [])
+
+        rows[1]["Date"] = "02/02/2020"
+        transactions = list(rows)
+        unmatched_cancels = self.remove(transactions, match_month=True)
+        self.assertEqual([cancel.index for cancel in unmatched_cancels], [1])
+        self.assertEqual(transactions, rows)
+
+
+class TestRowStack(unittest.TestCase):
+    def test_pops_oldest_first(self):
+        rows = [make_row(f"01/{day:02d}/2020", "Sell", "1", "") for day in range(1, 11)]
+        expected = [(index, "01/2020", row) for index, row in enumerate(rows)]
+        expected.reverse()
+        for chunk_size in [1, 2, 3, 10, 100]:
+            with self.subTest(chunk_size=chunk_size):
+                row_stack = RowStack(FIELDNAMES, chunk_size)
+                for index, row in enumerate(rows):
+                    row_stack.push(index, "01/2020", row)
+                self.assertEqual(list(row_stack.pop_all()), expected)
+                self.assertEqual(row_stack.spill_files, [])
+
+
+class TestMergeTransactions(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.transactions_filepath = self.get_filepath("transactions.csv")
+        self.equity_filepath = self.get_filepath("equity.csv")
+        write_schwab_csvs(
+            self.transactions_filepath,
+            self.equity_filepath,
+            Workload(lots=200, sells=100, seed=3),
+            cancel_ratio=0.3,
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_filepath(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_spilling_does_not_change_the_merge(self):
+        merges = []
+        for chunk_size in [100000, 7]:
+            merged_transactions = merge_transactions(
+                self.transactions_filepath, self.equity_filepath, chunk_size=chunk_size
+            )
+            merges.append(list(merged_transactions.transactions))
+        self.assertEqual(merges[0], merges[1])
+        dates = [transaction["Date"] for transaction, _ in merges[0]]
+        self.assertEqual(
+            dates,
+            sorted(dates, key=lambda date: (date[6:], date[:2], date[3:5])),
+        )
+
+    def test_parse_merged_transactions(self):
+        merged_filepath = self.get_filepath("merged.csv")
+        merge_schwab.main(
+            self.transactions_filepath, self.equity_filepath, merged_filepath
+        )
+        expected = list(parse_transactions(merged_filepath, dict(CONFIG)))
+
+        output_filepath = self.get_filepath("output.csv")
+        transactions = list(
+            parse_merged_transactions(
+                merge_transactions(self.transactions_filepath, self.equity_filepath),
+                TransactionParser(CONFIG),
+                output_filepath,
+            )
+        )
+        self.assertEqual(transactions, expected)
+        with open(merged_filepath) as merged_file, open(output_filepath) as output:
+            self.assertEqual(output.read(), merged_file.read())
+
+    def test_parse_merged_transactions_of_an_old_ticker(self):
+        corporate_actions_filepath = self.get_filepath("corporate_actions.csv")
+        with open(corporate_actions_filepath, "w") as f:
+            f.write("date,ticker,action,value\n")
+            f.write(f"2030/01/01,{TRACKED_TICKER},ticker_change,NEW\n")
+        config = {
+            **CONFIG,
+            "ticker_to_track": "NEW",
+            CORPORATE_ACTIONS_KEY: read_corporate_actions(corporate_actions_filepath),
+        }
+        transactions = [
+            list(
+                parse_merged_transactions(
+                    merge_transactions(
+                        self.transactions_filepath, self.equity_filepath
+                    ),
+                    TransactionParser(parser_config),
+                )
+            )
+            for parser_config in [CONFIG, config]
+        ]
+        self.assertTrue(transactions[0])
+        self.assertEqual(transactions[1], transactions[0])
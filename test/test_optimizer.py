@@ -0,0 +1,213 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from constants import TRANSACTION_BUY, TRANSACTION_SELL
+from engine import run_tax_methods
+from optimizer import (
+    OPTIMAL_BOUND_TAX_METHOD_NAME,
+    OPTIMAL_TAX_METHOD_NAME,
+    LotSelectionProblem,
+    optimize_tax_burden,
+)
+from taxes import calculate_tax_burden
+from transaction import Transaction
+from test.test_accountant import random_history
+
+
+# Every long-term profit that selling shares one at a time can reach
+def brute_force_long_term_profits(transactions, last_price, last_datetime):
+    long_term_profits = set()
+
+    def is_long_term(buy_datetime, sell_datetime):
+        return (sell_datetime - buy_datetime).days > 365
+
+    def account(index, lots, long_term_profit):
+        if index == len(transactions):
+            for cost_basis, buy_datetime, quantity in lots:
+                if is_long_term(buy_datetime, last_datetime):
+                    long_term_profit += (last_price - cost_basis) * quantity
+            long_term_profits.add(long_term_profit)
+            return
+        transaction = transactions[index]
+        if transaction.transaction_type == TRANSACTION_BUY:
+            lot = (
+                transaction.cost_basis,
+                transaction.datetime,
+                transaction.transaction_size,
+            )
+            account(index + 1, lots + [lot], long_term_profit)
+            return
+
+        def sell(shares_left, lots, long_term_profit):
+            if shares_left == 0:
+                account(index + 1, lots, long_term_profit)
+                return
+            for lot_index, (cost_basis, buy_datetime, quantity) in enumerate(lots):
+                if not quantity:
+                    continue
+                lots_left = list(lots)
+                lots_left[lot_index] = (cost_basis, buy_datetime, quantity - 1)
+                profit = 0
+                if is_long_term(buy_datetime, transaction.datetime):
+                    profit = transaction.cost_basis - cost_basis
+                sell(shares_left - 1, lots_left, long_term_profit + profit)
+
+        sell(transaction.transaction_size, lots, long_term_profit)
+
+    account(0, [], 0)
+    return long_term_profits
+
+
+def small_history(seed):
+    generator = random.Random(seed)
+    current_datetime = datetime(2020, 1, 1)
+    transactions = []
+    shares_held = 0
+    for _ in range(generator.randint(2, 6)):
+        current_datetime += timedelta(days=generator.choice([0, 100, 200, 366, 400]))
+        price = float(generator.randint(1, 9))
+        if shares_held and generator.random() < 0.4:
+            size = generator.randint(1, min(shares_held, 2))
+            shares_held -= size
+            transaction_type = TRANSACTION_SELL
+        else:
+            size = generator.randint(1, 2)
+            shares_held += size
+            transaction_type = TRANSACTION_BUY
+        transactions.append(
+            Transaction(size, price, current_datetime, transaction_type)
+        )
+    last_datetime = current_datetime + timedelta(
+        days=generator.choice([-500, 0, 200, 400])
+    )
+    return transactions, float(generator.randint(1, 9)), last_datetime
+
+
+class TestOptimizer(unittest.TestCase):
+    def test_long_term_profit_bounds(self):
+        for seed in range(100):
+            transactions, last_price, last_datetime = small_history(seed)
+            with self.subTest(seed=seed):
+                long_term_profits = brute_force_long_term_profits(
+                    transactions, last_price, last_datetime
+                )
+                problem = LotSelectionProblem(transactions, last_price, last_datetime)
+                self.assertAlmostEqual(
+                    problem.solve(maximize_long_term=True).long_term_profit,
+                    max(long_term_profits),
+                )
+                self.assertAlmostEqual(
+                    problem.solve(maximize_long_term=False).long_term_profit,
+                    min(long_term_profits),
+                )
+
+    def test_optimum_or_lower_bound(self):
+        names = set()
+        for seed in range(100):
+            transactions, last_price, last_datetime = small_history(seed)
+            long_term_profits = brute_force_long_term_profits(
+                transactions, last_price, last_datetime
+            )
+            for capital_gains_tax_rate, income_tax_rate in [(0.15, 0.22), (0.3, 0.1)]:
+                with self.subTest(
+                    seed=seed, capital_gains_tax_rate=capital_gains_tax_rate
+                ):
+                    result = optimize_tax_burden(
+                        transactions,
+                        last_price,
+                        last_datetime,
+                        capital_gains_tax_rate,
+                        income_tax_rate,
+                    )
+                    total_profit = result.short_term_profit + result.long_term_profit
+                    tax_burden = calculate_tax_burden(
+                        result.short_term_profit,
+                        result.long_term_profit,
+                        capital_gains_tax_rate,
+                        income_tax_rate,
+                    )
+                    lowest_tax_burden = min(
+                        calculate_tax_burden(
+                            total_profit - long_term_profit,
+                            long_term_profit,
+                            capital_gains_tax_rate,
+                            income_tax_rate,
+                        )
+                        for long_term_profit in long_term_profits
+                    )
+                    names.add(result.tax_method_name)
+                    if result.tax_method_name == OPTIMAL_TAX_METHOD_NAME:
+                        self.assertAlmostEqual(tax_burden, lowest_tax_burden)
+                    else:
+                        self.assertEqual(
+                            result.tax_method_name, OPTIMAL_BOUND_TAX_METHOD_NAME
+                        )
+                        self.assertLess(tax_burden, lowest_tax_burden + 1e-9)
+        self.assertEqual(
+            names, {OPTIMAL_TAX_METHOD_NAME, OPTIMAL_BOUND_TAX_METHOD_NAME}
+        )
+
+    def test_beats_every_tax_method(self):
+        for seed in range(3):
+            transactions, last_datetime = random_history(seed, 200)
+            for last_price in [5.0, 40.0]:
+                for capital_gains_tax_rate, income_tax_rate in [
+                    (0.15, 0.22),
+                    (0.3, 0.1),
+                ]:
+                    with self.subTest(
+                        seed=seed,
+                        last_price=last_price,
+                        capital_gains_tax_rate=capital_gains_tax_rate,
+                    ):
+                        result = optimize_tax_burden(
+                            transactions,
+                            last_price,
+                            last_datetime,
+                            capital_gains_tax_rate,
+                            income_tax_rate,
+                        )
+                        tax_burden = calculate_tax_burden(
+                            result.short_term_profit,
+                            result.long_term_profit,
+                            capital_gains_tax_rate,
+                            income_tax_rate,
+                        )
+                        for other in run_tax_methods(
+                            transactions, last_price, last_datetime
+                        ):
+                            self.assertAlmostEqual(
+                                result.short_term_profit + result.long_term_profit,
+                                other.short_term_profit + other.long_term_profit,
+                            )
+                            self.assertLessEqual(
+                                tax_burden,
+                                calculate_tax_burden(
+                                    other.short_term_profit,
+                                    other.long_term_profit,
+                                    capital_gains_tax_rate,
+                                    income_tax_rate,
+                                )
+                                + 1e-6,
+                            )
+
+    def test_needs_date_order(self):
+        transactions = [
+            Transaction(1, 5, datetime(2024, 2, 1), TRANSACTION_BUY),
+            Transaction(1, 5, datetime(2024, 1, 1), TRANSACTION_BUY),
+        ]
+        with self.assertRaises(ValueError):
+            optimize_tax_burden(transactions)
+
+    def test_overselling(self):
+        transactions = [
+            Transaction(1, 5, datetime(2024, 1, 1), TRANSACTION_SELL),
+            Transaction(1, 5, datetime(2024, 2, 1), TRANSACTION_BUY),
+        ]
+        with self.assertRaises(ValueError):
+            optimize_tax_burden(transactions)
+
+
+if __name__ == "__main__":
+    unittest.main()
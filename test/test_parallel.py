@@ -0,0 +1,24 @@
+import unittest
+
+from engine import run_tax_methods
+from parallel import run_tax_methods_parallel
+from transaction import pack_transactions, unpack_transactions
+from test.test_accountant import random_history
+
+
+class TestParallel(unittest.TestCase):
+    def test_pack_round_trip(self):
+        transactions, _ = random_history(1)
+        packed_transactions = pack_transactions(transactions)
+        self.assertEqual(list(unpack_transactions(packed_transactions)), transactions)
+
+    def test_matches_single_process(self):
+        transactions, last_datetime = random_history(2)
+        self.assertEqual(
+            run_tax_methods_parallel(transactions, 2, 15.0, last_datetime),
+            run_tax_methods(transactions, 15.0, last_datetime),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,300 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from constants import TRANSACTION_BUY, TRANSACTION_SELL
+from parse import (
+    DateParser,
+    FAST_DATE_FORMATS,
+    ParsePosition,
+    TransactionParser,
+    TransactionSource,
+    parse_config,
+    parse_source_config,
+    parse_transaction,
+    parse_transactions,
+    parse_transactions_by_ticker,
+)
+from stats import Stats
+from transaction import Transaction
+
+CONFIG = {
+    "date_column": "Date",
+    "date_format": "%m/%d/%Y",
+    "ticker_column": "Symbol",
+    "ticker_to_track": "TICK",
+    "quanitity_column": "Quantity",
+    "security_price_column": "Price",
+    "transaction_type_column": "Action",
+    "transaction_buy_values": ["Stock Plan Activity", "Buy"],
+    "transaction_sell_values": ["Sell"],
+}
+
+CSV_DATA = """Date,Action,Symbol,Quantity,Price
+01/02/2024,Stock Plan Activity,TICK,10,$5.00
+01/03/2024,Buy,OTHR,3,$20
+01/04/2024,Dividend,TICK,1,$1
+02/01/2024,Sell,TICK,4,$7.50
+02/02/2024,Sell,OTHR,1,$21
+02/03/2024,Journal,MISC,1,$1
+"""
+
+
+class TestParseTransactions(unittest.TestCase):
+    def setUp(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(CSV_DATA)
+        self.transactions_filepath = f.name
+
+    def tearDown(self):
+        os.remove(self.transactions_filepath)
+
+    def test_parse_transactions(self):
+        self.assertEqual(
+            list(parse_transactions(self.transactions_filepath, CONFIG)),
+            [
+                Transaction(10, 5.0, datetime(2024, 1, 2), TRANSACTION_BUY),
+                Transaction(4, 7.5, datetime(2024, 2, 1), TRANSACTION_SELL),
+            ],
+        )
+
+    def test_parse_transactions_by_ticker(self):
+        transactions_by_ticker = parse_transactions_by_ticker(
+            self.transactions_filepath, CONFIG
+        )
+        self.assertEqual(list(transactions_by_ticker), ["TICK", "OTHR"])
+        self.assertEqual(
+            transactions_by_ticker["OTHR"],
+            [
+                Transaction(3, 20.0, datetime(2024, 1, 3), TRANSACTION_BUY),
+                Transaction(1, 21.0, datetime(2024, 2, 2), TRANSACTION_SELL),
+            ],
+        )
+        self.assertEqual(
+            transactions_by_ticker["TICK"],
+            list(parse_transactions(self.transactions_filepath, CONFIG)),
+        )
+
+    def test_parse_transactions_for_tickers(self):
+        transactions_by_ticker = parse_transactions_by_ticker(
+            self.transactions_filepath, CONFIG, ["OTHR", "NONE"]
+        )
+        self.assertEqual(list(transactions_by_ticker), ["OTHR", "NONE"])
+        self.assertEqual(len(transactions_by_ticker["OTHR"]), 2)
+        self.assertEqual(transactions_by_ticker["NONE"], [])
+
+    def test_parse_transaction_row(self):
+        transaction_row = {
+            "Date": "02/01/2024",
+            "Action": "Sell",
+            "Symbol": "TICK",
+            "Quantity": "4",
+            "Price": "$7.50",
+        }
+        self.assertEqual(
+            parse_transaction(transaction_row, CONFIG, 2),
+            Transaction(4, 7.5, datetime(2024, 2, 1), TRANSACTION_SELL),
+        )
+        transaction_row["Symbol"] = "OTHR"
+        self.assertIsNone(parse_transaction(transaction_row, CONFIG, 2))
+
+    def test_short_rows_and_blank_lines(self):
+        with open(self.transactions_filepath, "w") as f:
+            f.write("Date,Action,Symbol,Quantity,Price\n\n01/02/2024,Buy,TICK,1\n")
+        with self.assertLogs(level="ERROR") as logs:
+            transactions = list(parse_transactions(self.transactions_filepath, CONFIG))
+        self.assertEqual(transactions, [])
+        self.assertIn("Transaction cost not found on line 2", logs.output[0])
+
+
+ESPP_CONFIG = {
+    "date_column": "Purchase Date",
+    "date_format": "%Y-%m-%d",
+    "ticker_column": "Ticker",
+    "quanitity_column": "Shares",
+    "security_price_column": "Purchase Price",
+    "transaction_type_column": "Type",
+    "transaction_buy_values": ["ESPP"],
+}
+
+ESPP_CSV_DATA = """Purchase Date,Type,Ticker,Shares,Purchase Price
+2024-01-02,ESPP,TICK,2,4.25
+2024-01-31,ESPP,TICK,3,4.5
+2024-02-01,ESPP,TICK,5,6
+"""
+
+
+class TestParseSources(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.transactions_filepath = self.write("brokerage.csv", CSV_DATA)
+        self.espp_filepath = self.write("espp.csv", ESPP_CSV_DATA)
+        self.espp_config = parse_source_config(
+            self.write("espp.json", json.dumps(ESPP_CONFIG)), CONFIG
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, data):
+        filepath = os.path.join(self.directory.name, name)
+        with open(filepath, "w") as f:
+            f.write(data)
+        return filepath
+
+    def sources(self):
+        return [
+            self.transactions_filepath,
+            TransactionSource(self.espp_filepath, self.espp_config),
+        ]
+
+    def test_merged_by_date(self):
+        self.assertEqual(
+            list(parse_transactions(self.sources(), CONFIG)),
+            [
+                # same date: the order of the sources
+                Transaction(10, 5.0, datetime(2024, 1, 2), TRANSACTION_BUY),
+                Transaction(2, 4.25, datetime(2024, 1, 2), TRANSACTION_BUY),
+                Transaction(3, 4.5, datetime(2024, 1, 31), TRANSACTION_BUY),
+                Transaction(4, 7.5, datetime(2024, 2, 1), TRANSACTION_SELL),
+                Transaction(5, 6.0, datetime(2024, 2, 1), TRANSACTION_BUY),
+            ],
+        )
+
+    def test_parse_transactions_by_ticker(self):
+        transactions_by_ticker = parse_transactions_by_ticker(self.sources(), CONFIG)
+        self.assertEqual(list(transactions_by_ticker), ["TICK", "OTHR"])
+        self.assertEqual(len(transactions_by_ticker["TICK"]), 5)
+        self.assertEqual(len(transactions_by_ticker["OTHR"]), 2)
+
+    def test_matches_sorting_everything(self):
+        transactions = []
+        for day in range(1, 29):
+            for month in range(1, 13):
+                transactions.append(
+                    Transaction(day, float(month), datetime(2023, month, day), "BUY")
+                )
+        rows = [
+            f"{transaction.datetime:%m/%d/%Y},Buy,TICK,"
+            f"{transaction.transaction_size},{transaction.cost_basis}\n"
+            for transaction in sorted(transactions, key=lambda t: t.datetime)
+        ]
+        header = "Date,Action,Symbol,Quantity,Price\n"
+        filepaths = [
+            self.write(f"{index}.csv", header + "".join(rows[index::3]))
+            for index in range(3)
+        ]
+        # more batches than a queue holds
+        with mock.patch("parse.SOURCE_BATCH_SIZE", 5):
+            merged_transactions = list(parse_transactions(filepaths, CONFIG))
+        self.assertEqual(
+            merged_transactions, sorted(transactions, key=lambda t: t.datetime)
+        )
+
+    def test_unsorted_file(self):
+        self.write(
+            "espp.csv",
+            ESPP_CSV_DATA
+            + "2024-01-01,ESPP,TICK,1,4\n"
+            + "2024-03-01,ESPP,TICK,1,4\n"
+            + "2024-01-01,ESPP,TICK,1,4\n",
+        )
+        with self.assertLogs(level="WARNING") as logs:
+            transactions = list(parse_transactions(self.sources(), CONFIG))
+        self.assertEqual(len(transactions), 8)
+        # once, though the dates go back twice
+        self.assertEqual(len(logs.records), 1)
+
+    def test_errors_are_raised(self):
+        self.write("espp.csv", ESPP_CSV_DATA + "02/02/2024,ESPP,TICK,1,4\n")
+        with self.assertRaises(ValueError):
+            list(parse_transactions(self.sources(), CONFIG))
+        with self.assertRaises(ValueError):
+            next(parse_transactions(self.sources(), CONFIG, ParsePosition()))
+
+    def test_own_corporate_actions_file(self):
+        self.write("actions.csv", "date,ticker,action,value\n")
+        self.write("other.csv", "date,ticker,action,value\n")
+        config = parse_config(
+            self.write(
+                "config.json",
+                json.dumps(dict(CONFIG, corporate_actions_file="actions.csv")),
+            )
+        )
+        # the main config's file is fine
+        espp_config_filepath = self.write(
+            "espp.json",
+            json.dumps(dict(ESPP_CONFIG, corporate_actions_file="actions.csv")),
+        )
+        parse_source_config(espp_config_filepath, config)
+        self.write(
+            "espp.json",
+            json.dumps(dict(ESPP_CONFIG, corporate_actions_file="other.csv")),
+        )
+        with self.assertRaises(ValueError):
+            parse_source_config(espp_config_filepath, config)
+
+    def test_stats_are_counted_per_reader(self):
+        stats = Stats()
+        config = dict(CONFIG, _transaction_parser=TransactionParser(CONFIG))
+        config["_transaction_parser"].stats = stats
+        self.espp_config["_transaction_parser"].stats = stats
+        sources = [
+            TransactionSource(self.transactions_filepath, config),
+            TransactionSource(self.espp_filepath, self.espp_config),
+        ]
+        with mock.patch("parse.SOURCE_BATCH_SIZE", 1):
+            self.assertEqual(len(list(parse_transactions(sources, config))), 5)
+        self.assertEqual(stats.counters["parsing"]["rows"], 6 + 3)
+        self.assertEqual(stats.counters["skipped_rows"]["unrelated_ticker"], 3)
+
+    def test_closing_stops_the_readers(self):
+        threads = threading.active_count()
+        header = "Date,Action,Symbol,Quantity,Price\n"
+        rows = "01/02/2024,Buy,TICK,1,$1\n" * 10000
+        filepaths = [self.write(f"{index}.csv", header + rows) for index in range(2)]
+        transactions = parse_transactions(filepaths, CONFIG)
+        next(transactions)
+        transactions.close()
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread():
+                thread.join(1)
+        self.assertEqual(threading.active_count(), threads)
+
+
+class TestDateParser(unittest.TestCase):
+    def test_fast_formats_match_strptime(self):
+        values = ["01/02/2024", "1/2/2024", "12/31/1999", "2024-03-04", "2024/3/4"]
+        for date_format in FAST_DATE_FORMATS:
+            date_parser = DateParser(date_format)
+            for value in values:
+                with self.subTest(date_format=date_format, value=value):
+                    try:
+                        expected = datetime.strptime(value, date_format)
+                    except ValueError:
+                        with self.assertRaises(ValueError):
+                            date_parser.parse(value)
+                    else:
+                        self.assertEqual(date_parser.parse(value), expected)
+
+    def test_invalid_dates_raise(self):
+        date_parser = DateParser("%m/%d/%Y")
+        for value in ["13/01/2024", "02/30/2024", "01/02/2024 ", "001/02/2024"]:
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    date_parser.parse(value)
+
+    def test_other_formats(self):
+        date_parser = DateParser("%b %d %Y")
+        self.assertEqual(date_parser.parse("Mar 04 2024"), datetime(2024, 3, 4))
+        self.assertIs(
+            date_parser.parse("Mar 04 2024"), date_parser.parse("Mar 04 2024")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+from datetime import timedelta
+
+from engine import AccountingEngine
+from simulation import (
+    ScheduledSell,
+    generate_price_paths,
+    parse_scheduled_sells,
+    simulate_accountant,
+    simulate_accountant_by_year,
+    simulate_tax_methods,
+)
+from taxes import TaxTable, TaxYear, calculate_tax_burden
+from test.test_accountant import random_history
+
+
+def make_simulation(seed, path_count=30):
+    transactions, last_datetime = random_history(seed)
+    engine = AccountingEngine()
+    engine.account_for_transactions(transactions)
+    open_quantity = sum(
+        lot.transaction_size for lot in engine.accountants[0].get_unsold_lots()
+    )
+    # around the one year boundary of the lots bought on the last day, selling
+    # 80% of the open lots
+    scheduled_sells = [
+        ScheduledSell(last_datetime + timedelta(days=days), open_quantity * share)
+        for days, share in [(0, 0.1), (275, 0.25), (276, 0.05), (700, 0.4)]
+    ]
+    horizon = last_datetime + timedelta(days=1000)
+    price_paths = generate_price_paths(
+        15.0,
+        last_datetime,
+        [scheduled_sell.datetime for scheduled_sell in scheduled_sells] + [horizon],
+        path_count,
+        drift=0.05,
+        seed=seed,
+    )
+    return engine, scheduled_sells, horizon, price_paths
+
+
+class TestSimulation(unittest.TestCase):
+    def test_matches_replaying_every_path(self):
+        for seed in range(3):
+            engine, scheduled_sells, horizon, price_paths = make_simulation(seed)
+            results = simulate_tax_methods(
+                engine, scheduled_sells, horizon, price_paths, 0.15, 0.22
+            )
+            for accountant, result in zip(engine.accountants, results):
+                with self.subTest(seed=seed, tax_method=result.tax_method_name):
+                    self.assertEqual(
+                        result.tax_method_name, accountant.get_tax_method_name()
+                    )
+                    for price_path, tax_burden in zip(price_paths, result.tax_burdens):
+                        self.assertAlmostEqual(
+                            tax_burden,
+                            calculate_tax_burden(
+                                *simulate_accountant(
+                                    accountant, scheduled_sells, horizon, price_path
+                                ),
+                                0.15,
+                                0.22,
+                            ),
+                            places=6,
+                        )
+            # the engine itself is left as it was
+            self.assertEqual(
+                engine.get_results(), make_simulation(seed)[0].get_results()
+            )
+
+    def test_tax_table(self):
+        engine, scheduled_sells, horizon, price_paths = make_simulation(0)
+        tax_table = TaxTable(
+            default_tax_year=TaxYear(1000, [(0, 0.1), (500, 0.3)], [(0, 0.15)])
+        )
+        for jobs in [1, 2]:
+            results = simulate_tax_methods(
+                engine,
+                scheduled_sells,
+                horizon,
+                price_paths,
+                None,
+                None,
+                jobs,
+                tax_table,
+            )
+            for accountant, result in zip(engine.accountants, results):
+                with self.subTest(jobs=jobs, tax_method=result.tax_method_name):
+                    for price_path, tax_burden in zip(price_paths, result.tax_burdens):
+                        self.assertAlmostEqual(
+                            tax_burden,
+                            tax_table.calculate_tax_burden(
+                                simulate_accountant_by_year(
+                                    accountant, scheduled_sells, horizon, price_path
+                                )
+                            ),
+                            places=6,
+                        )
+
+    def test_worker_pool(self):
+        engine, scheduled_sells, horizon, price_paths = make_simulation(0)
+        expected_results = simulate_tax_methods(
+            engine, scheduled_sells, horizon, price_paths, 0.15, 0.22
+        )
+        results = simulate_tax_methods(
+            engine, scheduled_sells, horizon, price_paths, 0.15, 0.22, jobs=2
+        )
+        self.assertEqual(results, expected_results)
+        # every path has at least one winner
+        self.assertGreaterEqual(sum(result.win_rate for result in results), 1.0)
+
+    def test_overselling(self):
+        engine, scheduled_sells, horizon, price_paths = make_simulation(0)
+        scheduled_sells.append(ScheduledSell(horizon, 100000))
+        with self.assertRaises(ValueError):
+            simulate_tax_methods(
+                engine, scheduled_sells, horizon, price_paths, 0.15, 0.22
+            )
+
+    def test_price_paths_are_seeded(self):
+        engine, scheduled_sells, horizon, price_paths = make_simulation(0)
+        self.assertEqual(make_simulation(0)[3], price_paths)
+        self.assertNotEqual(make_simulation(1)[3], price_paths)
+        self.assertEqual(len(price_paths[0]), len(scheduled_sells) + 1)
+
+    def test_parse_scheduled_sells(self):
+        scheduled_sells = parse_scheduled_sells("2025/06/01:50,2025/03/01:100")
+        self.assertEqual(
+            [scheduled_sell.quantity for scheduled_sell in scheduled_sells], [100, 50]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
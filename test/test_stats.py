@@ -0,0 +1,143 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from constants import TRANSACTION_BUY, TRANSACTION_PARSER_KEY, TRANSACTION_SELL
+from engine import AccountingEngine
+from parse import TransactionParser, parse_transactions
+from stats import CountingLotBook, Stats
+from tax_methods import TaxMethod, tax_methods, tax_optimizer_comparator
+from test.test_accountant import random_history
+from test.test_parse import CONFIG
+from transaction import Transaction
+
+CSV_DATA = """Date,Action,Symbol,Quantity,Price
+01/02/2024,Buy,TICK,10,$5.00
+01/03/2024,Buy,OTHR,3,$20
+
+01/04/2024,Dividend,TICK,1,$1
+01/05/2024,Buy,TICK,,$1
+01/06/2024,Buy,TICK,1.5,$1
+01/07/2024,Buy,TICK,1,
+01/08/2024,Buy,TICK,1,abc
+01/09/2024,Sell,TICK,4,$7.50
+"""
+
+
+class TestStats(unittest.TestCase):
+    def test_results_unchanged(self):
+        transactions, _ = random_history(1)
+        engine = AccountingEngine()
+        engine.account_for_transactions(transactions)
+        stats = Stats()
+        engine_with_stats = AccountingEngine()
+        engine_with_stats.attach_stats(stats)
+        engine_with_stats.account_for_transactions(transactions)
+        engine_with_stats.detach_stats()
+        self.assertEqual(engine_with_stats.get_results(), engine.get_results())
+        for accountant in engine_with_stats.accountants:
+            self.assertNotIsInstance(accountant.unsold_transactions, CountingLotBook)
+        sells = sum(
+            transaction.transaction_type == TRANSACTION_SELL
+            for transaction in transactions
+        )
+        self.assertEqual(stats.counters["accounting"]["sells"], sells)
+        for tax_method in tax_methods:
+            counters = stats.counters[f"accountant[{tax_method.name}]"]
+            self.assertEqual(counters["sells"], sells)
+            self.assertGreaterEqual(counters["lots_touched"], sells)
+            self.assertIn(f"accounting[{tax_method.name}]", stats.timers)
+
+    def test_sell_counters(self):
+        # a key the lot books do not special case, so lots are sorted per sell
+        sorted_tax_method = TaxMethod(
+            "sorted", lambda *args: 0, False, tax_optimizer_comparator
+        )
+        stats = Stats()
+        engine = AccountingEngine([tax_methods[0], sorted_tax_method])
+        engine.attach_stats(stats)
+        engine.account_for_transactions(
+            [
+                Transaction(10, 5, datetime(2024, 1, 1), TRANSACTION_BUY),
+                Transaction(10, 8, datetime(2024, 1, 2), TRANSACTION_BUY),
+                Transaction(10, 9, datetime(2024, 1, 3), TRANSACTION_BUY),
+                # the first lot and half of the second
+                Transaction(15, 10, datetime(2024, 2, 1), TRANSACTION_SELL),
+                Transaction(5, 10, datetime(2024, 2, 2), TRANSACTION_SELL),
+            ]
+        )
+        engine.detach_stats()
+        self.assertEqual(
+            stats.counters["accountant[fifo]"],
+            {
+                "sells": 2,
+                "lots_touched": 3,
+                "partial_lot_splits": 1,
+                "sorts": 0,
+                "max_lots_touched_per_sell": 2,
+            },
+        )
+        self.assertEqual(stats.counters["accountant[sorted]"]["sorts"], 2)
+
+    def test_tax_optimizer_heap_rebuilds(self):
+        stats = Stats()
+        engine = AccountingEngine([tax_methods[2]])
+        engine.attach_stats(stats)
+        engine.account_for_transactions(
+            [
+                Transaction(1, 5, datetime(2023, 6, 1), TRANSACTION_BUY),
+                Transaction(1, 8, datetime(2024, 1, 2), TRANSACTION_BUY),
+                Transaction(1, 9, datetime(2024, 1, 3), TRANSACTION_BUY),
+                # nothing is long term yet
+                Transaction(1, 10, datetime(2024, 1, 10), TRANSACTION_SELL),
+                # the first lot goes long term
+                Transaction(1, 10, datetime(2024, 6, 15), TRANSACTION_SELL),
+                # an earlier date rebuilds the heaps
+                Transaction(1, 10, datetime(2024, 3, 1), TRANSACTION_SELL),
+            ]
+        )
+        engine.detach_stats()
+        self.assertEqual(stats.counters["accountant[tax-optimizer]"]["sorts"], 2)
+
+    def test_skipped_rows(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(CSV_DATA)
+        self.addCleanup(os.remove, f.name)
+        config = dict(CONFIG)
+        config[TRANSACTION_PARSER_KEY] = TransactionParser(config)
+        stats = config[TRANSACTION_PARSER_KEY].stats = Stats()
+        with self.assertLogs(level="ERROR"):
+            transactions = list(parse_transactions(f.name, config))
+        self.assertEqual(len(transactions), 2)
+        self.assertEqual(
+            stats.counters["skipped_rows"],
+            {
+                "blank": 1,
+                "unrelated_ticker": 1,
+                "unrelated_transaction_type": 1,
+                "missing_quantity": 1,
+                "invalid_quantity": 1,
+                "missing_price": 1,
+                "invalid_price": 1,
+            },
+        )
+        self.assertEqual(stats.counters["parsing"]["rows"], 9)
+        self.assertIn("csv_decode", stats.timers)
+
+    def test_split_time(self):
+        stats = Stats()
+        stats.add_time("parsing", 3.0, 2.0)
+        stats.add_time("csv_decode", 1.0, 0.5)
+        stats.split_time("parsing", "csv_decode", "row_parse")
+        self.assertEqual(
+            stats.to_dict()["timers"],
+            {
+                "csv_decode": {"wall": 1.0, "cpu": 0.5},
+                "row_parse": {"wall": 2.0, "cpu": 1.5},
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
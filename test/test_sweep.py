@@ -0,0 +1,84 @@
+import unittest
+from datetime import datetime, timedelta
+
+from engine import AccountingEngine
+from sweep import parse_sweep_prices, sweep_liquidation
+from taxes import TaxTable, TaxYear, calculate_tax_burden
+from test.test_accountant import random_history
+
+
+class TestSweep(unittest.TestCase):
+    def test_matches_get_results(self):
+        transactions, last_datetime = random_history(7)
+        engine = AccountingEngine()
+        engine.account_for_transactions(transactions)
+        prices = [5.0, 12.5, 30.0]
+        # around the one year boundary of the lots bought on the last day
+        datetimes = [
+            last_datetime + timedelta(days=days) for days in [0, 274, 275, 276, 2000]
+        ]
+        expected_results = engine.get_results()
+        sweep_results = sweep_liquidation(engine, prices, datetimes, 0.15, 0.22)
+        self.assertEqual(engine.get_results(), expected_results)
+        for date_index, current_datetime in enumerate(datetimes):
+            for price_index, price in enumerate(prices):
+                results = engine.get_results(price, current_datetime)
+                for result, sweep_result in zip(results, sweep_results):
+                    with self.subTest(
+                        tax_method=result.tax_method_name,
+                        price=price,
+                        datetime=current_datetime,
+                    ):
+                        short_term_profit = sweep_result.short_term_profit[date_index][
+                            price_index
+                        ]
+                        long_term_profit = sweep_result.long_term_profit[date_index][
+                            price_index
+                        ]
+                        self.assertAlmostEqual(
+                            short_term_profit, result.short_term_profit, places=6
+                        )
+                        self.assertAlmostEqual(
+                            long_term_profit, result.long_term_profit, places=6
+                        )
+                        self.assertEqual(
+                            sweep_result.tax_burden[date_index][price_index],
+                            calculate_tax_burden(
+                                short_term_profit, long_term_profit, 0.15, 0.22
+                            ),
+                        )
+
+    def test_tax_table(self):
+        transactions, last_datetime = random_history(7)
+        engine = AccountingEngine()
+        engine.account_for_transactions(transactions)
+        tax_table = TaxTable(
+            default_tax_year=TaxYear(1000, [(0, 0.1), (500, 0.3)], [(0, 0.15)])
+        )
+        prices = [5.0, 30.0]
+        datetimes = [last_datetime, last_datetime + timedelta(days=800)]
+        sweep_results = sweep_liquidation(
+            engine, prices, datetimes, tax_table=tax_table
+        )
+        for date_index, current_datetime in enumerate(datetimes):
+            for price_index, price in enumerate(prices):
+                results = engine.get_results(price, current_datetime)
+                for result, sweep_result in zip(results, sweep_results):
+                    with self.subTest(
+                        tax_method=result.tax_method_name,
+                        price=price,
+                        datetime=current_datetime,
+                    ):
+                        self.assertAlmostEqual(
+                            sweep_result.tax_burden[date_index][price_index],
+                            tax_table.calculate_tax_burden(result.profits_by_year),
+                            places=6,
+                        )
+
+    def test_parse_sweep_prices(self):
+        self.assertEqual(parse_sweep_prices("5:20:5,32.5"), [5, 10, 15, 20, 32.5])
+        self.assertEqual(len(parse_sweep_prices("0.1:0.3:0.1")), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,6 +6,7 @@ from tax_methods import (
     high_cost_comparator,
     low_cost_comparator,
     tax_optimizer_comparator,
+    tax_methods,
 )
 from transaction import Transaction
 from functools import cmp_to_key
@@ -264,5 +265,43 @@ class TestTaxOptimizer(unittest.TestCase):
             self.assertEqual(sorted_transactions, expected_transactions)
 
 
+class TestSortKeys(unittest.TestCase):
+    def test_keys_match_comparators(self):
+        sell_datetimes = [
+            datetime(2024, 12, 31),
+            datetime(2025, 3, 10),
+            datetime(2021, 5, 1),
+        ]
+        for tax_method in tax_methods:
+            for transactions in [transactions1, transactions2]:
+                for sell_price in [1, 5, 10, 20]:
+                    for sell_datetime in sell_datetimes:
+                        with self.subTest(
+                            tax_method=tax_method.name,
+                            sell_price=sell_price,
+                            sell_datetime=sell_datetime,
+                        ):
+                            tax_method_cmp = lambda x, y: tax_method.comparator(
+                                x, y, sell_price, sell_datetime
+                            )
+                            tax_method_key = lambda x: tax_method.sort_key(
+                                x, sell_price, sell_datetime
+                            )
+                            self.assertEqual(
+                                sorted(transactions, key=tax_method_key),
+                                sorted(transactions, key=cmp_to_key(tax_method_cmp)),
+                            )
+
+    def test_price_independent_keys(self):
+        for tax_method in tax_methods:
+            if not tax_method.price_independent:
+                continue
+            for transaction in transactions1:
+                self.assertEqual(
+                    tax_method.sort_key(transaction, None, None),
+                    tax_method.sort_key(transaction, 10, datetime(2025, 1, 1)),
+                )
+
+
 if __name__ == "__main__":
     unittest.main()
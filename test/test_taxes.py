@@ -0,0 +1,126 @@
+import unittest
+from datetime import datetime
+
+from engine import AccountingEngine
+from taxes import (
+    TaxTable,
+    TaxYear,
+    bracket_tax,
+    calculate_tax_burden,
+    get_flat_tax_year,
+    parse_tax_years,
+)
+from test.test_accountant import random_history
+
+BRACKETS = [(0, 0.1), (1000, 0.2), (5000, 0.3)]
+
+
+class TestBracketTax(unittest.TestCase):
+    def test_bracket_tax(self):
+        self.assertAlmostEqual(bracket_tax(BRACKETS, 0, 500), 50)
+        self.assertAlmostEqual(bracket_tax(BRACKETS, 500, 2000), 50 + 200)
+        self.assertAlmostEqual(bracket_tax(BRACKETS, 4000, 7000), 200 + 600)
+        self.assertAlmostEqual(bracket_tax(BRACKETS, -100, 100), 10)
+        self.assertEqual(bracket_tax(BRACKETS, 100, 100), 0)
+
+
+class TestTaxTable(unittest.TestCase):
+    def setUp(self):
+        self.tax_table = TaxTable(
+            {2020: TaxYear(1000, BRACKETS, [(0, 0.0), (3000, 0.15)])},
+            capital_loss_limit=500,
+        )
+
+    def test_gains_stack_on_income(self):
+        (year_tax,) = self.tax_table.calculate_yearly_taxes({2020: (1000, 2000)})
+        # short term from 1000 to 2000, long term from 2000 to 4000
+        self.assertAlmostEqual(year_tax.tax_burden, 200 + 1000 * 0.15)
+
+    def test_netting(self):
+        (year_tax,) = self.tax_table.calculate_yearly_taxes({2020: (-300, 1000)})
+        self.assertEqual(year_tax.taxable_short_term_profit, 0)
+        self.assertEqual(year_tax.taxable_long_term_profit, 700)
+
+    def test_carryforward(self):
+        yearly_taxes = self.tax_table.calculate_yearly_taxes(
+            {2020: (-1000, -200), 2022: (800, 0)}
+        )
+        self.assertEqual(
+            [year_tax.year for year_tax in yearly_taxes], [2020, 2021, 2022]
+        )
+        first_year, second_year, third_year = yearly_taxes
+        # the deduction takes short term losses first
+        self.assertEqual(first_year.loss_deduction, 500)
+        self.assertEqual(first_year.short_term_carryforward, 500)
+        self.assertEqual(first_year.long_term_carryforward, 200)
+        self.assertAlmostEqual(first_year.tax_burden, -50)
+        # 500 more deducted without any gains, 2021 uses the 2020 rates
+        self.assertEqual(second_year.short_term_carryforward, 0)
+        self.assertEqual(second_year.long_term_carryforward, 200)
+        self.assertEqual(third_year.taxable_short_term_profit, 600)
+        self.assertEqual(third_year.short_term_carryforward, 0)
+        self.assertEqual(third_year.long_term_carryforward, 0)
+
+    def test_flat_rates_without_losses(self):
+        tax_table = TaxTable(default_tax_year=get_flat_tax_year(0.15, 0.3))
+        self.assertAlmostEqual(
+            tax_table.calculate_tax_burden({2020: (100, 200), 2021: (50, 0)}),
+            calculate_tax_burden(150, 200, 0.15, 0.3),
+        )
+        self.assertIsNone(TaxTable().calculate_tax_burden({2020: (100, 200)}))
+
+    def test_parse_tax_years(self):
+        tax_years = parse_tax_years(
+            {"2024": {"ordinary_income": 50000, "income_brackets": [[11600, 12]]}},
+            capital_gains_tax_rate=0.15,
+        )
+        self.assertEqual(
+            tax_years[2024],
+            TaxYear(50000.0, [(0, 0), (11600.0, 0.12)], [(0, 0.15)]),
+        )
+        with self.assertRaises(ValueError):
+            parse_tax_years({"2024": {}})
+
+
+class TestProfitsByYear(unittest.TestCase):
+    def test_years_add_up_to_the_totals(self):
+        for seed in range(5):
+            transactions, last_datetime = random_history(seed)
+            for wash_sales in [False, True]:
+                engine = AccountingEngine()
+                if wash_sales:
+                    engine.attach_wash_sales()
+                engine.account_for_transactions(transactions)
+                for result in engine.get_results(15.0, last_datetime):
+                    with self.subTest(
+                        seed=seed,
+                        wash_sales=wash_sales,
+                        tax_method=result.tax_method_name,
+                    ):
+                        profits = list(zip(*result.profits_by_year.values()))
+                        self.assertAlmostEqual(
+                            sum(profits[0]), result.short_term_profit, places=6
+                        )
+                        self.assertAlmostEqual(
+                            sum(profits[1]), result.long_term_profit, places=6
+                        )
+
+    def test_liquidation_year(self):
+        transactions, last_datetime = random_history(0)
+        engine = AccountingEngine()
+        engine.account_for_transactions(transactions)
+        accountant = engine.accountants[0]
+        realized_profits = dict(accountant.profits_by_year)
+        liquidation_datetime = datetime(last_datetime.year + 2, 1, 1)
+        _, _, profits_by_year = accountant.get_liquidation_profits_by_year(
+            15.0, liquidation_datetime
+        )
+        self.assertEqual(
+            set(profits_by_year), set(realized_profits) | {liquidation_datetime.year}
+        )
+        # nothing was changed
+        self.assertEqual(accountant.profits_by_year, realized_profits)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from parse import parse_config, parse_transactions, parse_transactions_by_ticker
+from transaction_cache import load_transactions, load_transactions_by_ticker
+from test.test_parse import CONFIG, CSV_DATA
+
+
+class TestTransactionCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, "cache")
+        self.transactions_filepath = os.path.join(self.directory, "data.csv")
+        with open(self.transactions_filepath, "w") as f:
+            f.write(CSV_DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load(self, rebuild=False):
+        with self.assertLogs(level="INFO") as logs:
+            transactions = load_transactions(
+                self.transactions_filepath, CONFIG, self.cache_dir, rebuild
+            )
+        from_cache = "Loaded transactions from cache" in "\n".join(logs.output)
+        return transactions, from_cache
+
+    def test_cache_round_trip(self):
+        expected = list(parse_transactions(self.transactions_filepath, CONFIG))
+        transactions, from_cache = self.load()
+        self.assertEqual(transactions, expected)
+        self.assertFalse(from_cache)
+        transactions, from_cache = self.load()
+        self.assertEqual(transactions, expected)
+        self.assertTrue(from_cache)
+        _, from_cache = self.load(rebuild=True)
+        self.assertFalse(from_cache)
+
+    def test_stale_cache(self):
+        self.load()
+        with open(self.transactions_filepath, "a") as f:
+            f.write("03/01/2024,Sell,TICK,2,$9\n")
+        transactions, from_cache = self.load()
+        self.assertFalse(from_cache)
+        self.assertEqual(
+            transactions, list(parse_transactions(self.transactions_filepath, CONFIG))
+        )
+
+    def test_config_change_invalidates_cache(self):
+        self.load()
+        config = dict(CONFIG, transaction_sell_values=[])
+        with self.assertLogs(level="INFO") as logs:
+            transactions = load_transactions(
+                self.transactions_filepath, config, self.cache_dir
+            )
+        self.assertIn("Transaction cache is stale", "\n".join(logs.output))
+        self.assertEqual(len(transactions), 1)
+
+    def test_corporate_actions_change_invalidates_cache(self):
+        actions_filepath = os.path.join(self.directory, "actions.csv")
+        with open(actions_filepath, "w") as f:
+            f.write("date,ticker,action,value\n")
+        config_filepath = os.path.join(self.directory, "config.json")
+        with open(config_filepath, "w") as f:
+            json.dump(dict(CONFIG, corporate_actions_file="actions.csv"), f)
+        config = parse_config(config_filepath)
+        with self.assertLogs(level="INFO"):
+            transactions = load_transactions(
+                self.transactions_filepath, config, self.cache_dir
+            )
+        self.assertEqual(len(transactions), 2)
+        # OTHR rows are TICK's now
+        with open(actions_filepath, "a") as f:
+            f.write("2024/01/01,OTHR,ticker_change,TICK\n")
+        config = parse_config(config_filepath)
+        with self.assertLogs(level="INFO") as logs:
+            transactions = load_transactions(
+                self.transactions_filepath, config, self.cache_dir
+            )
+        self.assertIn("Transaction cache is stale", "\n".join(logs.output))
+        self.assertEqual(len(transactions), 4)
+
+    def test_cache_by_ticker(self):
+        expected = parse_transactions_by_ticker(self.transactions_filepath, CONFIG)
+        for _ in range(2):
+            self.assertEqual(
+                load_transactions_by_ticker(
+                    self.transactions_filepath, CONFIG, self.cache_dir
+                ),
+                expected,
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
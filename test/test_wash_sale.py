@@ -0,0 +1,153 @@
+import unittest
+from datetime import datetime, timedelta
+
+from accountant import Accountant
+from constants import TRANSACTION_BUY, TRANSACTION_SELL
+from engine import AccountingEngine
+from tax_methods import tax_methods
+from test.test_accountant import random_history
+from transaction import Transaction
+from wash_sale import WashSales
+
+FIFO = tax_methods[0]
+START_DATETIME = datetime(2020, 1, 1)
+
+
+def get_datetime(day):
+    return START_DATETIME + timedelta(days=day)
+
+
+def buy(quantity, price, day):
+    return Transaction(quantity, price, get_datetime(day), TRANSACTION_BUY)
+
+
+def sell(quantity, price, day):
+    return Transaction(quantity, price, get_datetime(day), TRANSACTION_SELL)
+
+
+class TestWashSales(unittest.TestCase):
+    def run_accountant(self, transactions, tax_method=FIFO):
+        accountant = Accountant(tax_method)
+        accountant.wash_sales = WashSales()
+        for transaction in transactions:
+            accountant.account_for_transaction(transaction)
+        return accountant
+
+    def get_unsold_lots(self, accountant):
+        return sorted(
+            (lot.transaction_size, lot.cost_basis, lot.datetime)
+            for lot in accountant.get_unsold_lots()
+            if lot.transaction_size
+        )
+
+    def test_buy_after_the_loss(self):
+        accountant = self.run_accountant(
+            [buy(10, 20.0, 0), sell(10, 15.0, 100), buy(4, 16.0, 120)]
+        )
+        # 4 of the 10 shares were bought back
+        self.assertEqual(accountant.get_short_term_profit(), -30.0)
+        self.assertEqual(accountant.wash_sales.wash_sale_count, 1)
+        self.assertEqual(accountant.wash_sales.disallowed_loss, 20.0)
+        self.assertEqual(
+            self.get_unsold_lots(accountant),
+            [(4, 21.0, get_datetime(20))],
+        )
+
+    def test_buy_before_the_loss(self):
+        accountant = self.run_accountant(
+            [buy(10, 20.0, 0), buy(4, 16.0, 80), sell(10, 15.0, 100)]
+        )
+        self.assertEqual(accountant.get_short_term_profit(), -30.0)
+        self.assertEqual(
+            self.get_unsold_lots(accountant),
+            [(4, 21.0, get_datetime(-20))],
+        )
+
+    def test_outside_the_window(self):
+        accountant = self.run_accountant(
+            [
+                buy(10, 20.0, 0),
+                buy(4, 16.0, 69),
+                sell(10, 15.0, 100),
+                buy(4, 16.0, 131),
+            ]
+        )
+        self.assertEqual(accountant.get_short_term_profit(), -50.0)
+        self.assertEqual(accountant.wash_sales.wash_sale_count, 0)
+
+    def test_gains_are_not_washed(self):
+        accountant = self.run_accountant(
+            [buy(10, 10.0, 0), sell(10, 15.0, 100), buy(10, 16.0, 110)]
+        )
+        self.assertEqual(accountant.get_short_term_profit(), 50.0)
+        self.assertEqual(accountant.wash_sales.wash_sale_count, 0)
+
+    def test_shares_replace_one_loss_only(self):
+        accountant = self.run_accountant(
+            [
+                buy(20, 20.0, 0),
+                sell(5, 15.0, 100),
+                sell(5, 14.0, 101),
+                buy(5, 16.0, 110),
+            ]
+        )
+        # the first loss took the 5 shares bought back
+        self.assertEqual(accountant.get_short_term_profit(), -30.0)
+        self.assertEqual(
+            self.get_unsold_lots(accountant),
+            [(5, 21.0, get_datetime(10)), (10, 20.0, get_datetime(0))],
+        )
+
+    def test_long_term_loss(self):
+        accountant = self.run_accountant(
+            [buy(10, 20.0, 0), sell(10, 15.0, 400), buy(10, 16.0, 410)]
+        )
+        self.assertEqual(accountant.get_long_term_profit(), 0.0)
+        # the replacement shares are long term right away
+        accountant.sell_all_transactions(30.0, get_datetime(420))
+        self.assertEqual(accountant.get_long_term_profit(), 90.0)
+        self.assertEqual(accountant.get_short_term_profit(), 0.0)
+
+    def test_total_profit_is_unchanged(self):
+        for seed in range(10):
+            transactions, last_datetime = random_history(seed)
+            engine = AccountingEngine()
+            engine.account_for_transactions(transactions)
+            wash_sale_engine = AccountingEngine()
+            wash_sale_engine.attach_wash_sales()
+            wash_sale_engine.account_for_transactions(transactions)
+            for result, wash_sale_result in zip(
+                engine.get_results(15.0, last_datetime),
+                wash_sale_engine.get_results(15.0, last_datetime),
+            ):
+                with self.subTest(seed=seed, tax_method=result.tax_method_name):
+                    # losses are only deferred into the lots still held
+                    self.assertAlmostEqual(
+                        result.short_term_profit + result.long_term_profit,
+                        wash_sale_result.short_term_profit
+                        + wash_sale_result.long_term_profit,
+                        places=6,
+                    )
+
+    def test_fork(self):
+        accountant = self.run_accountant([buy(10, 20.0, 0), sell(10, 15.0, 100)])
+        fork = accountant.fork()
+        fork.account_for_transaction(buy(10, 16.0, 110))
+        self.assertEqual(fork.wash_sales.wash_sale_count, 1)
+        self.assertEqual(accountant.wash_sales.wash_sale_count, 0)
+        accountant.account_for_transaction(buy(10, 16.0, 140))
+        self.assertEqual(accountant.wash_sales.wash_sale_count, 0)
+
+    def test_fork_does_not_grow_the_lot_store(self):
+        accountant = self.run_accountant([buy(10, 20.0, 0), buy(4, 16.0, 80)])
+        lot_count = len(accountant.lot_store)
+        for _ in range(3):
+            fork = accountant.fork()
+            fork.sell(sell(10, 15.0, 100))
+            self.assertEqual(fork.get_short_term_profit(), -30.0)
+            self.assertEqual(self.get_unsold_lots(fork), [(4, 21.0, get_datetime(-20))])
+        self.assertEqual(len(accountant.lot_store), lot_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
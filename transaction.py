@@ -1,7 +1,12 @@
-from constants import TRANSACTION_SELL
+import struct
+from datetime import datetime, timedelta
+
+from constants import TRANSACTION_BUY, TRANSACTION_SELL, TRANSACTION_SPLIT
 
 
 class Transaction:
+    __slots__ = ("transaction_size", "cost_basis", "datetime", "transaction_type")
+
     def __init__(
         self, transaction_size, cost_basis, datetime, transaction_type=TRANSACTION_SELL
     ):
@@ -20,3 +25,43 @@ class Transaction:
             and self.datetime == transaction2.datetime
             and self.transaction_type == transaction2.transaction_type
         )
+
+
+# Fixed width binary form of a transaction stream, used to hand parsed
+# transactions to other processes: microseconds since datetime.min, quantity,
+# cost basis and a transaction type code.
+TRANSACTION_RECORD = struct.Struct("<qddB")
+DATETIME_ORIGIN = datetime.min
+ONE_MICROSECOND = timedelta(microseconds=1)
+TRANSACTION_TYPE_CODES = {TRANSACTION_BUY: 0, TRANSACTION_SELL: 1, TRANSACTION_SPLIT: 2}
+TRANSACTION_TYPES = {code: name for name, code in TRANSACTION_TYPE_CODES.items()}
+
+
+def pack_transactions(transactions):
+    pack = TRANSACTION_RECORD.pack
+    return b"".join(
+        pack(
+            (transaction.datetime - DATETIME_ORIGIN) // ONE_MICROSECOND,
+            transaction.transaction_size,
+            transaction.cost_basis,
+            TRANSACTION_TYPE_CODES[transaction.transaction_type],
+        )
+        for transaction in transactions
+    )
+
+
+def unpack_transactions(buffer):
+    # histories repeat the same few dates, share one datetime object per date
+    datetimes = {}
+    records = TRANSACTION_RECORD.iter_unpack(buffer)
+    for microseconds, quantity, cost_basis, type_code in records:
+        transaction_datetime = datetimes.get(microseconds)
+        if transaction_datetime is None:
+            transaction_datetime = DATETIME_ORIGIN + microseconds * ONE_MICROSECOND
+            datetimes[microseconds] = transaction_datetime
+        if quantity.is_integer():
+            # the parser reads whole share quantities as ints
+            quantity = int(quantity)
+        yield Transaction(
+            quantity, cost_basis, transaction_datetime, TRANSACTION_TYPES[type_code]
+        )
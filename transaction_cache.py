@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+
+from constants import *
+from parse import (
+    get_parsing_config,
+    parse_transactions,
+    parse_transactions_by_ticker,
+)
+from transaction import TRANSACTION_RECORD, pack_transactions, unpack_transactions
+
+logger = logging.getLogger()
+
+# File layout: magic, header length, JSON header, padding to 8 bytes, then
+# fixed width TRANSACTION_RECORD records for every ticker one
+# after the other. The header holds the cache key and each ticker's
+# (first record, record count).
+CACHE_MAGIC = b"TAXERTX1"
+CACHE_HEADER_LENGTH = struct.Struct("<I")
+CACHE_FILE_EXTENSION = ".transactions"
+
+
+# Same result as parse_transactions, read from a cache in cache_dir when the
+# CSV and the parsing config are unchanged since it was written.
+def load_transactions(transactions_filepath, config, cache_dir, rebuild=False):
+    ticker = config[TICKER_TO_TRACK_KEY]
+    transactions_by_ticker = load_cached_transactions(
+        transactions_filepath,
+        config,
+        cache_dir,
+        rebuild,
+        [ticker],
+        lambda: {ticker: parse_transactions(transactions_filepath, config)},
+    )
+    return transactions_by_ticker[ticker]
+
+
+# Same result as parse_transactions_by_ticker, see load_transactions.
+def load_transactions_by_ticker(
+    transactions_filepath, config, cache_dir, tickers=None, rebuild=False
+):
+    return load_cached_transactions(
+        transactions_filepath,
+        config,
+        cache_dir,
+        rebuild,
+        tickers,
+        lambda: parse_transactions_by_ticker(transactions_filepath, config, tickers),
+    )
+
+
+def load_cached_transactions(
+    transactions_filepath, config, cache_dir, rebuild, tickers, parse
+):
+    cache_key = get_cache_key(transactions_filepath, config, tickers)
+    cache_filepath = get_cache_filepath(cache_dir, cache_key)
+    if not rebuild:
+        transactions_by_ticker = read_cache(cache_filepath, cache_key)
+        if transactions_by_ticker is not None:
+            logger.info(f"Loaded transactions from cache {cache_filepath}")
+            return transactions_by_ticker
+
+    transactions_by_ticker = {
+        ticker: list(transactions) for ticker, transactions in parse().items()
+    }
+    write_cache(cache_filepath, cache_key, transactions_by_ticker)
+    return transactions_by_ticker
+
+
+# The renames of the corporate actions file decide which rows are parsed, so it
+# is keyed like the CSV
+def get_cache_key(transactions_filepath, config, tickers):
+    cache_key = get_file_key(transactions_filepath)
+    cache_key["tickers"] = tickers
+    cache_key["config"] = get_parsing_config(config)
+    corporate_actions = config.get(CORPORATE_ACTIONS_KEY)
+    if corporate_actions is not None and corporate_actions.filepath is not None:
+        cache_key["corporate_actions"] = get_file_key(corporate_actions.filepath)
+    return cache_key
+
+
+def get_file_key(filepath):
+    filepath = os.path.abspath(filepath)
+    stat = os.stat(filepath)
+    return {"path": filepath, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+# one cache file per CSV and ticker selection, a changed CSV or config
+# overwrites it
+def get_cache_filepath(cache_dir, cache_key):
+    name = json.dumps([cache_key["path"], cache_key["tickers"]])
+    digest = hashlib.sha256(name.encode()).hexdigest()[:32]
+    return os.path.join(cache_dir, digest + CACHE_FILE_EXTENSION)
+
+
+def read_cache(cache_filepath, cache_key):
+    try:
+        with open(cache_filepath, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return read_cache_buffer(buffer, cache_key)
+    except (OSError, ValueError, struct.error) as e:
+        if not isinstance(e, FileNotFoundError):
+            logger.warning(f"Ignoring unreadable cache {cache_filepath}: {e}")
+        return None
+
+
+def read_cache_buffer(buffer, cache_key):
+    if buffer[: len(CACHE_MAGIC)] != CACHE_MAGIC:
+        return None
+    (header_length,) = CACHE_HEADER_LENGTH.unpack_from(buffer, len(CACHE_MAGIC))
+    header_start = len(CACHE_MAGIC) + CACHE_HEADER_LENGTH.size
+    header = json.loads(bytes(buffer[header_start : header_start + header_length]))
+    if header["key"] != cache_key:
+        logger.info("Transaction cache is stale, parsing the CSV again")
+        return None
+
+    records_start = get_records_start(header_start + header_length)
+    record_size = TRANSACTION_RECORD.size
+    transactions_by_ticker = {}
+    with memoryview(buffer) as records:
+        for ticker, first_record, record_count in header["tickers"]:
+            start = records_start + first_record * record_size
+            end = start + record_count * record_size
+            with records[start:end] as ticker_records:
+                transactions = list(unpack_transactions(ticker_records))
+            transactions_by_ticker[ticker] = transactions
+    return transactions_by_ticker
+
+
+def write_cache(cache_filepath, cache_key, transactions_by_ticker):
+    tickers = []
+    first_record = 0
+    for ticker, transactions in transactions_by_ticker.items():
+        tickers.append([ticker, first_record, len(transactions)])
+        first_record += len(transactions)
+    header = json.dumps({"key": cache_key, "tickers": tickers}).encode()
+    header_end = len(CACHE_MAGIC) + CACHE_HEADER_LENGTH.size + len(header)
+
+    os.makedirs(os.path.dirname(cache_filepath) or ".", exist_ok=True)
+    temporary_filepath = f"{cache_filepath}.{os.getpid()}.tmp"
+    with open(temporary_filepath, "wb") as f:
+        f.write(CACHE_MAGIC)
+        f.write(CACHE_HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(b"\0" * (get_records_start(header_end) - header_end))
+        for transactions in transactions_by_ticker.values():
+            f.write(pack_transactions(transactions))
+    os.replace(temporary_filepath, cache_filepath)
+
+
+def get_records_start(header_end):
+    return -(-header_end // 8) * 8
@@ -0,0 +1,238 @@
+from collections import deque
+from datetime import timedelta
+
+from constants import TRANSACTION_BUY
+from transaction import Transaction
+
+# a buy this close to a loss sale, before or after it, is a replacement
+WASH_SALE_WINDOW = timedelta(days=30)
+
+
+# The wash sale rule for one Accountant: the loss of a sale is disallowed for
+# the shares bought within WASH_SALE_WINDOW of it, and added to the cost basis
+# of those replacement shares instead, whose holding period starts that much
+# earlier (the time the sold shares were held).
+#
+# Both sides of the window are kept in time order, pruned as the transactions
+# go by: the buys of the last 30 days a loss sale can still wash into, and the
+# losses of the last 30 days a buy can still take. Each check is a walk from the
+# front of one of them and every pairing uses up a buy or a loss, so a history
+# costs about one pass.
+#
+# Replacement shares are split off their lot into a new lot of the shared
+# LotStore with the adjusted cost basis and date, the lot they came from keeps
+# the rest.
+#
+# With a ledger, the accountant's rows go through here to get the loss each one
+# had disallowed. A loss can be washed until 30 days after its sale, so its row
+# is held until then and the rows behind it wait too, which keeps the ledger in
+# sell order and holds at most 30 days of rows.
+class WashSales:
+    def __init__(self):
+        # [datetime, lot id, shares that can still be a replacement]
+        self.recent_buys = deque()
+        # [datetime, shares not washed yet, loss per share, holding period,
+        # long term, ledger row]
+        self.recent_losses = deque()
+        # (lot id, shares, loss per share, acquisition datetime, long term,
+        # ledger row) of the sell being processed
+        self.disposals = []
+        # [LedgerWriter.write arguments..., disallowed loss, still open] in
+        # sell order, see write_ledger_rows
+        self.ledger_rows = deque()
+        self.wash_sale_count = 0
+        self.disallowed_loss = 0
+
+    # `ledger_row` is the arguments of LedgerWriter.write for the disposal, or
+    # None without a ledger
+    def add_disposal(
+        self,
+        lot_id,
+        volume,
+        gain_per_share,
+        acquisition_datetime,
+        long_term,
+        ledger_row=None,
+    ):
+        if ledger_row is not None:
+            ledger_row += [0, gain_per_share < 0]
+            self.ledger_rows.append(ledger_row)
+        self.disposals.append(
+            (
+                lot_id,
+                volume,
+                -gain_per_share,
+                acquisition_datetime,
+                long_term,
+                ledger_row,
+            )
+        )
+
+    # Washes the losses of the sell that just ended into the recent buys, the
+    # rest wait for the buys of the next 30 days
+    def finish_sell(self, accountant, sell_datetime):
+        disposals = self.disposals
+        self.disposals = []
+        recent_buys = self.recent_buys
+        while recent_buys and sell_datetime - recent_buys[0][0] > WASH_SALE_WINDOW:
+            recent_buys.popleft()
+        self.prune_losses(sell_datetime)
+        # shares of a lot that was just sold from are not replacements for it
+        sold_lot_ids = {disposal[0] for disposal in disposals}
+        remaining_quantity = accountant.remaining_quantity
+        for (
+            _,
+            volume,
+            loss_per_share,
+            acquisition_datetime,
+            long_term,
+            ledger_row,
+        ) in disposals:
+            if loss_per_share <= 0:
+                continue
+            holding_period = sell_datetime - acquisition_datetime
+            for buy in recent_buys:
+                if not volume:
+                    break
+                lot_id = buy[1]
+                if lot_id in sold_lot_ids:
+                    continue
+                lot_size = remaining_quantity[lot_id]
+                shares = min(volume, buy[2], lot_size)
+                if shares <= 0:
+                    continue
+                buy[2] -= shares
+                volume -= shares
+                remaining_quantity[lot_id] = lot_size - shares
+                self.wash(
+                    accountant,
+                    lot_id,
+                    shares,
+                    loss_per_share,
+                    holding_period,
+                    long_term,
+                    sell_datetime.year,
+                    ledger_row,
+                )
+            if volume:
+                self.recent_losses.append(
+                    [
+                        sell_datetime,
+                        volume,
+                        loss_per_share,
+                        holding_period,
+                        long_term,
+                        ledger_row,
+                    ]
+                )
+            elif ledger_row is not None:
+                ledger_row[-1] = False
+        while recent_buys and recent_buys[0][2] <= 0:
+            recent_buys.popleft()
+        self.write_ledger_rows(accountant.ledger)
+
+    # Puts the lot of a buy in the accountant's book, after washing the recent
+    # losses into it
+    def add_buy(self, accountant, lot_id):
+        lot_store = accountant.lot_store
+        buy_datetime = lot_store.datetime[lot_id]
+        quantity = lot_store.quantity[lot_id]
+        self.prune_losses(buy_datetime)
+        recent_losses = self.recent_losses
+        while recent_losses and quantity > 0:
+            loss = recent_losses[0]
+            (
+                sell_datetime,
+                volume,
+                loss_per_share,
+                holding_period,
+                long_term,
+                ledger_row,
+            ) = loss
+            shares = min(volume, quantity)
+            quantity -= shares
+            loss[1] = volume - shares
+            if not loss[1]:
+                recent_losses.popleft()
+            self.wash(
+                accountant,
+                lot_id,
+                shares,
+                loss_per_share,
+                holding_period,
+                long_term,
+                sell_datetime.year,
+                ledger_row,
+            )
+            if not loss[1] and ledger_row is not None:
+                ledger_row[-1] = False
+        self.write_ledger_rows(accountant.ledger)
+        if quantity > 0:
+            accountant.insert_lot(lot_id, quantity)
+            self.recent_buys.append([buy_datetime, lot_id, quantity])
+
+    # `shares` of lot_id replace shares sold at a loss: the loss goes back into
+    # the profits (of the year of the sale) and into the basis of a new lot of
+    # those shares
+    def wash(
+        self,
+        accountant,
+        lot_id,
+        shares,
+        loss_per_share,
+        holding_period,
+        long_term,
+        sell_year,
+        ledger_row,
+    ):
+        disallowed_loss = loss_per_share * shares
+        if ledger_row is not None:
+            ledger_row[-2] += disallowed_loss
+        if long_term:
+            accountant.long_term_profit_accumulator += disallowed_loss
+            accountant.add_year_profits(sell_year, 0, disallowed_loss)
+        else:
+            accountant.short_term_profit_accumulator += disallowed_loss
+            accountant.add_year_profits(sell_year, disallowed_loss, 0)
+        lot_store = accountant.lot_store
+        replacement_lot_id = lot_store.add(
+            Transaction(
+                shares,
+                lot_store.cost_basis[lot_id] + loss_per_share,
+                lot_store.datetime[lot_id] - holding_period,
+                TRANSACTION_BUY,
+            )
+        )
+        accountant.insert_lot(replacement_lot_id, shares)
+        self.wash_sale_count += 1
+        self.disallowed_loss += disallowed_loss
+
+    # Drops the losses no buy from `current_datetime` on can wash anymore, their
+    # ledger rows are final
+    def prune_losses(self, current_datetime):
+        recent_losses = self.recent_losses
+        while (
+            recent_losses and current_datetime - recent_losses[0][0] > WASH_SALE_WINDOW
+        ):
+            ledger_row = recent_losses.popleft()[5]
+            if ledger_row is not None:
+                ledger_row[-1] = False
+
+    # Writes the ledger rows up to the first one whose loss can still be washed,
+    # or all of them with `everything` (when the ledger is detached)
+    def write_ledger_rows(self, ledger, everything=False):
+        ledger_rows = self.ledger_rows
+        while ledger_rows and (everything or not ledger_rows[0][-1]):
+            ledger_row = ledger_rows.popleft()
+            ledger.write(*ledger_row[:-1])
+
+    # the fork has no ledger, see Accountant.fork
+    def copy(self):
+        wash_sales = WashSales()
+        wash_sales.recent_buys = deque(list(buy) for buy in self.recent_buys)
+        wash_sales.recent_losses = deque(
+            loss[:5] + [None] for loss in self.recent_losses
+        )
+        wash_sales.wash_sale_count = self.wash_sale_count
+        wash_sales.disallowed_loss = self.disallowed_loss
+        return wash_sales